@@ -1,46 +1,75 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, g, render_template, request
 from flask import jsonify
 import requests
-from dotenv import load_dotenv
 import os
-import re
 # from my_env.geo_chem import generate_geochemistry_response
-from geo_chem import generate_geochemistry_response
-import numpy as np
+from geo_chem import generate_geochemistry_response, iter_geochemistry_responses, kriging_cache_stats, intent_cache_stats, router, correct_typos, parse_query, engine_cache_stats
+import geo_chem
+import rag_client
+from caches import TTLCache
+from json_encoder import NumpyJSONProvider
+from map_jobs import map_jobs, job_kind_for_query, QueueFullError
+import logging
+import time
+import metrics
+import profiling
+import threading
 
 
 app = Flask(__name__)
+# numpy arrays/scalars and NaN are encoded by the JSON provider, no separate conversion pass
+app.json = NumpyJSONProvider(app)
+# STARTUP_WARM_UP decides when the dataset and the spaCy tokenizer are loaded: "background" on a
+# thread once the worker is up, "eager" before it serves anything, "lazy" by the first request needing them
+STARTUP_WARM_UP = os.getenv('STARTUP_WARM_UP', 'background')
+if STARTUP_WARM_UP == 'eager':
+    geo_chem.warm_up()
+elif STARTUP_WARM_UP == 'background':
+    threading.Thread(target=geo_chem.warm_up, name='warm-up', daemon=True).start()
 
 
-# def deep_convert_np_to_lists(obj):
-#     if isinstance(obj, np.ndarray):
-#         return obj.tolist()
-#     elif isinstance(obj, dict):
-#         return {k: deep_convert_np_to_lists(v) for k, v in obj.items()}
-#     elif isinstance(obj, list):
-#         return [deep_convert_np_to_lists(item) for item in obj]
-#     elif isinstance(obj, tuple):
-#         return tuple(deep_convert_np_to_lists(item) for item in obj)
-#     return obj
-
-def deep_convert_np_to_lists(obj):
-    if isinstance(obj, np.ndarray):
-        # Convert NaNs to None in a NumPy array
-        obj = np.where(np.isnan(obj), None, obj)
-        return obj.tolist()
-    elif isinstance(obj, dict):
-        # Recursively apply to dictionary values
-        return {k: deep_convert_np_to_lists(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        # Recursively apply to list items
-        return [deep_convert_np_to_lists(item) for item in obj]
-    elif isinstance(obj, tuple):
-        # Recursively apply to tuple items
-        return tuple(deep_convert_np_to_lists(item) for item in obj)
-    elif obj != obj:
-        # Replace standalone NaNs with None
-        return None
-    return obj
+request_seconds = metrics.registry.histogram('ngdr_http_request_duration_seconds', "Flask request latency, streamed bodies included.", ['route', 'method', 'status'])
+requests_in_flight = metrics.registry.gauge('ngdr_http_requests_in_flight', "Requests being handled or streamed.", ['route'])
+
+
+@app.before_request
+def start_request_timer():
+    g.metrics_route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_start = time.perf_counter()
+    requests_in_flight.inc(route=g.metrics_route)
+
+
+@app.after_request
+def observe_request(response):
+    # observed when the body is closed, so streamed responses count their whole duration
+    route, start, method, status = g.metrics_route, g.metrics_start, request.method, str(response.status_code)
+
+    def finish():
+        request_seconds.observe(time.perf_counter() - start, route=route, method=method, status=status)
+        requests_in_flight.dec(route=route)
+
+    response.call_on_close(finish)
+    return response
+
+
+# Post-processed RAG answers keyed by (topic, normalised query), the suggested questions repeat a lot
+RAG_CACHE_TTL_SECONDS = float(os.getenv('RAG_CACHE_TTL_SECONDS', '3600'))
+RAG_CACHE_MB = float(os.getenv('RAG_CACHE_MB', '16'))
+rag_answer_cache = TTLCache(max_bytes=int(RAG_CACHE_MB * 1024 * 1024), ttl_seconds=RAG_CACHE_TTL_SECONDS)
+
+
+metrics.cache_metrics({
+    'kriging': kriging_cache_stats,
+    'intents': intent_cache_stats,
+    'rag': lambda: rag_answer_cache.stats(),
+    'kriging_geometry': lambda: engine_cache_stats('kriging_engine', 'geometry_cache'),
+    'triangulation': lambda: engine_cache_stats('triangulation_cache', 'triangulation_cache'),
+})
+# one queue for the whole server (map_jobs.py), not summed over the gunicorn workers
+metrics.registry.callback('ngdr_map_jobs', "Map jobs held by the queue, by state.", ['state'],
+                          lambda: {(state,): value for state, value in map_jobs.stats().items() if state in ('jobs', 'pending')}, shared=True)
+# under gunicorn /metrics renders the snapshots every worker writes (metrics.py)
+metrics.registry.start_flushing()
 
 
 def generate_response(user_query, topic):
@@ -49,21 +78,25 @@ def generate_response(user_query, topic):
   """
   # send post request to the rag model flask server with user_query and topic
   # get the response from the rag model server and return it
-  load_dotenv()
-  rag_server_url = os.getenv('SERVER_URL')  # Get the server URL from the environment variables
-  if (rag_server_url is None) or (rag_server_url == ""):
+  # pooled keep-alive session, SERVER_URL and the timeouts are read once at startup (rag_client.py)
+  if not rag_client.default_client.configured:
       return "The server URL is not set. Please set it in the environment variables."
-  response = requests.post(rag_server_url + '/chatbot', json={"query": user_query, "topic": topic})
+  cache_key = (topic, rag_client.normalise_query(user_query))
+  cached_answer = rag_answer_cache.get(cache_key)
+  if cached_answer is not None:
+      return cached_answer
+  try:
+      response = rag_client.default_client.ask(user_query, topic)
+  except requests.RequestException as e:
+      metrics.event('rag_request_failed', level=logging.WARNING, topic=topic, error=repr(e))
+      response = None
   if response:
       response_json = response.json()
       if 'answer' in response_json:
-          answer = response_json['answer']
-          answer = re.sub(r'\*\*+', "", answer)
-          answer = re.sub(r'\*', "🔸", answer)
-          answer = re.sub(r'-(?=\s)', "🔸", answer)
+          answer = rag_client.format_answer(response_json['answer'])
           # context_items = response_json.get('context_items', [])
-          if (('so I cannot answer this question from the provided context.' in answer) or ('The context does not mention any information' in answer) or ('The context does not' in answer)):
-             answer += '\n\n 📔 Note: Sometimes I am unable to answer the question as I am still learning and improving. Please provide more context or rephrase the question.'
+          # only real answers are cached, connection errors and fallbacks are retried next time
+          rag_answer_cache.put(cache_key, answer)
           return answer
       else:
           default_answer = "Sorry, I am unable to generate a response at this moment."
@@ -78,12 +111,44 @@ def generate_response(user_query, topic):
   # return "Thanks for your query! I'm still under development and learning to communicate effectively. Stay tuned for future updates!"
 
 
+def generate_response_stream(user_query, topic):
+  """
+  Streaming variant of generate_response, yields the post-processed answer as the RAG server produces it.
+  """
+  if not rag_client.default_client.configured:
+      yield "The server URL is not set. Please set it in the environment variables."
+      return
+  cache_key = (topic, rag_client.normalise_query(user_query))
+  cached_answer = rag_answer_cache.get(cache_key)
+  if cached_answer is not None:
+      yield cached_answer
+      return
+  formatter = rag_client.StreamingAnswerFormatter()
+  received = False
+  try:
+      for chunk in rag_client.default_client.stream(user_query, topic):
+          received = True
+          text = formatter.feed(chunk)
+          if text:
+              yield text
+  except requests.RequestException as e:
+      metrics.event('rag_stream_failed', level=logging.WARNING, topic=topic, received=received, error=repr(e))
+      if not received:
+          yield "There was an error connecting to the chatbot. Please try again later."
+      # a partly streamed answer is left as it is and not cached
+      return
+  if not received:
+      yield "Sorry, I am unable to generate a response at this moment."
+      return
+  yield formatter.finish()
+  rag_answer_cache.put(cache_key, formatter.text)
+
+
 @app.route("/")
 def home():
   return render_template("index.html")
-import plotly.graph_objects as go
-
 def generate_ngdr_map():
+  import plotly.graph_objects as go
   # Create a map figure
   fig = go.Figure(data=go.Scattergeo())
 
@@ -113,19 +178,99 @@ def generate_ngdr_map():
   return data, layout
 
 
+def describe_ngdr_request(request):
+    # attached to NGDR profiles: the query and what the lexer made of it after typo correction
+    user_query = request.json["query"]
+    return {"query": user_query, "parse": parse_query(correct_typos(user_query))._asdict()}
+
+
+def describe_rag_request(request):
+    return {"query": request.json["query"], "topic": request.json["topic"]}
+
+
 @app.route("/get_response_ngdr", methods=["POST"])
+@profiling.profile_requests("ngdr", describe=describe_ngdr_request)
 def ngdr_geochem_response():
     user_query = request.json["query"]
     # send this user_query to the ngdr main function then get the response and return it by jsonify after making it to a dictionary
     
     response = generate_geochemistry_response(user_query) 
-    new_response = deep_convert_np_to_lists(response)
-    # print("RESPONSE:", new_response)
-    return jsonify(new_response)
+    # print("RESPONSE:", response)
+    with metrics.stage_seconds.time(stage='serialise'):
+        return jsonify(response)
     # data, layout = generate_ngdr_map()
     return jsonify(data=data, layout=layout)
 
 
+MAP_QUEUE_FULL_MESSAGE = "Many maps are being built right now, please ask for this one again in a minute."
+
+
+def queue_map_work_item(kind, subquery, toposheet_number, element):
+    # maps of the chat page are built by the map job runners, the stream only carries the job id
+    try:
+        job_id = map_jobs.submit(kind, subquery, toposheet_number, element)
+    except QueueFullError:
+        return MAP_QUEUE_FULL_MESSAGE, "text"
+    return {"job_id": job_id, "kind": kind}, "map_job"
+
+
+@app.route("/get_response_ngdr_stream", methods=["POST"])
+def ngdr_geochem_response_stream():
+    # one NDJSON line per subquery, written as soon as that subquery is answered; a map is a
+    # "map_job" line the page polls /map_jobs/<job_id> for
+    user_query = request.json["query"]
+
+    def generate():
+        for index, total, subquery, response in iter_geochemistry_responses(user_query, submit_map=queue_map_work_item):
+            with metrics.stage_seconds.time(stage='serialise'):
+                line = app.json.dumps({"index": index, "total": total, "subquery": subquery, "response": response}) + "\n"
+            yield line
+
+    return Response(generate(), mimetype="application/x-ndjson")
+
+
+@app.route("/map_jobs", methods=["POST"])
+def submit_map_job():
+    # kriging/IDW maps run in the background process pool, the client gets a job id straight away
+    user_query = request.json["query"]
+    kind = request.json.get("kind") or job_kind_for_query(user_query)
+    if kind is None:
+        return jsonify({"error": "The query does not ask for a kriging or IDW map."}), 400
+    try:
+        job_id = map_jobs.submit(kind, user_query)
+    except (QueueFullError, ValueError) as error:
+        return jsonify({"error": str(error)}), 429 if isinstance(error, QueueFullError) else 400
+    return jsonify({"job_id": job_id, "status": "pending"}), 202
+
+
+@app.route("/map_jobs/<job_id>", methods=["GET"])
+def map_job_status(job_id):
+    # ?wait=<seconds> holds the request open until the job finishes (long polling)
+    wait = min(request.args.get("wait", 0, type=float), 60)
+    state = map_jobs.status(job_id, wait=wait)
+    if state is None:
+        return jsonify({"error": "Unknown or expired job id."}), 404
+    return jsonify(state)
+
+
+@app.route("/cache_stats", methods=["GET"])
+def cache_stats():
+    # hit/miss counters used to tune KRIGING_CACHE_MB and RAG_CACHE_MB/RAG_CACHE_TTL_SECONDS
+    return jsonify({"kriging": kriging_cache_stats(), "intents": intent_cache_stats(), "map_jobs": map_jobs.stats(), "rag": rag_answer_cache.stats()})
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    # Prometheus text exposition of every metric in metrics.registry
+    return Response(metrics.registry.render(), mimetype=metrics.CONTENT_TYPE)
+
+
+@app.route("/intent_stats", methods=["GET"])
+def intent_stats():
+    # per route latency of the NGDR handlers and how many queries skipped the spaCy split
+    return jsonify(router.stats())
+
+
 # @app.route("/get_response", methods=["POST"])
 # def get_response():
 #   user_query = request.form["query"]
@@ -133,7 +278,16 @@ def ngdr_geochem_response():
 #   response = generate_response(user_query)  # Call your model function
 
 #   return jsonify({"response": response})
+@app.route("/get_response_rag_stream", methods=["POST"])
+def get_response_stream():
+    # plain text, written chunk by chunk as the RAG server generates the answer
+    user_query = request.json["query"]
+    topic = request.json["topic"]
+    return Response(generate_response_stream(user_query, topic), mimetype="text/plain", headers={"X-Accel-Buffering": "no", "Cache-Control": "no-cache"})
+
+
 @app.route("/get_response_rag", methods=["POST"])
+@profiling.profile_requests("rag", describe=describe_rag_request)
 def get_response():
     user_query = request.json["query"]
     topic = request.json["topic"]
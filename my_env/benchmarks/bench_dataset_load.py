@@ -0,0 +1,61 @@
+"""
+Startup cost of loading NGDR_Nagpur.csv with pd.read_csv versus the columnar dataset store.
+
+Each variant runs in a fresh interpreter so the peak resident memory is comparable.
+Run from the my_env directory:
+    python benchmarks/bench_dataset_load.py --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MY_ENV_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MY_ENV_DIR)
+
+import dataset_store
+
+
+CSV_PATH = os.path.join(MY_ENV_DIR, 'NGDR_Nagpur.csv')
+
+CHILD = r'''
+import json, resource, sys, time
+sys.path.insert(0, {my_env!r})
+import numpy, pandas as pd
+import dataset_store
+baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+if {variant!r} == "csv":
+    df = pd.read_csv({csv!r})
+elif {variant!r} == "store_all":
+    df = dataset_store.load_frame({csv!r})
+else:
+    df = dataset_store.load_frame({csv!r}, columns=["longitude", "latitude", "toposheet", "cu"])
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_kb, "shape": list(df.shape)}}))
+'''
+
+
+def run_variant(variant):
+    code = CHILD.format(my_env=MY_ENV_DIR, variant=variant, csv=CSV_PATH)
+    output = subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    dataset_store.ensure_store(CSV_PATH)
+    for variant in ('csv', 'store_all', 'store_query_columns'):
+        runs = [run_variant(variant) for _ in range(args.repeat)]
+        seconds = statistics.median(run['seconds'] for run in runs) * 1000
+        rss_mb = statistics.median(run['rss_kb'] for run in runs) / 1024
+        print(f"{variant:<20} load {seconds:8.2f} ms   peak RSS growth {rss_mb:7.2f} MB   shape {runs[0]['shape']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Runtime and coverage of the KD-tree IDW engine against the previous cubic griddata path
+used by generate_idw_map, on every toposheet of the Nagpur data.
+
+Run from the my_env directory:
+    python benchmarks/bench_idw.py --element al2o3 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+from scipy.interpolate import griddata
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import idw_engine
+from geo_chem import Nagpur_gdf
+
+
+def cubic_grid(x, y, values, resolution):
+    grid_x, grid_y = np.mgrid[x.min():x.max():complex(resolution), y.min():y.max():complex(resolution)]
+    return griddata((x, y), values, (grid_x, grid_y), method='cubic').T
+
+
+def idw_grid(x, y, values, resolution, power, neighbours):
+    gridx = np.linspace(x.min(), x.max(), resolution)
+    gridy = np.linspace(y.min(), y.max(), resolution)
+    return idw_engine.idw_grid(x, y, values, gridx, gridy, power=power, n_neighbours=neighbours)
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        grid = function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), grid
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--element', default='al2o3')
+    parser.add_argument('--resolution', type=int, default=100)
+    parser.add_argument('--power', type=float, default=2.0)
+    parser.add_argument('--neighbours', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    cubic_ms, idw_ms, cubic_nan, idw_nan = [], [], [], []
+    for toposheet, sheet in Nagpur_gdf.groupby('toposheet'):
+        sheet = sheet[sheet[args.element].notna()]
+        if len(sheet) < 4:
+            continue
+        x, y, values = sheet['longitude'].to_numpy(), sheet['latitude'].to_numpy(), sheet[args.element].to_numpy()
+        elapsed, grid = measure(lambda: cubic_grid(x, y, values, args.resolution), args.repeat)
+        cubic_ms.append(elapsed)
+        cubic_nan.append(np.isnan(grid).mean() * 100)
+        elapsed, grid = measure(lambda: idw_grid(x, y, values, args.resolution, args.power, args.neighbours), args.repeat)
+        idw_ms.append(elapsed)
+        idw_nan.append(np.isnan(grid).mean() * 100)
+
+    print(f"{len(cubic_ms)} toposheets, {args.resolution}x{args.resolution} grid, element {args.element}")
+    print(f"cubic griddata    median {statistics.median(cubic_ms):8.2f} ms per map   NaN nodes {statistics.mean(cubic_nan):5.1f} %")
+    print(f"KD-tree IDW       median {statistics.median(idw_ms):8.2f} ms per map   NaN nodes {statistics.mean(idw_nan):5.1f} %")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Repeated questions in different wordings: generate_geochemistry_response with the
+canonical-intent cache against the same code with it disabled (so only the kriging cache
+below it helps). Every wording of a group asks for the same (operation, toposheet, element).
+Run from the my_env directory:
+    python benchmarks/bench_intent_cache.py --rounds 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo_chem
+from caches import LRUCache
+
+WORDINGS = [
+    ["kriging map copper 55K14", "Create a kriging map for cu for toposheet 55K14", "show me copper kriging on 55k14"],
+    ["idw map of zinc in 55K14", "Create a IDW map for zn for the toposheet number 55K14", "inverse distance weighted map of Zinc, 55k14"],
+    ["max cu 55K14", "Tell me the maximum value for cu in the toposheet number 55K14", "what is the maximum of copper in 55k14?"],
+]
+
+
+def run(rounds):
+    timings = []
+    for _ in range(rounds):
+        for group in WORDINGS:
+            for query in group:
+                start = time.perf_counter()
+                geo_chem.generate_geochemistry_response(query)
+                timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    enabled = geo_chem.intent_cache
+    for name, cache in (('kriging cache only', LRUCache(max_bytes=0)), ('canonical-intent cache', enabled)):
+        geo_chem.intent_cache = cache
+        geo_chem.kriging_cache.clear()
+        timings = run(args.rounds)
+        stats = cache.stats()
+        print(f"{name:24s} mean {statistics.mean(timings):8.2f} ms   median {statistics.median(timings):7.2f} ms   "
+              f"intent hits {stats['hits']}/{stats['hits'] + stats['misses']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+Cost of getting from a query to its handlers, without running them: typo correction plus
+split_query_smartly plus the old .lower() cascade for every query (the previous path) against
+route_query, which answers single-intent queries straight from the lexer output.
+The corpus is the suggested NGDR questions of templates/index.html plus typical rewordings.
+Run from the my_env directory:
+    python benchmarks/bench_intent_router.py --repeat 200
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo_chem
+
+QUERIES = [
+    "Create a kriging map for copper for the toposheet number 55K14",
+    "Create a IDW map for al2o3 for the toposheet number 55P10",
+    "Tell me the maximum value for cu in the toposheet number 55K14",
+    "what is the max and min values for the concentrations of hg in toposheet number 55P02?",
+    "kriging map copper 55K14",
+    "show me the minimum of zinc in 55k15",
+    "idw and kriging map of nickel in 55K14",
+    "What is the maximum of gold for 55K14 and create a kriging map of copper for 55K14",
+]
+
+
+def legacy_route(query):
+    # correct_typos + split_query_smartly, then the substring cascade of process_subquery
+    subqueries = geo_chem.split_query_smartly(geo_chem.correct_typos(query))
+    routes = []
+    for subquery in subqueries:
+        lower = subquery.lower()
+        if ('maximum' in lower and 'minimum' in lower) or ('max' in lower and 'min' in lower):
+            routes.append('min_max')
+        elif 'maximum' in lower or 'max' in lower:
+            routes.append('max')
+        elif 'minimum' in lower or 'min' in lower:
+            routes.append('min')
+        elif 'idw' in lower or 'inverse distance weighted map' in lower:
+            routes.append('idw')
+        elif 'kriging' in lower:
+            routes.append('kriging')
+    return routes
+
+
+def new_route(query):
+    return [geo_chem.router.route(geo_chem.parse_query(subquery).intents) for subquery in geo_chem.route_query(query)]
+
+
+def measure(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in QUERIES:
+            function(query)
+    return (time.perf_counter() - start) * 1e6 / (repeat * len(QUERIES))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    for query in QUERIES:
+        print(f"  {query[:70]:72s} legacy {legacy_route(query)}  router {[route.name for route in new_route(query) if route]}")
+    geo_chem.router.fast_path = geo_chem.router.split_path = 0
+    legacy = measure(legacy_route, args.repeat)
+    new = measure(new_route, args.repeat)
+    stats = geo_chem.router.stats()
+    print(f"legacy (split every query)  {legacy:9.1f} us/query")
+    print(f"intent router               {new:9.1f} us/query   fast path {stats['fast_path']}, split {stats['split_path']}")
+
+
+if __name__ == "__main__":
+    main()
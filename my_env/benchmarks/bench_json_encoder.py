@@ -0,0 +1,81 @@
+"""
+Serialisation time of real map responses: deep_convert_np_to_lists + json.dumps (the old
+path) against the NumpyJSONProvider used by the app, both with orjson (when installed)
+and with its pure Python fallback (to_jsonable + json.dumps).
+
+Payloads: a kriging map and a cubic map (with NaNs outside the hull) in the old figure-dict
+layout, and the same kriging map as a compact payload.
+Run from the my_env directory:
+    python benchmarks/bench_json_encoder.py --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from scipy.interpolate import griddata
+
+import kriging_engine
+from app import app
+from benchmarks.bench_map_payload import compact_payload, deep_convert_np_to_lists, legacy_figure
+from geo_chem import Nagpur_gdf, Nagpur_stats
+from json_encoder import NumpyJSONProvider, to_jsonable
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--toposheet', default='55K14')
+    parser.add_argument('--element', default='cu')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    sheet = Nagpur_gdf[Nagpur_gdf['toposheet'] == args.toposheet]
+    stats = Nagpur_stats.lookup(args.toposheet, args.element)
+    kriged = kriging_engine.krige_toposheet(Nagpur_gdf, args.toposheet, [args.element])[args.element]
+    grid_x, grid_y = np.meshgrid(kriged.gridx, kriged.gridy)
+    cubic = kriged._replace(z=griddata((sheet['longitude'], sheet['latitude']), sheet[args.element].to_numpy(), (grid_x, grid_y), method='cubic'))
+
+    kriging_figure = legacy_figure(kriged, sheet, args.element, stats)
+    cubic_figure = legacy_figure(cubic, sheet, args.element, stats)
+    payloads = {
+        'kriging figure dict x2': ((kriging_figure, kriging_figure, 'kriging_map'), 'kriging_map'),
+        'cubic figure dict x2 (NaNs)': ((cubic_figure, cubic_figure, 'idw_map'), 'idw_map'),
+        'compact kriging payload': ((compact_payload(kriged, sheet, args.element, stats), 'kriging_map'), 'kriging_map'),
+    }
+    provider = NumpyJSONProvider(app)
+    fallback = NumpyJSONProvider(app)
+    fallback.use_orjson = False
+    if not provider.use_orjson:
+        print("orjson is not installed, only the pure Python path is measured")
+
+    for name, payload in payloads.items():
+        # every encoder has to produce the same document
+        expected = json.loads(json.dumps(deep_convert_np_to_lists(payload)))
+        assert json.loads(provider.dumps(payload)) == expected
+        assert json.loads(fallback.dumps(payload)) == expected
+        old_convert = measure(lambda: deep_convert_np_to_lists(payload), args.repeat)
+        new_convert = measure(lambda: to_jsonable(payload), args.repeat)
+        old = measure(lambda: json.dumps(deep_convert_np_to_lists(payload)), args.repeat)
+        pure = measure(lambda: fallback.dumps(payload), args.repeat)
+        fast = measure(lambda: provider.dumps(payload), args.repeat)
+        print(f"{name}")
+        print(f"  conversion only      deep_convert {old_convert:8.2f} ms   to_jsonable {new_convert:8.2f} ms")
+        print(f"  full serialisation   deep_convert + json.dumps {old:8.2f} ms   provider (pure Python) {pure:8.2f} ms   provider {fast:8.2f} ms   {old / fast:6.1f} x")
+
+
+if __name__ == "__main__":
+    main()
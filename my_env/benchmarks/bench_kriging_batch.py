@@ -0,0 +1,65 @@
+"""
+Kriging several elements of one toposheet: one pykrige OrdinaryKriging per element versus
+kriging_engine.krige_toposheet, which builds the toposheet geometry once.
+
+Run from the my_env directory:
+    python benchmarks/bench_kriging_batch.py --toposheet 55K14 --elements cu zn pb ni
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kriging_engine
+from geo_chem import Nagpur_gdf
+from pykrige.ok import OrdinaryKriging
+
+
+def krige_with_pykrige(sheet, elements, grid_resolution):
+    gridx = np.linspace(sheet['longitude'].min(), sheet['longitude'].max(), grid_resolution)
+    gridy = np.linspace(sheet['latitude'].min(), sheet['latitude'].max(), grid_resolution)
+    results = {}
+    for element in elements:
+        OK = OrdinaryKriging(sheet['longitude'], sheet['latitude'], sheet[element], variogram_model='spherical')
+        results[element] = OK.execute('grid', gridx, gridy)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--toposheet', default='55K14')
+    parser.add_argument('--elements', nargs='+', default=['cu', 'zn', 'pb', 'ni'])
+    parser.add_argument('--grid-resolution', type=int, default=100)
+    args = parser.parse_args()
+
+    sheet = Nagpur_gdf[Nagpur_gdf['toposheet'] == args.toposheet]
+    elements = [element for element in args.elements if sheet[element].notna().all()]
+
+    start = time.perf_counter()
+    reference = krige_with_pykrige(sheet, elements, args.grid_resolution)
+    print(f"pykrige, one model per element   {time.perf_counter() - start:8.3f} s")
+
+    kriging_engine.geometry_cache.clear()
+    start = time.perf_counter()
+    batch = kriging_engine.krige_toposheet(Nagpur_gdf, args.toposheet, elements, grid_resolution=args.grid_resolution)
+    print(f"batch engine, cold geometry      {time.perf_counter() - start:8.3f} s")
+
+    start = time.perf_counter()
+    kriging_engine.krige_toposheet(Nagpur_gdf, args.toposheet, elements, grid_resolution=args.grid_resolution)
+    print(f"batch engine, cached geometry    {time.perf_counter() - start:8.3f} s")
+
+    start = time.perf_counter()
+    kriging_engine.krige_toposheet(Nagpur_gdf, args.toposheet, elements, grid_resolution=args.grid_resolution, return_variance=False)
+    print(f"batch engine, without variance   {time.perf_counter() - start:8.3f} s")
+
+    for element in elements:
+        z, ss = reference[element]
+        print(f"  {element:<4} max |dz| {np.abs(batch[element].z - z).max():.2e}   max |dvariance| {np.abs(batch[element].variance - ss).max():.2e}")
+
+
+if __name__ == "__main__":
+    main()
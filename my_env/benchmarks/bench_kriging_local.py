@@ -0,0 +1,52 @@
+"""
+Accuracy and runtime of moving-window kriging (kriging_engine.krige_local) against the
+global Ordinary Kriging solve, on a district-sized extract of the Nagpur samples.
+
+The global solve uses the same variogram parameters, so the differences only come from
+the neighbourhood restriction. Run from the my_env directory:
+    python benchmarks/bench_kriging_local.py --samples 1500 --neighbours 8 16 32 64
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import kriging_engine
+from geo_chem import Nagpur_gdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--element', default='cu')
+    parser.add_argument('--samples', type=int, default=1500, help='random samples taken from all toposheets')
+    parser.add_argument('--neighbours', type=int, nargs='+', default=[8, 16, 32, 64])
+    parser.add_argument('--search-radius', type=float, default=None)
+    parser.add_argument('--grid-resolution', type=int, default=100)
+    parser.add_argument('--jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    data = Nagpur_gdf[Nagpur_gdf[args.element].notna()]
+    data = data.sample(n=min(args.samples, len(data)), random_state=0)
+    x, y, values = data['longitude'].to_numpy(), data['latitude'].to_numpy(), data[args.element].to_numpy()
+    print(f"{len(values)} samples of {args.element}, {args.grid_resolution}x{args.grid_resolution} grid")
+
+    parameters = kriging_engine.fit_variogram_sampled(x, y, values, 'spherical')
+    start = time.perf_counter()
+    reference = kriging_engine.krige_elements(x, y, {args.element: values}, variogram_parameters=parameters, grid_resolution=args.grid_resolution)[args.element]
+    print(f"global solve                 {time.perf_counter() - start:8.3f} s")
+
+    for k in args.neighbours:
+        start = time.perf_counter()
+        local = kriging_engine.krige_local(x, y, values, variogram_parameters=parameters, n_neighbours=k, search_radius=args.search_radius, grid_resolution=args.grid_resolution, n_jobs=args.jobs)
+        elapsed = time.perf_counter() - start
+        both = ~np.isnan(local.z)
+        rmse = np.sqrt(np.mean((local.z[both] - reference.z[both]) ** 2))
+        print(f"local k={k:<4}                {elapsed:8.3f} s   RMSE vs global {rmse:9.4f}   max |dz| {np.abs(local.z[both] - reference.z[both]).max():9.4f}   NaN nodes {np.count_nonzero(~both)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Throughput of the background map job queue at different worker counts.
+
+Every run submits the same batch of kriging/IDW map queries (distinct toposheet/element
+pairs, so no run is served from the per-process kriging cache) and measures jobs per second
+from the first submit to the last result. Worker start-up (spawn + dataset load) is paid by a
+warm-up round before the clock starts. The in-request baseline answers the batch
+sequentially in this process, which is what the synchronous endpoint does.
+Run from the my_env directory:
+    python benchmarks/bench_map_jobs.py --workers 1 2 4 --jobs 24
+"""
+import argparse
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from map_jobs import MapJobQueue, run_map_job
+
+
+def build_queries(count, kriging_share):
+    import geo_chem
+    sheets = sorted(geo_chem.Nagpur_stats.toposheets)
+    elements = ['cu', 'zn', 'pb', 'ni', 'cr', 'co', 'v', 'ba']
+    queries = []
+    for index, (element, sheet) in enumerate(itertools.product(elements, sheets)):
+        if len(queries) == count:
+            break
+        if index % 100 < kriging_share * 100:
+            queries.append(('kriging_map', f"kriging map of {element} in {sheet}"))
+        else:
+            queries.append(('idw_map', f"idw map of {element} in {sheet}"))
+    return queries
+
+
+def run_queue(queries, workers):
+    queue = MapJobQueue(max_workers=workers, max_pending=len(queries) + workers)
+    # warm-up: one job per worker so every process has loaded the dataset
+    warm = [queue.submit('idw_map', "idw map of cu in 55K14") for _ in range(workers)]
+    for job_id in warm:
+        queue.status(job_id, wait=600)
+
+    start = time.perf_counter()
+    job_ids = [queue.submit(kind, query) for kind, query in queries]
+    submit_ms = (time.perf_counter() - start) * 1000
+    failed = 0
+    for job_id in job_ids:
+        failed += queue.status(job_id, wait=600)['status'] != 'done'
+    elapsed = time.perf_counter() - start
+    queue.shutdown()
+    return elapsed, submit_ms, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--jobs', type=int, default=24)
+    parser.add_argument('--kriging-share', type=float, default=0.5, help="fraction of the batch that asks for kriging maps")
+    args = parser.parse_args()
+
+    queries = build_queries(args.jobs, args.kriging_share)
+    print(f"{len(queries)} map jobs, {os.cpu_count()} CPUs")
+
+    start = time.perf_counter()
+    for kind, query in queries:
+        run_map_job(kind, query)
+    elapsed = time.perf_counter() - start
+    print(f"in-request (sequential)  {elapsed:7.2f} s   {len(queries) / elapsed:6.2f} jobs/s")
+
+    for workers in args.workers:
+        elapsed, submit_ms, failed = run_queue(queries, workers)
+        print(f"queue, {workers} worker(s)      {elapsed:7.2f} s   {len(queries) / elapsed:6.2f} jobs/s   "
+              f"all submits returned in {submit_ms:6.1f} ms   failed {failed}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Response size and server-side serialisation time of a kriging map: the previous response
+(the Plotly figure dict sent twice, numpy grids turned into nested lists by
+deep_convert_np_to_lists) versus the compact map payload.
+
+Run from the my_env directory:
+    python benchmarks/bench_map_payload.py --toposheet 55K14 --element cu --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import kriging_engine
+import map_payload
+from geo_chem import Nagpur_gdf, Nagpur_stats
+
+
+def deep_convert_np_to_lists(obj):
+    # the conversion app.py applied to every response before NumpyJSONProvider
+    if isinstance(obj, np.ndarray):
+        # Convert NaNs to None in a NumPy array
+        obj = np.where(np.isnan(obj), None, obj)
+        return obj.tolist()
+    elif isinstance(obj, dict):
+        # Recursively apply to dictionary values
+        return {k: deep_convert_np_to_lists(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        # Recursively apply to list items
+        return [deep_convert_np_to_lists(item) for item in obj]
+    elif isinstance(obj, tuple):
+        # Recursively apply to tuple items
+        return tuple(deep_convert_np_to_lists(item) for item in obj)
+    elif obj != obj:
+        # Replace standalone NaNs with None
+        return None
+    return obj
+
+
+def legacy_figure(result, sheet, element, stats):
+    # the figure dict generate_kriging_map used to return, as plotly 5's fig.to_dict() laid it out
+    return {
+        'data': [
+            {'type': 'contour', 'z': result.z, 'x': result.gridx, 'y': result.gridy, 'colorscale': 'YlOrRd', 'showscale': True},
+            {'type': 'scatter', 'x': sheet['longitude'].to_numpy(), 'y': sheet['latitude'].to_numpy(), 'mode': 'markers',
+             'marker': {'color': sheet[element].to_numpy(), 'colorscale': 'YlOrRd', 'showscale': False, 'line': {'color': 'black', 'width': 1}},
+             'text': sheet[element].to_numpy(), 'hoverinfo': 'text'},
+        ],
+        'layout': {
+            'annotations': [
+                {'text': f"<i>Maximum value (in ppm): <b>{stats.max}</b></i>", 'xref': 'paper', 'yref': 'paper', 'x': 0.5, 'y': 1.2, 'showarrow': False},
+                {'text': f"<i>Minimum value (in ppm): <b>{stats.min}</b></i>", 'xref': 'paper', 'yref': 'paper', 'x': 0.5, 'y': 1.1, 'showarrow': False},
+            ],
+            'title': {'text': f"<b>Stream Sediment samples showing {element} Values(ppm)</b>", 'x': 0.5, 'y': 0.95},
+            'margin': {'t': 120},
+        },
+    }
+
+
+def compact_payload(result, sheet, element, stats):
+    return map_payload.build_map_payload(
+        'kriging_map', result.gridx, result.gridy, result.z, sheet['longitude'], sheet['latitude'], point_values=sheet[element], point_outline=True,
+        title=f"<b>Stream Sediment samples showing {element} Values(ppm)</b>",
+        annotations=[(f"<i>Maximum value (in ppm): <b>{stats.max}</b></i>", 1.2), (f"<i>Minimum value (in ppm): <b>{stats.min}</b></i>", 1.1)],
+        colorscale='YlOrRd', margin_top=120)
+
+
+def measure(serialise, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = serialise()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), len(body.encode('utf-8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--toposheet', default='55K14')
+    parser.add_argument('--element', default='cu')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    sheet = Nagpur_gdf[Nagpur_gdf['toposheet'] == args.toposheet]
+    stats = Nagpur_stats.lookup(args.toposheet, args.element)
+    result = kriging_engine.krige_toposheet(Nagpur_gdf, args.toposheet, [args.element])[args.element]
+
+    def legacy():
+        figure = legacy_figure(result, sheet, args.element, stats)
+        return json.dumps(deep_convert_np_to_lists(((figure, figure, 'kriging_map'), 'kriging_map')))
+
+    def compact():
+        payload = compact_payload(result, sheet, args.element, stats)
+        return json.dumps(deep_convert_np_to_lists(((payload, 'kriging_map'), 'kriging_map')))
+
+    legacy_ms, legacy_bytes = measure(legacy, args.repeat)
+    compact_ms, compact_bytes = measure(compact, args.repeat)
+    print(f"figure dict x2    {legacy_bytes / 1024:9.1f} KiB   {legacy_ms:8.2f} ms to build and serialise")
+    print(f"compact payload   {compact_bytes / 1024:9.1f} KiB   {compact_ms:8.2f} ms to build and serialise")
+    print(f"reduction         {legacy_bytes / compact_bytes:9.1f} x size   {legacy_ms / compact_ms:8.1f} x time")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Per-stage benchmark of the NGDR geochemistry pipeline on NGDR_Nagpur.csv.
+
+Runs a fixed corpus (the suggested NGDR questions of templates/index.html plus realistic
+rewordings and compound queries) through generate_geochemistry_response and the JSON
+encoding of its answer. The stages are timed by wrapping the pipeline functions for the
+duration of the run:
+
+    correct_typos, parse_query (lexer), split_query_smartly, plan_subquery,
+    _run_work_item (one answer, cache lookups included), generate_kriging_map,
+    generate_idw_map, build_map_payload (inside the two map stages), serialise, total
+
+Stage times are inclusive and summed per query (a stage can run several times, also on the
+subquery pool threads). Percentiles are over the queries in which the stage ran. Allocations
+are the tracemalloc peak per query, in a separate pass so tracing does not skew the timings.
+
+--mode cold clears every cache before each query, --mode warm measures after one warm-up pass.
+Results are written as JSON; --baseline compares the p50 of every stage with a previous file.
+Run from the my_env directory:
+    python benchmarks/bench_pipeline.py --mode cold --repeat 3 --output pipeline.json
+    python benchmarks/bench_pipeline.py --mode cold --repeat 3 --baseline pipeline.json
+"""
+import argparse
+import contextlib
+import functools
+import json
+import os
+import platform
+import re
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import geo_chem
+import kriging_engine
+import map_payload
+import triangulation_cache
+from app import app
+
+EXTRA_QUERIES = [
+    "kriging map copper 55K14",
+    "show me the minimum of zinc in 55k15",
+    "krigging map of nikel in 55k14",
+    "idw and kriging map of nickel in 55K14",
+    "What is the maximum of gold for 55K14 and create a kriging map of copper for 55K14",
+    "what is the minimum of lead and zinc for 55K14 and 55K15",
+    "Create a IDW map for chromium for the toposheet number 55K14",
+    "tell me the max and min of arsenic in 55P02",
+]
+
+STAGES = [
+    (geo_chem, 'correct_typos'),
+    (geo_chem, 'parse_query'),
+    (geo_chem, 'split_query_smartly'),
+    (geo_chem, 'plan_subquery'),
+    (geo_chem, '_run_work_item'),
+    (geo_chem, 'generate_kriging_map'),
+    (geo_chem, 'generate_idw_map'),
+    (map_payload, 'build_map_payload'),
+]
+
+
+def corpus():
+    template = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'index.html')
+    with open(template, encoding='utf-8') as f:
+        array = re.search(r'const NGDR_question_list = (\[.*?\])', f.read(), re.DOTALL).group(1)
+    return json.loads(re.sub(r',\s*\]', ']', array)) + EXTRA_QUERIES
+
+
+class StageTimer:
+    # collects the time spent in every stage while the current query runs, from any thread
+
+    def __init__(self):
+        self.current = None
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            if self.current is not None:
+                self.current[stage] = self.current.get(stage, 0.0) + seconds * 1000
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def wrap(self, stage, function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            with self.stage(stage):
+                return function(*args, **kwargs)
+        return timed
+
+
+@contextlib.contextmanager
+def instrumented(timer):
+    originals = [(module, name, getattr(module, name)) for module, name in STAGES]
+    for module, name, function in originals:
+        setattr(module, name, timer.wrap(name, function))
+    try:
+        yield
+    finally:
+        for module, name, function in originals:
+            setattr(module, name, function)
+
+
+def clear_caches():
+    geo_chem.kriging_cache.clear()
+    geo_chem.intent_cache.clear()
+    kriging_engine.geometry_cache.clear()
+    triangulation_cache.clear()
+    geo_chem.lexer.lex.cache_clear()
+    geo_chem.corrector.correct_word.cache_clear()
+
+
+def answer(query, timer):
+    with timer.stage('total'):
+        response = geo_chem.generate_geochemistry_response(query)
+        with timer.stage('serialise'):
+            body = app.json.dumps(response)
+    return len(body)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def summarise(samples):
+    return {
+        'count': len(samples),
+        'p50_ms': percentile(samples, 50),
+        'p90_ms': percentile(samples, 90),
+        'p99_ms': percentile(samples, 99),
+        'max_ms': max(samples),
+        'mean_ms': sum(samples) / len(samples),
+    }
+
+
+def run(queries, mode, repeat):
+    timer = StageTimer()
+    per_stage = {}
+    per_query = {query: [] for query in queries}
+    if mode == 'warm':
+        for query in queries:
+            answer(query, timer)
+    with instrumented(timer):
+        for _ in range(repeat):
+            for query in queries:
+                if mode == 'cold':
+                    clear_caches()
+                timer.current = {}
+                answer(query, timer)
+                for stage, milliseconds in timer.current.items():
+                    per_stage.setdefault(stage, []).append(milliseconds)
+                per_query[query].append(timer.current['total'])
+                timer.current = None
+    return per_stage, per_query
+
+
+def allocations(queries, mode):
+    # tracemalloc peak and the response size per query
+    timer = StageTimer()
+    results = {}
+    tracemalloc.start()
+    try:
+        for query in queries:
+            if mode == 'cold':
+                clear_caches()
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            size = answer(query, timer)
+            current, peak = tracemalloc.get_traced_memory()
+            results[query] = {'peak_kib': (peak - before) / 1024, 'retained_kib': (current - before) / 1024, 'response_kib': size / 1024}
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\ncompared with {baseline_path} ({baseline.get('created')})")
+    regressions = 0
+    for stage, stats in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if previous is None:
+            print(f"  {stage:22s} new stage")
+            continue
+        change = (stats['p50_ms'] - previous['p50_ms']) / previous['p50_ms'] if previous['p50_ms'] else 0.0
+        flag = ''
+        if change > tolerance:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"  {stage:22s} p50 {previous['p50_ms']:9.3f} -> {stats['p50_ms']:9.3f} ms  {change:+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['cold', 'warm'], default='cold')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.10, help="p50 slowdown reported as a regression")
+    parser.add_argument('--no-allocations', action='store_true', help="skip the tracemalloc pass")
+    args = parser.parse_args()
+
+    queries = corpus()
+    per_stage, per_query = run(queries, args.mode, args.repeat)
+    memory = {} if args.no_allocations else allocations(queries, args.mode)
+
+    results = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'mode': args.mode,
+        'repeat': args.repeat,
+        'python': platform.python_version(),
+        'rows': len(geo_chem.Nagpur_gdf),
+        'stages': {stage: summarise(samples) for stage, samples in per_stage.items()},
+        'queries': {query: {'total': summarise(samples), **memory.get(query, {})} for query, samples in per_query.items()},
+    }
+
+    print(f"{len(queries)} queries x {args.repeat}, {args.mode} caches, {results['rows']} samples")
+    print(f"  {'stage':22s} {'runs':>5s} {'p50':>9s} {'p90':>9s} {'p99':>9s} {'max':>9s}  ms")
+    for stage, stats in sorted(results['stages'].items(), key=lambda item: -item[1]['p50_ms']):
+        print(f"  {stage:22s} {stats['count']:5d} {stats['p50_ms']:9.3f} {stats['p90_ms']:9.3f} {stats['p99_ms']:9.3f} {stats['max_ms']:9.3f}")
+    if memory:
+        print(f"  {'query':62s} {'p50 ms':>8s} {'peak KiB':>9s} {'kept KiB':>9s} {'resp KiB':>9s}")
+        for query, stats in results['queries'].items():
+            print(f"  {query[:62]:62s} {stats['total']['p50_ms']:8.2f} {stats['peak_kib']:9.1f} {stats['retained_kib']:9.1f} {stats['response_kib']:9.1f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"results written to {args.output}")
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
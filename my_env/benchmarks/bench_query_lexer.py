@@ -0,0 +1,77 @@
+"""
+Query analysis cost: the previous per-handler extraction (extract_chemicals' 65 substring
+scans plus a re.findall, extract_topo_no's regex and the .lower() substring cascade of
+process_subquery) against one QueryLexer pass, on the suggested NGDR questions and a few
+compound ones. Also lists the queries where the two disagree (e.g. 'min' inside "mining").
+Run from the my_env directory:
+    python benchmarks/bench_query_lexer.py --repeat 2000
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import query_lexer
+from geo_chem import chemicals
+
+QUERIES = [
+    "Create a kriging map for copper for the toposheet number 55K14",
+    "Create a IDW map for al2o3 for the toposheet number 55P10",
+    "Tell me the maximum value for cu in the toposheet number 55K14",
+    "what is the max and min values for the concentrations of hg in toposheet number 55P02?",
+    "What is the maximum of gold for 55K14 and create a kriging map of copper and zinc for 55K14 and 55K15",
+    "show the mining areas of lead in 55K14",
+    "inverse distance weighted map of tin for plotting 55K15",
+    "minimum of nickel, chromium and cobalt in 55K14 above 100 ppm",
+]
+
+
+def legacy_parse(query):
+    # extract_chemicals + extract_topo_no + the intent checks of process_subquery, as they were
+    elements = []
+    lower_sentence = query.lower()
+    words = re.findall(r'\b\w+\b', lower_sentence)
+    for chemical, formula in chemicals.items():
+        if chemical.lower() in lower_sentence or formula.lower() in words:
+            elements.append(formula)
+    toposheets = re.findall(r'\b\d+[a-zA-Z]+\d+\b', query)
+    intents = []
+    if 'maximum' in query.lower() or 'max' in query.lower():
+        intents.append('max')
+    if 'minimum' in query.lower() or 'min' in query.lower():
+        intents.append('min')
+    if 'idw' in query.lower() or 'inverse distance weighted map' in query.lower():
+        intents.append('idw')
+    if 'kriging' in query.lower():
+        intents.append('kriging')
+    return intents, elements, toposheets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=2000)
+    args = parser.parse_args()
+
+    # handlers used to re-extract per call: one subquery ran extract_* about twice
+    lexer = query_lexer.QueryLexer(chemicals)
+    uncached = lexer._lex
+    for name, function in (('legacy extraction', legacy_parse), ('QueryLexer', uncached), ('QueryLexer, memoised', lexer.lex)):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for query in QUERIES:
+                function(query)
+        print(f"{name:22s} {(time.perf_counter() - start) * 1e6 / (args.repeat * len(QUERIES)):8.2f} us/query")
+
+    print("differences")
+    for query in QUERIES:
+        intents, elements, toposheets = legacy_parse(query)
+        parse = uncached(query)
+        if (sorted(intents), sorted(elements), list(dict.fromkeys(toposheets))) != (sorted(parse.intents), sorted(parse.elements), list(parse.toposheets)):
+            print(f"  {query!r}\n    legacy {intents} {elements}\n    lexer  {list(parse.intents)} {list(parse.elements)} {list(parse.constraints)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Backend load removed by the RAG answer cache.
+
+Replays a stream of RAG questions drawn from the suggested-question lists in
+templates/index.html (skewed towards the first questions, with case/whitespace/punctuation
+variations as users type them) through app.generate_response against the local stub server,
+once without the cache and once with it, and reports the hit ratio, the requests that reached
+the RAG server and the mean latency.
+Run from the my_env directory:
+    python benchmarks/bench_rag_cache.py --questions 500 --delay 0.05
+"""
+import argparse
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.rag_stub_server import start_stub_server
+from caches import TTLCache
+import rag_client
+
+TOPICS = {
+    'MMDR': 'mines_and_minerals_act',
+    'Auction_rules': 'Mineral_auction_rules_2015',
+    'Evidence_rules': 'Mines_and_minerals_evidence',
+}
+
+
+def suggested_questions():
+    template = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates', 'index.html')
+    with open(template, encoding='utf-8') as f:
+        html = f.read()
+    questions = []
+    for name, array in re.findall(r'const (\w+)_question_list = (\[.*?\])', html, re.DOTALL):
+        if name in TOPICS:
+            questions += [(TOPICS[name], question) for question in json.loads(re.sub(r',\s*\]', ']', array))]
+    return questions
+
+
+def question_stream(questions, count, seed):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(len(questions))]
+    variants = [lambda q: q, str.lower, lambda q: q.rstrip('?'), lambda q: '  ' + q.replace(' ', '  ') + ' ']
+    return [(topic, rng.choice(variants)(question)) for topic, question in rng.choices(questions, weights, k=count)]
+
+
+def replay(app, stream):
+    latencies = []
+    for topic, question in stream:
+        start = time.perf_counter()
+        app.generate_response(question, topic)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--questions', type=int, default=500)
+    parser.add_argument('--delay', type=float, default=0.05, help="server side seconds per answer")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server, url = start_stub_server(delay=args.delay)
+    rag_client.default_client = rag_client.RAGClient(url)
+    import app
+
+    questions = suggested_questions()
+    stream = question_stream(questions, args.questions, args.seed)
+    print(f"{len(questions)} suggested questions, {len(stream)} asked")
+
+    for name, cache in (('no cache', TTLCache(max_bytes=0, ttl_seconds=0)), ('TTL cache', TTLCache(max_bytes=16 * 1024 * 1024, ttl_seconds=3600))):
+        app.rag_answer_cache = cache
+        latencies = replay(app, stream)
+        stats = cache.stats()
+        backend = stats['misses']
+        print(f"{name:10s} hit ratio {stats['hit_ratio']:6.1%}   RAG server requests {backend:5d}   mean latency {statistics.mean(latencies):7.2f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
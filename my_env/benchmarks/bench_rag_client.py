@@ -0,0 +1,64 @@
+"""
+Round-trip latency to the RAG server: a bare requests.post per question (the previous
+generate_response) against the pooled keep-alive RAGClient, measured against the local stub
+server, sequentially and from several threads at once.
+Run from the my_env directory:
+    python benchmarks/bench_rag_client.py --requests 300 --threads 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from benchmarks.rag_stub_server import start_stub_server
+from rag_client import RAGClient
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+def run(ask, count, threads):
+    def timed(i):
+        start = time.perf_counter()
+        response = ask(f"question {i}")
+        response.json()
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = list(pool.map(timed, range(count)))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--delay', type=float, default=0.0, help="server side seconds per answer")
+    args = parser.parse_args()
+
+    server, url = start_stub_server(delay=args.delay)
+    client = RAGClient(url, pool_size=args.threads)
+    clients = {
+        'requests.post': lambda query: requests.post(url + '/chatbot', json={"query": query, "topic": "mines_and_minerals_act"}),
+        'RAGClient': lambda query: client.ask(query, "mines_and_minerals_act"),
+    }
+    for threads in (1, args.threads):
+        print(f"{threads} thread(s), {args.requests} requests")
+        for name, ask in clients.items():
+            run(ask, 10, threads)  # warm-up
+            latencies, elapsed = run(ask, args.requests, threads)
+            print(f"  {name:14s} p50 {statistics.median(latencies):7.2f} ms   p95 {percentile(latencies, 95):7.2f} ms   {args.requests / elapsed:8.1f} req/s")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
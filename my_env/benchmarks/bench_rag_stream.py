@@ -0,0 +1,64 @@
+"""
+Time to first token of a RAG answer: /get_response_rag (the whole answer as JSON) against
+/get_response_rag_stream (formatted text forwarded as the RAG server generates it), with the
+local stub server emitting one word every --token-delay seconds after --delay seconds of
+retrieval. The answer cache is disabled so every question reaches the stub.
+Run from the my_env directory:
+    python benchmarks/bench_rag_stream.py --delay 0.2 --token-delay 0.02 --repeat 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.rag_stub_server import DEFAULT_ANSWER, start_stub_server
+from caches import TTLCache
+import rag_client
+
+
+def timed_request(client, route):
+    # (time to first non-empty body chunk, total time, body) in ms
+    start = time.perf_counter()
+    first = None
+    body = ''
+    response = client.post(route, json={"query": "What is the Mines and Minerals Act 1957?", "topic": "mines_and_minerals_act"}, buffered=False)
+    for chunk in response.response:
+        if chunk and first is None:
+            first = (time.perf_counter() - start) * 1000
+        body += chunk.decode('utf-8') if isinstance(chunk, bytes) else chunk
+    response.close()
+    return first, (time.perf_counter() - start) * 1000, body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--delay', type=float, default=0.2, help="stub seconds before the first word")
+    parser.add_argument('--token-delay', type=float, default=0.02, help="stub seconds between words")
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    server, url = start_stub_server(delay=args.delay, token_delay=args.token_delay)
+    rag_client.default_client = rag_client.RAGClient(url)
+    import app
+    app.rag_answer_cache = TTLCache(max_bytes=0, ttl_seconds=0)
+    client = app.app.test_client()
+
+    expected = rag_client.format_answer(DEFAULT_ANSWER)
+    print(f"answer of {len(DEFAULT_ANSWER.split())} words, {args.delay * 1000:.0f} ms retrieval, {args.token_delay * 1000:.0f} ms per word")
+    for name, route in (('JSON', '/get_response_rag'), ('stream', '/get_response_rag_stream')):
+        firsts, totals = [], []
+        for _ in range(args.repeat):
+            first, total, body = timed_request(client, route)
+            firsts.append(first)
+            totals.append(total)
+        if route.endswith('stream'):
+            assert body == expected, body
+        print(f"  {name:7s} time to first token {statistics.median(firsts):8.1f} ms   full answer {statistics.median(totals):8.1f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Per-query latency of geo_chem.split_query_smartly before and after the shared NLP engine.
+
+Run from the my_env directory:
+    python benchmarks/bench_split_query.py --repeat 20
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import nlp_engine
+from geo_chem import split_query_smartly
+
+
+QUERIES = [
+    "Create a kriging map for copper for the toposheet number 55K14",
+    "Create a IDW map for al2o3 for the toposheet number 55P10",
+    "Tell me the maximum value for cu in the toposheet number 55K14",
+    "what is the max and min values for the concentrations of hg in toposheet number 55P02?",
+    "Tell me the maximum of gold and also create a kriging map of copper for 55K14",
+]
+
+
+def time_split(nlp_factory, repeat):
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            start = time.perf_counter()
+            split_query_smartly(query, nlp=nlp_factory())
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[int(0.95 * (len(timings) - 1))]
+    print(f"{name:<34} mean {statistics.mean(timings):9.3f} ms   median {statistics.median(timings):9.3f} ms   p95 {p95:9.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    # before: the full pipeline is loaded and run for every request
+    report("before (spacy.load per query)", time_split(lambda: nlp_engine.NLPEngine(mode="pipeline", exclude=[]), max(1, args.repeat // 10)))
+
+    pipeline_engine = nlp_engine.NLPEngine(mode="pipeline")
+    pipeline_engine.load()
+    report("shared engine, pipeline mode", time_split(lambda: pipeline_engine, args.repeat))
+
+    tokenizer_engine = nlp_engine.NLPEngine(mode="tokenizer")
+    tokenizer_engine.load()
+    report("shared engine, tokenizer mode", time_split(lambda: tokenizer_engine, args.repeat))
+
+    # the split itself has to be unchanged by the fast path
+    for query in QUERIES:
+        assert split_query_smartly(query, nlp=pipeline_engine) == split_query_smartly(query, nlp=tokenizer_engine)
+
+
+if __name__ == "__main__":
+    main()
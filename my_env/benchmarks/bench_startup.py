@@ -0,0 +1,130 @@
+"""
+Worker cold start: import time of app.py and latency of the first answers, in fresh interpreters.
+
+Every run starts a new Python process (STARTUP_WARM_UP=lazy, so nothing loads behind the
+measurement) that imports app and then answers, in order, a min/max question (text path),
+an IDW map, a kriging map and a split compound query. The report shows the median of each
+step and the heavy packages loaded after it, followed by an import-time report of
+"import app" (python -X importtime) grouped by top level package.
+
+The budget checks fail the run (exit status 1) when the median import or first text answer is
+slower than --import-budget-ms / --text-budget-ms, or when importing app and answering the text
+question loads any of the --forbid packages.
+Run from the my_env directory:
+    python benchmarks/bench_startup.py --repeat 5
+    python benchmarks/bench_startup.py --repeat 5 --import-budget-ms 800 --text-budget-ms 1000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+MY_ENV = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_PACKAGES = ['pandas', 'scipy', 'pykrige', 'spacy', 'matplotlib', 'plotly', 'sklearn']
+TEXT_PATH_FORBIDDEN = ['scipy', 'pykrige', 'spacy', 'matplotlib', 'plotly']
+
+STEPS = [
+    ('text', "maximum of gold in 55K14"),
+    ('idw_map', "idw map of zinc in 55K14"),
+    ('kriging_map', "kriging map of copper in 55K14"),
+    ('split', "what is the minimum of lead for 55K14 and create a kriging map of nickel for 55K15"),
+]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import app
+import geo_chem
+timings = {'import': (time.perf_counter() - start) * 1000}
+loaded = {'import': [name for name in HEAVY if name in sys.modules]}
+for step, query in STEPS:
+    start = time.perf_counter()
+    geo_chem.generate_geochemistry_response(query)
+    timings[step] = (time.perf_counter() - start) * 1000
+    loaded[step] = [name for name in HEAVY if name in sys.modules]
+print(json.dumps({'timings': timings, 'loaded': loaded}))
+"""
+
+
+def child_environment():
+    return dict(os.environ, STARTUP_WARM_UP='lazy', PYTHONDONTWRITEBYTECODE='1')
+
+
+def run_child():
+    code = f"HEAVY = {HEAVY_PACKAGES!r}\nSTEPS = {STEPS!r}\n" + CHILD
+    result = subprocess.run([sys.executable, '-c', code], cwd=MY_ENV, env=child_environment(), capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def import_time_report(top):
+    """
+    (self time per top level package, slowest modules by cumulative time) of "import app", in ms.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=MY_ENV, env=child_environment(), capture_output=True, text=True, check=True)
+    packages = {}
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        package = name.split('.')[0]
+        packages[package] = packages.get(package, 0.0) + int(own) / 1000
+        modules.append((int(cumulative) / 1000, name))
+    by_package = sorted(packages.items(), key=lambda item: -item[1])[:top]
+    slowest = sorted(modules, reverse=True)[:top]
+    return by_package, slowest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help="rows of the import-time report")
+    parser.add_argument('--import-budget-ms', type=float, help="fail when importing app takes longer (median)")
+    parser.add_argument('--text-budget-ms', type=float, help="fail when the first min/max answer takes longer (median)")
+    parser.add_argument('--forbid', nargs='*', default=TEXT_PATH_FORBIDDEN, help="packages the import and text path must not load")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    runs = [run_child() for _ in range(args.repeat)]
+    steps = ['import'] + [step for step, _ in STEPS]
+    medians = {step: statistics.median(run['timings'][step] for run in runs) for step in steps}
+    loaded = runs[-1]['loaded']
+
+    print(f"cold start over {args.repeat} fresh interpreters (STARTUP_WARM_UP=lazy)")
+    print(f"  {'step':12s} {'median ms':>10s} {'min ms':>9s} {'max ms':>9s}  heavy packages loaded")
+    for step in steps:
+        samples = [run['timings'][step] for run in runs]
+        print(f"  {step:12s} {medians[step]:10.1f} {min(samples):9.1f} {max(samples):9.1f}  {', '.join(loaded[step]) or '-'}")
+
+    by_package, slowest = import_time_report(args.top)
+    print("\nimport app, self time by top level package")
+    for package, milliseconds in by_package:
+        print(f"  {package:40s} {milliseconds:8.1f} ms")
+    print("\nimport app, slowest modules (cumulative)")
+    for milliseconds, name in slowest:
+        print(f"  {name:40s} {milliseconds:8.1f} ms")
+
+    failures = []
+    if args.import_budget_ms is not None and medians['import'] > args.import_budget_ms:
+        failures.append(f"import app {medians['import']:.1f} ms > budget {args.import_budget_ms:.1f} ms")
+    if args.text_budget_ms is not None and medians['text'] > args.text_budget_ms:
+        failures.append(f"first text answer {medians['text']:.1f} ms > budget {args.text_budget_ms:.1f} ms")
+    forbidden = [name for name in args.forbid if name in loaded['text']]
+    if forbidden:
+        failures.append(f"the text path loaded {', '.join(forbidden)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'repeat': args.repeat, 'median_ms': medians, 'loaded': loaded, 'import_by_package_ms': dict(by_package), 'failures': failures}, f, indent=2)
+        print(f"results written to {args.output}")
+    if failures:
+        print("\nBUDGET EXCEEDED\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
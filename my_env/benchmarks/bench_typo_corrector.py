@@ -0,0 +1,138 @@
+"""
+Typo correction: the previous correct_typos (Jaccard similarity of every query word against
+every entry of word_list, computed twice for the candidates) against the SymSpell
+TypoCorrector over word_list and the chemical names, on a corpus of misspelled queries.
+
+Reports time per query and how many of the corpus' expected words each version produces (the
+misspelled words fixed and the English words near a chemical name left alone), and
+the SymSpell lookup time as the vocabulary grows.
+Run from the my_env directory:
+    python benchmarks/bench_typo_corrector.py --repeat 20
+"""
+import argparse
+import os
+import random
+import statistics
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import textdistance
+
+import typo_corrector
+from geo_chem import chemicals, corrector, word_list
+
+# (query as typed, words it should contain after correction)
+CORPUS = [
+    ("Create a krigging map for coper for the toposheet number 55K14", ["kriging", "copper"]),
+    ("Create a kriging map for copper for the toposheet number 55K14", ["kriging", "copper"]),
+    ("Tell me the maximun value for cu in the toposheet number 55K14", ["maximum"]),
+    ("what is the max and min values for the concentrations of hg in toposheet number 55P02?", ["concentration"]),
+    ("Create a IDW map for al2o3 for the toposheet number 55P10", ["al2o3"]),
+    ("krigging map of nikel in 55k14", ["kriging", "nickel", "55K14"]),
+    ("maxmum of zinc and cromium in 55k15", ["maximum", "chromium", "55K15"]),
+    ("minimun value of arsenc for toposheet 55P02", ["minimum", "arsenic"]),
+    ("show the minimum of magnesum oxide in 55K14", ["magnesium"]),
+    ("interpolaton map of vanadum for 55K14", ["interpolation", "vanadium"]),
+    ("inverse distnce weigted map of strontum in 55K14", ["distance", "weighted", "strontium"]),
+    ("maximum concentraton of zirconum in toposheet 55K14", ["concentration", "zirconium"]),
+    ("krigging of lithum for toposheet 55P10", ["kriging", "lithium"]),
+    ("give the minimum of berylium in toposhet 55K15", ["beryllium", "toposheet"]),
+    ("maximum of molybdnum in 55K14", ["molybdenum"]),
+    ("idw map of tungstn for 55P10", ["tungsten"]),
+    ("kriging map for antimoney in 55K14", ["antimony"]),
+    ("max of seleniun and bismth for 55K14", ["selenium", "bismuth"]),
+    ("maximum of lanthnum and ceriun in 55P02", ["lanthanum", "cerium"]),
+    ("the minimum of ytterbum in 55K14", ["ytterbium"]),
+    ("maximum longitde and lattitude of gold in 55K14", ["longitude", "latitude"]),
+    ("krging map of chromum for toposheet 55K15", ["kriging", "chromium"]),
+    ("maximum of phosphorus pentoxde in 55K14", ["pentoxide"]),
+    ("kriging map for titanum dioxide in 55K14", ["titanium"]),
+    ("idw map of potasium oxide for 55P10", ["potassium"]),
+    ("max of galium in 55K14", ["gallium"]),
+    ("minimum of scandum in 55K14", ["scandium"]),
+    ("maximum of rubidum in 55K14", ["rubidium"]),
+    ("kriging map of niobum in 55K15", ["niobium"]),
+    ("maximum of thallum and cadmum in 55K14", ["thallium", "cadmium"]),
+    # English words one edit away from an element or query word, kept as typed
+    ("read the maximum of cu for 55K14", ["read", "maximum"]),
+    ("head and load values of zinc in 55K15", ["head", "load"]),
+    ("sold or fold the minimum of ni in 55K14", ["sold", "fold"]),
+    ("here are the maximum values, were they in 55P02", ["here", "were"]),
+    ("is there a good kriging map of fe2o3 for 55K14", ["there", "good"]),
+    ("the medium concentration of cu in 55K14", ["medium", "concentration"]),
+    ("maximum of fluorite and trioxide in 55K14", ["fluorite", "trioxide"]),
+]
+
+
+def correct_typos_jaccard(text, threshold=0.5):
+    # geo_chem.correct_typos before the SymSpell index
+    corrected_text = []
+    for word in text.split():
+        suggestions = [w for w in word_list if textdistance.jaccard.normalized_similarity(w, word) >= threshold]
+        if suggestions:
+            corrected_word = max(suggestions, key=lambda x: textdistance.jaccard.normalized_similarity(x, word))
+        else:
+            corrected_word = word
+        corrected_text.append(corrected_word)
+    return ' '.join(corrected_text)
+
+
+def measure(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for query, _ in CORPUS:
+            function(query)
+        timings.append((time.perf_counter() - start) * 1e6 / len(CORPUS))
+    return statistics.median(timings)
+
+
+def fixed(function):
+    found = total = 0
+    for query, expected in CORPUS:
+        words = function(query).split()
+        found += sum(word in words for word in expected)
+        total += len(expected)
+    return found, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    # the shared corrector memoises words, one without the memo measures the index itself
+    symspell = typo_corrector.TypoCorrector(word_list + list(chemicals.keys()))
+    symspell.correct_word = symspell._correct_word
+    versions = {
+        'Jaccard scan': correct_typos_jaccard,
+        'SymSpell': symspell.correct,
+        'SymSpell, memoised': corrector.correct,
+    }
+    print(f"{len(CORPUS)} queries, vocabulary of {len(symspell.index)} words")
+    for name, function in versions.items():
+        found, total = fixed(function)
+        print(f"  {name:20s} {measure(function, args.repeat):9.1f} us/query   expected words present {found}/{total}")
+
+    print("SymSpell lookup time as the vocabulary grows")
+    rng = random.Random(0)
+    words = [query.split() for query, _ in CORPUS]
+    for extra in (0, 1000, 10000):
+        vocabulary = word_list + list(chemicals.keys()) + [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 12))) for _ in range(extra)]
+        grown = typo_corrector.TypoCorrector(vocabulary)
+        grown.correct_word = grown._correct_word
+        start = time.perf_counter()
+        count = 0
+        for _ in range(args.repeat):
+            for query in words:
+                for word in query:
+                    grown.correct_word(word)
+                    count += 1
+        print(f"  {len(grown.index):6d} words   {(time.perf_counter() - start) * 1e6 / count:7.1f} us/word")
+
+
+if __name__ == "__main__":
+    main()
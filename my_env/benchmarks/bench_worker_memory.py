@@ -0,0 +1,202 @@
+"""
+Memory of gunicorn with N workers, each holding its own copy of the dataset (SHARED_DATASET=0)
+or mapping the segment the master shares (SHARED_DATASET=1, see gunicorn.conf.py).
+
+For every worker count and mode a gunicorn is started with STARTUP_WARM_UP=eager, so every worker
+has loaded the dataset (and the spaCy tokenizer, the same in both modes) before it serves. Once
+the server answers and the workers' memory has settled, a few min/max and IDW requests are sent,
+then /proc/<pid>/smaps is read for the master and every worker:
+
+    PSS   proportional set size, shared pages divided between the processes mapping them
+    USS   private pages, freed when the worker exits
+
+Total is the PSS of all processes, with the shared segment counted once at its full size
+(it sits in /dev/shm whether mapped or not). --scale tiles the CSV to see how the per worker
+cost grows with the dataset. Linux only.
+Run from the my_env directory:
+    python benchmarks/bench_worker_memory.py --workers 1 2 4 8
+    python benchmarks/bench_worker_memory.py --workers 1 4 --scale 20
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+MY_ENV = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, MY_ENV)
+
+# min/max answers and IDW maps read the dataset without filling the per worker kriging caches
+REQUESTS = [
+    "maximum of gold in 55K14",
+    "minimum of copper and zinc in 55K15",
+    "idw map of nickel in 55K14",
+    "idw map of lead in 55P02",
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def children(pid):
+    try:
+        with open(f'/proc/{pid}/task/{pid}/children') as f:
+            return [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def smaps(pid, segment=None):
+    # {'pss', 'uss', 'segment_pss'} in bytes
+    memory = {'pss': 0, 'uss': 0, 'segment_pss': 0}
+    in_segment = False
+    with open(f'/proc/{pid}/smaps') as f:
+        for line in f:
+            fields = line.split()
+            if not fields[0].endswith(':'):
+                # a mapping header: address perms offset dev inode [path]
+                in_segment = segment is not None and len(fields) >= 6 and fields[5] == segment
+                continue
+            kib = int(fields[1]) * 1024 if len(fields) > 1 and fields[1].isdigit() else 0
+            if fields[0] == 'Pss:':
+                memory['pss'] += kib
+                if in_segment:
+                    memory['segment_pss'] += kib
+            elif fields[0] in ('Private_Clean:', 'Private_Dirty:'):
+                memory['uss'] += kib
+    return memory
+
+
+def post(port, query):
+    request = urllib.request.Request(f'http://127.0.0.1:{port}/get_response_ngdr', data=json.dumps({'query': query}).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return response.read()
+
+
+def wait_until_ready(process, port, workers, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/metrics', timeout=5):
+                pass
+            if len(children(process.pid)) >= workers:
+                break
+        except OSError:
+            pass
+        time.sleep(0.5)
+    else:
+        raise RuntimeError("gunicorn did not start in time")
+    # booting workers keep growing, wait until two readings a second apart agree within 1%
+    previous = None
+    while time.time() < deadline:
+        current = sum(smaps(pid)['pss'] for pid in children(process.pid))
+        if previous and abs(current - previous) < 0.01 * previous:
+            return
+        previous = current
+        time.sleep(1.0)
+
+
+def measure(workers, shared, environment, timeout):
+    port = free_port()
+    env = dict(environment, SHARED_DATASET='1' if shared else '0', STARTUP_WARM_UP='eager', WEB_CONCURRENCY=str(workers))
+    env.pop('NGDR_SHARED_DATASET', None)
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-b', f'127.0.0.1:{port}', 'app:app'],
+                               cwd=MY_ENV, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready(process, port, workers, timeout)
+        for _ in range(workers):
+            for query in REQUESTS:
+                post(port, query)
+        segment = None
+        segment_bytes = 0
+        if shared:
+            segments = [name for name in os.listdir('/dev/shm') if name == f'ngdr-dataset-{process.pid}.bin']
+            if segments:
+                segment = os.path.join('/dev/shm', segments[0])
+                segment_bytes = os.path.getsize(segment)
+        master = smaps(process.pid, segment)
+        per_worker = [smaps(pid, segment) for pid in children(process.pid)]
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    everything = [master] + per_worker
+    total = sum(memory['pss'] - memory['segment_pss'] for memory in everything) + segment_bytes
+    return {
+        'workers': len(per_worker),
+        'master_pss_mib': master['pss'] / 2 ** 20,
+        'worker_pss_mib': sum(memory['pss'] for memory in per_worker) / len(per_worker) / 2 ** 20,
+        'worker_uss_mib': sum(memory['uss'] for memory in per_worker) / len(per_worker) / 2 ** 20,
+        'segment_mib': segment_bytes / 2 ** 20,
+        'total_mib': total / 2 ** 20,
+    }
+
+
+def tiled_csv(scale, directory):
+    # the dataset repeated scale times, toposheets and statistics stay the same
+    import pandas as pd
+    import geo_chem
+    df = pd.read_csv(geo_chem.csv_file_path)
+    path = os.path.join(directory, f'NGDR_Nagpur_x{scale}.csv')
+    pd.concat([df] * scale, ignore_index=True).to_csv(path, index=False)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--scale', type=int, default=1, help="tile the dataset this many times")
+    parser.add_argument('--timeout', type=float, default=300, help="seconds to wait for a server to start")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    environment = dict(os.environ)
+    directory = None
+    if args.scale > 1:
+        import dataset_store
+        directory = tempfile.mkdtemp(prefix='ngdr-memory-')
+        environment['NGDR_DATASET_CSV'] = tiled_csv(args.scale, directory)
+        # converted here once, not raced by the workers of the first server
+        dataset_store.ensure_store(environment['NGDR_DATASET_CSV'])
+
+    results = []
+    try:
+        print(f"dataset x{args.scale}")
+        print(f"  {'mode':8s} {'workers':>7s} {'master PSS':>11s} {'worker PSS':>11s} {'worker USS':>11s} {'segment':>8s} {'total':>9s}  MiB")
+        for shared in (False, True):
+            for workers in args.workers:
+                result = dict(measure(workers, shared, environment, args.timeout), mode='shared' if shared else 'private')
+                results.append(result)
+                print(f"  {result['mode']:8s} {result['workers']:7d} {result['master_pss_mib']:11.1f} {result['worker_pss_mib']:11.1f} "
+                      f"{result['worker_uss_mib']:11.1f} {result['segment_mib']:8.1f} {result['total_mib']:9.1f}")
+    finally:
+        if directory:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    if len(args.workers) > 1:
+        low, high = min(args.workers), max(args.workers)
+        print(f"\ncost of one more worker, from {low} to {high} workers")
+        for mode in ('private', 'shared'):
+            totals = {result['workers']: result['total_mib'] for result in results if result['mode'] == mode}
+            if low in totals and high in totals:
+                print(f"  {mode:8s} {(totals[high] - totals[low]) / (high - low):8.1f} MiB")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'scale': args.scale, 'results': results}, f, indent=2)
+        print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Local stand-in for the RAG server used by the RAG benchmarks.
+
+POST /chatbot answers {"answer": ...} after an optional delay, over HTTP/1.1 keep-alive like
+a real deployment behind a proxy. A request with "stream": true gets the answer as chunked
+text instead, one word every token_delay seconds, the way a generating model emits it.
+Run it on its own to point the app at it:
+    python benchmarks/rag_stub_server.py --port 8765 --token-delay 0.02
+    SERVER_URL=http://127.0.0.1:8765 python app.py
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+DEFAULT_ANSWER = ("**Section 4** of the Act says:\n* no person shall undertake reconnaissance, prospecting or mining operations "
+                  "except under a licence or lease\n- the licence is granted by the State Government")
+
+
+def make_handler(answer, delay, token_delay):
+
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # headers and body are separate writes, without TCP_NODELAY keep-alive requests stall on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            request = json.loads(body or b'{}')
+            if delay:
+                time.sleep(delay)
+            if request.get("stream"):
+                self.stream_answer()
+                return
+            # a non-streaming server only answers once the whole text is generated
+            time.sleep(token_delay * len(re.findall(r'\s*\S+', answer)))
+            data = json.dumps({"answer": answer, "query": request.get("query")}).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def stream_answer(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for token in re.findall(r'\s*\S+', answer):
+                if token_delay:
+                    time.sleep(token_delay)
+                data = token.encode('utf-8')
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+
+    return StubHandler
+
+
+def start_stub_server(port=0, answer=DEFAULT_ANSWER, delay=0.0, token_delay=0.0):
+    # serves in a daemon thread, returns (server, base url)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(answer, delay, token_delay))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds before every answer")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="seconds between the words of a streamed answer")
+    args = parser.parse_args()
+    server, url = start_stub_server(args.port, delay=args.delay, token_delay=args.token_delay)
+    print(f"RAG stub server on {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
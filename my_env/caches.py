@@ -0,0 +1,132 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def estimate_size(obj):
+    # rough in-memory size of a cached value, numpy buffers dominate for map results
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return sys.getsizeof(obj) + sum(estimate_size(item) for item in obj)
+    return sys.getsizeof(obj)
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by the total estimated size of its values.
+    """
+
+    def __init__(self, max_bytes, sizeof=estimate_size):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            # never cache something that would flush the whole cache on its own
+            return False
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "current_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class TTLCache(LRUCache):
+    """
+    LRUCache whose entries also expire ttl_seconds after they were stored.
+    Expired entries are dropped when they are looked up and count as misses.
+    """
+
+    def __init__(self, max_bytes, ttl_seconds, sizeof=estimate_size, clock=time.monotonic):
+        # stored values are (value, expires_at), only the value counts towards max_bytes
+        super().__init__(max_bytes, sizeof=lambda entry: sizeof(entry[0]))
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.expirations = 0
+
+    def _expired(self, key, entry):
+        # caller holds the lock
+        if entry[0][1] > self.clock():
+            return False
+        del self._entries[key]
+        self.current_bytes -= entry[1]
+        self.expirations += 1
+        return True
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(key, entry):
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0][0]
+
+    def put(self, key, value):
+        return super().put(key, (value, self.clock() + self.ttl_seconds))
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(key, entry)
+
+    def stats(self):
+        stats = super().stats()
+        stats["expirations"] = self.expirations
+        stats["ttl_seconds"] = self.ttl_seconds
+        return stats
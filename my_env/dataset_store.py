@@ -0,0 +1,207 @@
+"""
+Columnar on-disk store for the NGDR geochemistry tables.
+
+Every column of the CSV is saved as its own .npy file next to a manifest.json, so a
+worker can memory-map only the columns it needs instead of parsing the whole CSV.
+
+Each conversion writes a new version directory inside the store (NGDR_Nagpur.columns/v<n>)
+and its manifest last, through os.replace, so the newest version with a manifest is the current
+one and readers never see a half written store. Conversions run one at a time under a lock on
+NGDR_Nagpur.columns.lock (fcntl, or msvcrt on Windows) and keep the previous version for readers
+that picked it just before the new one appeared. Only os.replace and a lock file are needed, so
+the store works the same on Windows.
+
+Convert a CSV once (it is also done automatically on first load):
+    python dataset_store.py NGDR_Nagpur.csv
+"""
+import contextlib
+import json
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+
+
+MANIFEST = 'manifest.json'
+STORE_VERSION = 1
+
+# WKT strings are never used by the chatbot and are by far the largest column
+DROP_COLUMNS = ('geometry',)
+
+
+def default_store_dir(csv_path):
+    return os.path.splitext(csv_path)[0] + '.columns'
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {'path': os.path.basename(csv_path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _column_array(series):
+    if series.dtype.kind in 'biuf':
+        return series.to_numpy()
+    # text columns become fixed width unicode so they can be memory-mapped too
+    return series.fillna('').astype(str).to_numpy(dtype=str)
+
+
+@contextlib.contextmanager
+def conversion_lock(store_dir):
+    # exclusive lock on <store_dir>.lock, held by one converting process at a time
+    with open(f"{store_dir}.lock", 'a') as lock_file:
+        if os.name == 'nt':
+            import msvcrt
+            lock_file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after ten seconds, a long conversion is still running
+                    continue
+            try:
+                yield
+            finally:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def convert_csv(csv_path, store_dir=None, drop_columns=DROP_COLUMNS):
+    store_dir = store_dir or default_store_dir(csv_path)
+    with conversion_lock(store_dir):
+        return _convert_csv(csv_path, store_dir, drop_columns)
+
+
+def _convert_csv(csv_path, store_dir, drop_columns=DROP_COLUMNS):
+    # caller holds the conversion lock
+    import pandas as pd
+    df = pd.read_csv(csv_path)
+    df = df.drop(columns=[column for column in drop_columns if column in df.columns])
+
+    if os.path.islink(store_dir):
+        # a symlink to a sibling version directory, the earlier layout
+        target = os.path.realpath(store_dir)
+        os.remove(store_dir)
+        shutil.rmtree(target, ignore_errors=True)
+    elif os.path.isfile(os.path.join(store_dir, MANIFEST)):
+        # a store from before versions, its columns sit directly in the directory
+        shutil.rmtree(store_dir, ignore_errors=True)
+    version_dir = os.path.join(store_dir, f"v{time.time_ns()}")
+    os.makedirs(version_dir)
+    columns = {}
+    for position, column in enumerate(df.columns):
+        array = _column_array(df[column])
+        file_name = f"{position:03d}.npy"
+        np.save(os.path.join(version_dir, file_name), array, allow_pickle=False)
+        columns[column] = {'file': file_name, 'dtype': array.dtype.str}
+    manifest = {
+        'version': STORE_VERSION,
+        'rows': len(df),
+        'columns': columns,
+        'source': _source_signature(csv_path),
+    }
+    # the manifest publishes the version, it appears complete or not at all
+    tmp_path = os.path.join(version_dir, MANIFEST + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, os.path.join(version_dir, MANIFEST))
+    _remove_old_versions(store_dir, keep=2)
+    return store_dir
+
+
+def _versions(store_dir, complete=True):
+    # version directories, newest first; complete ones have their manifest
+    try:
+        names = [name for name in os.listdir(store_dir) if name.startswith('v') and name[1:].isdigit()]
+    except OSError:
+        return []
+    names.sort(key=lambda name: int(name[1:]), reverse=True)
+    if complete:
+        names = [name for name in names if os.path.isfile(os.path.join(store_dir, name, MANIFEST))]
+    return [os.path.join(store_dir, name) for name in names]
+
+
+def _remove_old_versions(store_dir, keep):
+    # the newest versions stay, older ones and versions left half written by a crash are removed
+    # (files still memory-mapped keep their data on POSIX, on Windows they stay until the next conversion)
+    kept = set(_versions(store_dir)[:keep])
+    for version_dir in _versions(store_dir, complete=False):
+        if version_dir not in kept:
+            shutil.rmtree(version_dir, ignore_errors=True)
+
+
+def current_version(store_dir):
+    versions = _versions(store_dir)
+    if not versions:
+        raise FileNotFoundError(f"No converted dataset in {store_dir}")
+    return versions[0]
+
+
+def read_manifest(version_dir):
+    with open(os.path.join(version_dir, MANIFEST)) as f:
+        return json.load(f)
+
+
+def is_stale(store_dir, csv_path):
+    try:
+        manifest = read_manifest(current_version(store_dir))
+    except (OSError, ValueError):
+        return True
+    if manifest.get('version') != STORE_VERSION:
+        return True
+    return os.path.exists(csv_path) and manifest['source'] != _source_signature(csv_path)
+
+
+def ensure_store(csv_path, store_dir=None):
+    store_dir = store_dir or default_store_dir(csv_path)
+    if is_stale(store_dir, csv_path):
+        with conversion_lock(store_dir):
+            # another worker may have converted it while this one waited for the lock
+            if is_stale(store_dir, csv_path):
+                _convert_csv(csv_path, store_dir)
+    return store_dir
+
+
+def load_columns(store_dir, columns=None, mmap=True):
+    # returns {column: array}; with mmap the arrays are read-only views of the files
+    return _load_columns(current_version(store_dir), columns, mmap)
+
+
+def _load_columns(version_dir, columns=None, mmap=True):
+    manifest = read_manifest(version_dir)
+    available = manifest['columns']
+    if columns is None:
+        columns = list(available)
+    missing = [column for column in columns if column not in available]
+    if missing:
+        raise KeyError(f"Columns not in the dataset store: {missing}")
+    mmap_mode = 'r' if mmap else None
+    return {column: np.load(os.path.join(version_dir, available[column]['file']), mmap_mode=mmap_mode, allow_pickle=False) for column in columns}
+
+
+def load_frame(csv_path, columns=None, store_dir=None):
+    # DataFrame with only the requested columns, converting the CSV first if needed
+    import pandas as pd
+    # one version is read throughout, even if a conversion publishes a newer one meanwhile
+    version_dir = current_version(ensure_store(csv_path, store_dir))
+    if columns is not None:
+        available = read_manifest(version_dir)['columns']
+        columns = [column for column in columns if column in available]
+    return pd.DataFrame(_load_columns(version_dir, columns))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        print(f"{path} -> {convert_csv(path)}")
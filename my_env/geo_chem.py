@@ -1,45 +1,46 @@
-import pandas as pd
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import spacy
-import plotly.graph_objects as go
-from pykrige.ok import OrdinaryKriging
-from scipy.interpolate import griddata
-import base64
+import functools
+import inspect
+import logging
 import os
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+# scipy/PyKrige (kriging_engine, idw_engine, triangulation_cache), pandas (dataset_store) and
+# spaCy (nlp_engine) are imported by the code paths that use them, so that importing this module
+# and answering min/max questions never loads them
+import nlp_engine
+import map_payload
+from caches import LRUCache
+from stats_index import StatsIndex
+import dataset_store
+import shared_dataset
 
 
 # Get the directory of the current Python file
 script_dir = os.path.dirname(__file__)
 
-# Construct the relative path to the CSV file (assuming it's in the same directory)
-csv_file_path = os.path.join(script_dir, 'NGDR_Nagpur.csv')
-Nagpur_gdf = pd.read_csv(csv_file_path)
-# Nagpur_gdf.fillna(0.0, inplace=True)
+# Construct the relative path to the CSV file (assuming it's in the same directory),
+# NGDR_DATASET_CSV points at another copy of the data (benchmarks use a larger one)
+csv_file_path = os.getenv('NGDR_DATASET_CSV') or os.path.join(script_dir, 'NGDR_Nagpur.csv')
 
-import textdistance
+import intent_router
+import metrics
+import profiling
+import query_lexer
+import typo_corrector
 word_list = ["kriging","concentration","toposheet","interpolation","inverse distance weighted","idw","maximum","minimum","longitude","latitude","aluminum"]
+@metrics.timed_stage('correct_typos')
 def correct_typos(text, threshold=0.5):
-    corrected_text = []
-    words = text.split()
-    for word in words:
-        # Check if the word is misspelled
-        suggestions = [w for w in word_list if textdistance.jaccard.normalized_similarity(w, word) >= threshold]
-        if suggestions:
-            corrected_word = max(suggestions, key=lambda x: textdistance.jaccard.normalized_similarity(x, word))
-        else:
-            corrected_word = word
-        corrected_text.append(corrected_word)
-    return ' '.join(corrected_text)
+    # SymSpell index over word_list and the chemical names, built once below the chemicals dict
+    # (threshold is kept for callers of the old Jaccard version and no longer used)
+    return corrector.correct(text)
 
 
 # In[5]:
 
 
-import re
-
 # Dictionary of chemical names and their formulas
 chemicals = {
    'silicon dioxide': 'sio2',
@@ -110,152 +111,262 @@ chemicals = {
     # Add more chemicals as needed
 }
 
+# Typo correction over the intent words and every chemical name
+corrector = typo_corrector.TypoCorrector(word_list + list(chemicals.keys()))
+
+# One compiled pass finds the intents, elements, toposheets and numeric constraints of a query
+lexer = query_lexer.QueryLexer(chemicals)
+
+
+@metrics.timed_stage('parse_query')
+def parse_query(query):
+    # handlers accept either the query text or its QueryParse, parsing happens once
+    if isinstance(query, query_lexer.QueryParse):
+        return query
+    return lexer.lex(query)
+
+
+# Only the columns the chatbot queries are read, from the columnar store built out of the CSV
+DATASET_COLUMNS = ['longitude', 'latitude', 'toposheet'] + list(chemicals.values())
+
+# (Nagpur_gdf, Nagpur_stats), read on first use instead of at import
+_dataset = None
+_dataset_lock = threading.Lock()
+# A replaced CSV is picked up by the first request DATASET_RELOAD_CHECK_SECONDS after the change
+# (0 turns the check off); gunicorn workers share the master's copy and are restarted instead
+DATASET_RELOAD_CHECK_SECONDS = float(os.getenv('DATASET_RELOAD_CHECK_SECONDS', '30'))
+# (size, mtime_ns) of the CSV the loaded samples were read from, None when they came from a segment
+_dataset_source = None
+_next_reload_check = 0.0
+
+
+def _csv_signature():
+    try:
+        stat = os.stat(csv_file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_dataset_from_store():
+    df = dataset_store.load_frame(csv_file_path, columns=DATASET_COLUMNS)
+    # Nagpur_gdf.fillna(0.0, inplace=True)
+    # Min/max/count/mean/median for every (toposheet, element) pair, built once at load
+    return df, StatsIndex(df, chemicals.values())
+
+
+def _read_dataset():
+    segment = os.getenv(shared_dataset.SEGMENT_ENV)
+    if segment:
+        # a gunicorn worker: read-only views of the segment the master created (gunicorn.conf.py),
+        # a new CSV is picked up by restarting gunicorn
+        return shared_dataset.attach(segment)
+    global _dataset_source
+    # taken before the read, a CSV written during it is read again on the next check
+    _dataset_source = _csv_signature()
+    return _read_dataset_from_store()
+
+
+def create_shared_dataset(path=None):
+    # called once by the gunicorn master, returns the path of the segment the workers attach to
+    df, stats = _read_dataset_from_store()
+    return shared_dataset.create_segment(df, stats, path)
+
+
+def load_dataset():
+    # double checked so that concurrent first requests read the samples once
+    global _dataset
+    if _dataset is None:
+        with _dataset_lock:
+            if _dataset is None:
+                _dataset = _read_dataset()
+    elif _dataset_changed():
+        reload_dataset()
+    return _dataset
+
+
+def _dataset_changed():
+    # one stat of the CSV every DATASET_RELOAD_CHECK_SECONDS
+    global _next_reload_check
+    if DATASET_RELOAD_CHECK_SECONDS <= 0 or _dataset_source is None:
+        return False
+    now = time.monotonic()
+    if now < _next_reload_check:
+        return False
+    _next_reload_check = now + DATASET_RELOAD_CHECK_SECONDS
+    return _csv_signature() != _dataset_source
+
+
+def __getattr__(name):
+    # geo_chem.Nagpur_gdf / geo_chem.Nagpur_stats load the dataset on first access
+    if name == 'Nagpur_gdf':
+        return load_dataset()[0]
+    if name == 'Nagpur_stats':
+        return load_dataset()[1]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def is_loaded_dataset(df):
+    return _dataset is not None and df is _dataset[0]
+
+
+def get_stats_index(df):
+    if is_loaded_dataset(df):
+        return _dataset[1]
+    return StatsIndex(df, chemicals.values())
+
+
+def reload_dataset():
+    # Re-read the samples and drop everything derived from the previous copy, called by
+    # load_dataset when the CSV changed
+    global _dataset
+    with _dataset_lock:
+        _dataset = _read_dataset()
+    kriging_cache.clear()
+    intent_cache.clear()
+    # engines that were never imported have nothing cached
+    if 'kriging_engine' in sys.modules:
+        sys.modules['kriging_engine'].geometry_cache.clear()
+    if 'triangulation_cache' in sys.modules:
+        sys.modules['triangulation_cache'].clear()
+    return _dataset[0]
+
+
+def engine_cache_stats(module_name, cache_name):
+    # stats() of a cache of a lazily imported engine, empty until the engine is first used
+    module = sys.modules.get(module_name)
+    return getattr(module, cache_name).stats() if module is not None else {}
+
+
+def no_samples_message(toposheet_number, element):
+    return f"There are no {element} measurements for the toposheet {toposheet_number} in the Nagpur data."
+
 # Function to extract chemical names and formulas from a sentence
 def extract_chemicals(query):
-    # Initialize an empty list to store the extracted elements
-    elements = []
+    # formulas of the chemicals the query names, by name or by formula, in the order they are mentioned
+    return list(parse_query(query).elements)
 
-    # Convert the sentence to lowercase
-    lower_sentence = query.lower()
 
-    # Extract words from the sentence
-    words = re.findall(r'\b\w+\b', lower_sentence)
+def extract_topo_no(str1):
+    return list(parse_query(str1).toposheets)
 
-    # Check if any chemical name or formula is present in the sentence
-    for chemical, formula in chemicals.items():
-        if chemical.lower() in lower_sentence or formula.lower() in words:
-            elements.append(formula)
 
-    # Return the list of extracted elements
-    return elements
 
+def query_combinations(query):
+    # every toposheet x element pair named in the query (text or QueryParse), in the order they were mentioned
+    parse = parse_query(query)
+    return [(toposheet_no, element) for toposheet_no in parse.toposheets for element in parse.elements]
 
-def extract_topo_no(str1):
-    toposheet_numbers = []
-    toposheet_pattern = r'\b\d+[a-zA-Z]+\d+\b'
-    toposheet_numbers = re.findall(toposheet_pattern,str1)
-    return toposheet_numbers
 
+def combine_responses(responses):
+    # one combination keeps its plain response, several come back as a list
+    if not responses:
+        return None
+    if len(responses) == 1:
+        return responses[0]
+    return responses
+
+
+def kriging_map_for(df, toposheet_no, element, variogram_model='spherical', grid_resolution=100):
+    stats = get_stats_index(df).lookup(toposheet_no, element)
+    if stats is None:
+        return no_samples_message(toposheet_no, element)
+    max_value, max_lat, max_lon = stats.max, stats.max_lat, stats.max_lon
+    max_location = df.iloc[stats.argmax][['latitude', 'longitude']]
+    # Minimum value aur uske corresponding latitude, longitude find kar rahe hain
+    min_value, min_lat, min_lon = stats.min, stats.min_lat, stats.min_lon
+    min_location = df.iloc[stats.argmin][['latitude', 'longitude']]
+    return generate_kriging_map(df,element,max_value,max_location,max_lat,max_lon,min_value,min_location,min_lat,min_lon, toposheet_no, variogram_model=variogram_model, grid_resolution=grid_resolution)
 
 
 def create_kriging_map_from_query(query,df):
-    t1 = extract_topo_no(query)
-    e1 = extract_chemicals(query)
-    
-    for toposheet_no in t1:
-        for element in e1:
-            max_value = df[element].max()
-            max_location = df[df[element] == max_value][['latitude', 'longitude']].iloc[0]
-            max_lat, max_lon = max_location['latitude'], max_location['longitude']
-            # Minimum value aur uske corresponding latitude, longitude find kar rahe hain
-            min_value = df[element].min()
-            min_location = df[df[element] == min_value][['latitude', 'longitude']].iloc[0]
-            min_lat, min_lon = min_location['latitude'], min_location['longitude']
-            return generate_kriging_map(df,element,max_value,max_location,max_lat,max_lon,min_value,min_location,min_lat,min_lon, toposheet_no,)
+    return combine_responses([kriging_map_for(df, toposheet_no, element) for toposheet_no, element in query_combinations(query)])
 
 
+# Kriged maps keyed by (toposheet, element, variogram_model, grid_resolution), bounded by size in MB
+KRIGING_CACHE_MB = float(os.getenv('KRIGING_CACHE_MB', '64'))
+kriging_cache = LRUCache(max_bytes=int(KRIGING_CACHE_MB * 1024 * 1024))
+
+
+def kriging_cache_stats():
+    return kriging_cache.stats()
+
+
+# Sheets with more samples than this are kriged from local neighbourhoods instead of one global system
+LOCAL_KRIGING_MIN_SAMPLES = int(os.getenv('LOCAL_KRIGING_MIN_SAMPLES', '1000'))
+LOCAL_KRIGING_NEIGHBOURS = int(os.getenv('LOCAL_KRIGING_NEIGHBOURS', '32'))
+
+
+@metrics.timed_stage('generate_kriging_map')
+def generate_kriging_map(df, element, max_value, max_location, max_lat, max_lon, min_value, min_location, min_lat, min_lon, toposheet_number=None, variogram_model='spherical', grid_resolution=100, n_neighbours=None, search_radius=None):
+    import kriging_engine
+    # Serve repeated toposheet/element requests from the cache instead of re-kriging
+    cache_key = (toposheet_number, element, variogram_model, grid_resolution, n_neighbours, search_radius)
+    cached = kriging_cache.get(cache_key)
+    if cached is not None:
+        return (cached['payload'], 'kriging_map')
 
-def generate_kriging_map(df, element, max_value, max_location, max_lat, max_lon, min_value, min_location, min_lat, min_lon, toposheet_number=None, variogram_model='spherical'):
     # Function body goes here
      # Filter the DataFrame by the specified toposheet number if provided
     if toposheet_number is not None:
         df = df[df['toposheet'] == toposheet_number]
     
-    # Define grid resolution
-    gridx = np.linspace(df['longitude'].min(), df['longitude'].max(), 100)
-    gridy = np.linspace(df['latitude'].min(), df['latitude'].max(), 100)
-    
-    # Perform Ordinary Kriging
-    OK = OrdinaryKriging(df['longitude'], df['latitude'], df[element], variogram_model=variogram_model)
-    z_interp, ss = OK.execute('grid', gridx, gridy)
-    
-    
-    # Create the contour plot
-    contour = go.Contour(
-        z=z_interp.data,  # 2D array of the heatmap values
-        x=gridx,  # X coordinates corresponding to 'z_interp'
-        y=gridy,  # Y coordinates corresponding to 'z_interp'
-        colorscale='YlOrRd',  # Match the colormap
-        showscale=True  # Show the color scale bar
-    )
-    
-    # Create the scatter plot with hover annotations
-    scatter = go.Scatter(
-        x=df['longitude'],
-        y=df['latitude'],
-        mode='markers',
-        marker=dict(
-            color=df[element],
-            colorscale='YlOrRd',  # Match the colormap
-            showscale=False,  # We already have a color scale from the contour
-            line=dict(color='black', width=1)  # Black border around the scatter points
-        ),
-        text=df[element],  # Text for hover annotations
-        hoverinfo='text'  # Show only the text on hover
-    )
-    
-    # Create a figure and add the contour plot
-    fig = go.Figure(data=[contour])
+    if n_neighbours is None and len(df) > LOCAL_KRIGING_MIN_SAMPLES:
+        n_neighbours = LOCAL_KRIGING_NEIGHBOURS
+
+    if n_neighbours:
+        # Moving-window kriging from the nearest samples of every grid node
+        result = kriging_engine.krige_local(df['longitude'], df['latitude'], df[element], variogram_model, n_neighbours=n_neighbours, search_radius=search_radius, grid_resolution=grid_resolution)
+    else:
+        # Perform Ordinary Kriging, the distance matrices of the toposheet are shared with other elements
+        geometry = kriging_engine.get_geometry(toposheet_number, df['longitude'], df['latitude'], grid_resolution)
+        result = kriging_engine.krige_elements(None, None, {element: df[element].to_numpy(dtype=float)}, variogram_model, geometry=geometry)[element]
+    gridx, gridy = result.gridx, result.gridy
+    z_interp, ss = result.z, result.variance
     
-    # Add the scatter plot on top of the contour plot
-    fig.add_trace(scatter)
     
-    fig.add_annotation(
-    text=f"<i>Maximum value (in ppm): <b>{max_value}</b> at longitude <b>{max_lon}</b> and latitude <b>{max_lat}</b></i>",
-    xref="paper", yref="paper",
-    x=0.5, y=1.2, showarrow=False,
-    font=dict(size=14),
-    align="center"
+    # Compact payload: float32 grid, sample points and a layout descriptor, the figure is built in the browser
+    payload = map_payload.build_map_payload(
+        'kriging_map', gridx, gridy, z_interp,
+        df['longitude'], df['latitude'], point_values=df[element],
+        point_outline=True,  # Black border around the scatter points
+        title=f"<b>Stream Sediment samples showing {element} Values(ppm)</b>",
+        annotations=[
+            (f"<i>Maximum value (in ppm): <b>{max_value}</b> at longitude <b>{max_lon}</b> and latitude <b>{max_lat}</b></i>", 1.2),
+            (f"<i>Minimum value (in ppm): <b>{min_value}</b> at longitude <b>{min_lon}</b> and latitude <b>{min_lat}</b></i>", 1.1),
+        ],
+        colorscale='YlOrRd',
+        margin_top=120,  # Adjust margin to accommodate the annotations and title
     )
+    kriging_cache.put(cache_key, {'gridx': gridx, 'gridy': gridy, 'z': z_interp, 'variance': ss, 'payload': payload})
+    return (payload, 'kriging_map')
 
-    fig.add_annotation(
-    text=f"<i>Minimum value (in ppm): <b>{min_value}</b> at longitude <b>{min_lon}</b> and latitude <b>{min_lat}</b></i>",
-    xref="paper", yref="paper",
-    x=0.5, y=1.1, showarrow=False,
-    font=dict(size=14),
-    align="center"
-    )
 
-    # Add a title to the map
-    fig.update_layout(
-    title=f"<b>Stream Sediment samples showing {element} Values(ppm)</b>",
-    title_x=0.5,  # Center the title
-    title_y=0.95,  # Add some space from the top
-    margin=dict(t=120)  # Adjust margin to accommodate the annotations and title
-    )
-#     fig.show()
-    data = fig.to_dict()
-    layout = fig.to_dict()
-    return (data,layout, 'kriging_map')
+# In[103]:
 
 
-# In[103]:
+# IDW_METHOD picks the interpolation of the IDW maps: "idw", or "linear"/"cubic" for scipy griddata
+# style maps over a Delaunay triangulation cached per toposheet (triangulation_cache.py)
+IDW_METHOD = os.getenv('IDW_METHOD', 'idw')
 
 
-def create_idw_map_from_query(query,df):
-    t2 = extract_topo_no(query)
-    e2 = extract_chemicals(query)
-    threshold_percentile = 100   
-    for toposheet_number in t2:
-        for element in e2:
-            max_value = df[element].max()
-            max_location = df[df[element] == max_value][['latitude', 'longitude']].iloc[0]
-            max_lat, max_lon = max_location['latitude'], max_location['longitude']
-            # Minimum value aur uske corresponding latitude, longitude find kar rahe hain
-            min_value = df[element].min()
-            min_location = df[df[element] == min_value][['latitude', 'longitude']].iloc[0]
-            min_lat, min_lon = min_location['latitude'], min_location['longitude']
-            return generate_idw_map(df, element,max_value, max_location, max_lat, max_lon, min_value, min_location, min_lat, min_lon, toposheet_number, threshold_percentile) 
+def idw_map_for(df, toposheet_number, element, threshold_percentile=100, method=IDW_METHOD, power=2.0, n_neighbours=12):
+    stats = get_stats_index(df).lookup(toposheet_number, element)
+    if stats is None:
+        return no_samples_message(toposheet_number, element)
+    max_value, max_lat, max_lon = stats.max, stats.max_lat, stats.max_lon
+    max_location = df.iloc[stats.argmax][['latitude', 'longitude']]
+    # Minimum value aur uske corresponding latitude, longitude find kar rahe hain
+    min_value, min_lat, min_lon = stats.min, stats.min_lat, stats.min_lon
+    min_location = df.iloc[stats.argmin][['latitude', 'longitude']]
+    return generate_idw_map(df, element,max_value, max_location, max_lat, max_lon, min_value, min_location, min_lat, min_lon, toposheet_number, threshold_percentile, method=method, power=power, n_neighbours=n_neighbours)
 
 
-# In[181]:
+def create_idw_map_from_query(query,df):
+    return combine_responses([idw_map_for(df, toposheet_number, element) for toposheet_number, element in query_combinations(query)])
 
 
-import matplotlib.pyplot as plt
-import numpy as np
-from scipy.interpolate import griddata
-import io
-import base64
+# In[181]:
 
 # def generate_idw_map(df, element,max_value, max_location, max_lat, max_lon, min_value, min_location, min_lat, min_lon, toposheet_number, threshold_percentile):
 #     # Filter the DataFrame by the specified toposheet number
@@ -304,7 +415,10 @@ import base64
     
 #     return output  # Return the base64 encoded image data as a dictionary
 
-def generate_idw_map(df, element, max_value, max_location, max_lat, max_lon, min_value, min_location, min_lat, min_lon, toposheet_number, threshold_percentile):
+@metrics.timed_stage('generate_idw_map')
+def generate_idw_map(df, element, max_value, max_location, max_lat, max_lon, min_value, min_location, min_lat, min_lon, toposheet_number, threshold_percentile, method='idw', power=2.0, n_neighbours=12, search_radius=None):
+    import idw_engine
+    import triangulation_cache
     # Filter the DataFrame by the specified toposheet number
     gdf = df[df['toposheet'] == toposheet_number]
 
@@ -325,56 +439,74 @@ def generate_idw_map(df, element, max_value, max_location, max_lat, max_lon, min
     anomalies = gdf[deviation > anomaly_threshold]
 
     # Create grid coordinates for interpolation
-    grid_x, grid_y = np.mgrid[min(gdf['longitude']):max(gdf['longitude']):100j, min(gdf['latitude']):max(gdf['latitude']):100j]
+    gridx = np.linspace(min(gdf['longitude']), max(gdf['longitude']), 100)
+    gridy = np.linspace(min(gdf['latitude']), max(gdf['latitude']), 100)
 
-    # Interpolate using IDW
-    grid_z = griddata((gdf['longitude'], gdf['latitude']), deviation, (grid_x, grid_y), method='cubic')
-
-    # Create the contour plot
-    contour = go.Contour(
-        z=grid_z.T,
-        x=np.linspace(min(gdf['longitude']), max(gdf['longitude']), 100),
-        y=np.linspace(min(gdf['latitude']), max(gdf['latitude']), 100),
-        colorscale='Viridis',
-        colorbar=dict(title='Deviation from Baseline')
-    )
-
-    # Create the scatter plot for anomalies
-    scatter = go.Scatter(
-        x=anomalies['longitude'],
-        y=anomalies['latitude'],
-        mode='markers',
-        marker=dict(color='red', size=5),
-        name='Anomalies'
-    )
-
-    # Define the layout
-    layout = go.Layout(
+    if method in ('cubic', 'linear'):
+        # griddata style interpolation over the toposheet's cached Delaunay triangulation
+        if is_loaded_dataset(df):
+            triangulation = triangulation_cache.get_triangulation(toposheet_number, gdf['longitude'], gdf['latitude'], len(gridx))
+        else:
+            # the cache is keyed by toposheet, only the loaded samples may go through it
+            triangulation = triangulation_cache.ToposheetTriangulation(gdf['longitude'], gdf['latitude'], gridx, gridy)
+        grid_z = triangulation.interpolate(deviation.to_numpy(dtype=float), method)
+    else:
+        # Interpolate using IDW
+        grid_z = idw_engine.idw_grid(gdf['longitude'], gdf['latitude'], deviation, gridx, gridy, power=power, n_neighbours=n_neighbours, search_radius=search_radius)
+
+    # Compact payload with the anomalies as red points, the figure is built in the browser
+    payload = map_payload.build_map_payload(
+        'idw_map', gridx, gridy, grid_z,
+        anomalies['longitude'], anomalies['latitude'],
+        point_name='Anomalies', point_color='red', point_size=5,
         title=f'Geochemical IDW Map for {element} (Toposheet {toposheet_number})<br>'
               f'Maximum value (in ppm): {max_value} at longitude {max_lon} and latitude {max_lat}<br>'
               f'Minimum value (in ppm): {min_value} at longitude {min_lon} and latitude {min_lat}',
-        xaxis=dict(title='Longitude'),
-        yaxis=dict(title='Latitude')
+        colorscale='Viridis',
+        colorbar_title='Deviation from Baseline',
+        x_title='Longitude',
+        y_title='Latitude',
     )
-    
-    # Create the figure and plot it
-    fig = go.Figure(data=[contour, scatter], layout=layout)
-    data = fig.to_dict()
-    layout = fig.to_dict()
-    return (data, layout, 'idw_map')
+    return (payload, 'idw_map')
+
+
+
+def max_value_for(df, toposheet_number, element):
+    stats = get_stats_index(df).lookup(toposheet_number, element)
+    if stats is None:
+        return no_samples_message(toposheet_number, element)
+    max_value, max_lat, max_lon = stats.max, stats.max_lat, stats.max_lon
+    return f"For the toposheet {toposheet_number}, the element {element} has maximum PPM value {max_value} at latitude {max_lat} and longitude {max_lon}."
+
+
+def min_value_for(df, toposheet_number, element):
+    stats = get_stats_index(df).lookup(toposheet_number, element)
+    if stats is None:
+        return no_samples_message(toposheet_number, element)
+    min_value, min_lat, min_lon = stats.min, stats.min_lat, stats.min_lon
+    # Results ko sentence mein display kar rahe hain
+    return f"For the toposheet {toposheet_number}, the element {element} has minimum PPM value {min_value} at latitude {min_lat} and longitude {min_lon}."
+
+
+def min_max_value_for(df, toposheet_number, element):
+    stats = get_stats_index(df).lookup(toposheet_number, element)
+    if stats is None:
+        return no_samples_message(toposheet_number, element)
+    max_value, max_lat, max_lon = stats.max, stats.max_lat, stats.max_lon
+    # Minimum value aur uske corresponding latitude, longitude find kar rahe hain
+    min_value, min_lat, min_lon = stats.min, stats.min_lat, stats.min_lon
+    # Results ko sentence mein display kar rahe hain
+    return f"For the toposheet {toposheet_number}, the element {element} has maximum PPM value {max_value} at latitude {max_lat} and longitude {max_lon}, and has minimum PPM value {min_value} at latitude {min_lat} and longitude {min_lon}."
 
 
+def _text_for_all(handler, query, df):
+    # one sentence per toposheet/element pair
+    sentences = [handler(df, toposheet_number, element) for toposheet_number, element in query_combinations(query)]
+    return "\n".join(sentences) if sentences else None
+
 
 def find_max_values(query, df):
-    toposheet_numbers = extract_topo_no(query)
-    elements = extract_chemicals(query)
-    for toposheet_number in toposheet_numbers:
-        for element in elements:
-            max_value = df[element].max()
-            max_location = df[df[element] == max_value][['latitude', 'longitude']].iloc[0]
-            max_lat, max_lon = max_location['latitude'], max_location['longitude']
-            max_value_result = f"For the toposheet {toposheet_number}, the element {element} has maximum PPM value {max_value} at latitude {max_lat} and longitude {max_lon}."
-            return max_value_result
+    return _text_for_all(max_value_for, query, df)
 
 
 # In[183]:
@@ -382,47 +514,25 @@ def find_max_values(query, df):
 
 def find_min_values(query, df):
 #     print("[INFO:] Finding the min values")
-    toposheet_numbers = extract_topo_no(query)
-    elements = extract_chemicals(query)
-    for toposheet_number in toposheet_numbers:
-        for element in elements:
-            min_value = df[element].min()
-            min_location = df[df[element] == min_value][['latitude', 'longitude']].iloc[0]
-            min_lat, min_lon = min_location['latitude'], min_location['longitude']
-    
-            # Results ko sentence mein display kar rahe hain
-            min_value_result = f"For the toposheet {toposheet_number}, the element {element} has minimum PPM value {min_value} at latitude {min_lat} and longitude {min_lon}."
-            return min_value_result
+    return _text_for_all(min_value_for, query, df)
 
 
 # In[184]:
 
 
 def find_both_min_max(query, df):
-    toposheet_numbers = extract_topo_no(query)
-    elements = extract_chemicals(query)
-    for toposheet_number in toposheet_numbers:
-        for element in elements:
-            max_value = df[element].max()
-            max_location = df[df[element] == max_value][['latitude', 'longitude']].iloc[0]
-            max_lat, max_lon = max_location['latitude'], max_location['longitude']
-            # Minimum value aur uske corresponding latitude, longitude find kar rahe hain
-            min_value = df[element].min()
-            min_location = df[df[element] == min_value][['latitude', 'longitude']].iloc[0]
-            min_lat, min_lon = min_location['latitude'], min_location['longitude']
-
-            # Results ko sentence mein display kar rahe hain
-            min_max_value_result = f"For the toposheet {toposheet_number}, the element {element} has maximum PPM value {max_value} at latitude {max_lat} and longitude {max_lon}, and has minimum PPM value {min_value} at latitude {min_lat} and longitude {min_lon}."
-            return min_max_value_result
+    return _text_for_all(min_max_value_for, query, df)
 
 
 # In[185]:
 
 
-def split_query_smartly(query):
+@metrics.timed_stage('split_query_smartly')
+def split_query_smartly(query, nlp=None):
     element_names = ['silicon dioxide', 'aluminum oxide', 'iron(III) oxide', 'titanium dioxide', 'calcium oxide', 'magnesium oxide', 'manganese(II) oxide', 'sodium oxide', 'potassium oxide', 'phosphorus pentoxide', 'loss on ignition', 'barium', 'gallium', 'scandium', 'vanadium', 'thorium', 'lead', 'nickel', 'cobalt', 'rubidium', 'strontium', 'yttrium', 'zirconium', 'niobium', 'chromium', 'copper', 'zinc', 'gold', 'lithium', 'cesium', 'arsenic', 'antimony', 'bismuth', 'selenium', 'silver', 'beryllium', 'germanium', 'molybdenum', 'tin', 'lanthanum', 'cerium', 'praseodymium', 'neodymium', 'samarium', 'europium', 'terbium', 'gadolinium', 'dysprosium', 'holmium', 'erbium', 'thulium', 'ytterbium', 'lutetium', 'hafnium', 'tantalum', 'tungsten', 'uranium', 'platinum', 'palladium', 'indium', 'fluorine', 'tellurium', 'thallium', 'mercury', 'cadmium']
-    # Load spaCy English model
-    nlp = spacy.load("en_core_web_sm")
+    # Shared spaCy engine, loaded once per process (tokenizer only by default)
+    if nlp is None:
+        nlp = nlp_engine.get_engine()
     
     # Define split words and phrases
     split_words = ["maximum and minimum", "longitude and latitude"]
@@ -472,43 +582,140 @@ def split_query_smartly(query):
 
 
 
-def process_subqueries(subqueries):
-#     combined_output = []  # Initialize a list to store combined output
-    df = Nagpur_gdf
-    try: 
-        for subquery in subqueries:
-            print(f"Processing subquery: {subquery}")
-            if ('maximum' in subquery.lower() and 'minimum' in subquery.lower()) or ('max' in subquery.lower() and 'min' in subquery.lower()):
-                print("Calling the function for min and max")
-                output = find_both_min_max(subquery, df=Nagpur_gdf) 
-            elif ('maximum' in subquery.lower()) or ('max' in subquery.lower()):
-                print('Calling Max Fun')
-                output = find_max_values(subquery,df)
-            elif ('minimum' in subquery.lower()) or ('min' in subquery.lower()):
-                print('Calling Min Fun')
-                output = find_min_values(subquery,df)      
-                
-            # Check if the subquery mentions 'idw interpolation map'
-            elif 'idw' in subquery.lower() or 'inverse distance weighted map' in subquery.lower():
-                print("Calling the IDW function")
-                output = create_idw_map_from_query(subquery, df)           
-                
-            elif 'idw' in subquery.lower() and "kriging" in subquery.lower():
-                print("Calling both kriging and IDW function")
-                output_idw = create_idw_map_from_query(subquery, df)
-                output_kriging = create_kriging_map_from_query(subquery, df)
-                output = (output_idw, output_kriging)  # Store both outputs in a tuple
-                
-            elif 'kriging' in subquery.lower():
-                print("Calling the kriging function")
-                output = create_kriging_map_from_query(subquery, df)
-            else:
-                apology_message = "I'm only able to provide information related to Nagpur data. Please enter a valid query about Nagpur toposheet data. Thank you for your understanding and patience."
-                print(apology_message)
-        return output 
+# Intent routes, the most specific matching one answers a subquery
+router = intent_router.IntentRouter()
+router.register('min_max', {'max', 'min'}, min_max_value_for)
+router.register('max', {'max'}, max_value_for)
+router.register('min', {'min'}, min_value_for)
+router.register('idw_kriging', {'idw', 'kriging'}, idw_map_for, kriging_map_for)
+router.register('idw', {'idw'}, idw_map_for)
+router.register('kriging', {'kriging'}, kriging_map_for)
+
+
+def subquery_handlers(parse):
+    # the per toposheet/element functions that answer a parsed subquery, in answer order
+    route = router.route(parse.intents)
+    metrics.event('subquery', text=parse.text, route=route.name if route else None)
+    if route is None:
+        return []
+    return list(route.handlers)
+
+
+@metrics.timed_stage('plan_subquery')
+def plan_subquery(subquery):
+    """
+    Work items of one subquery (text or QueryParse) as (handler, toposheet, element) tuples.
+    Every handler runs for every toposheet x element pair the subquery mentions.
+    """
+    parse = parse_query(subquery)
+    combinations = query_combinations(parse)
+    return [(handler, toposheet_number, element) for handler in subquery_handlers(parse) for toposheet_number, element in combinations]
+
+
+def process_subquery(subquery, df):
+    # serial answer of one subquery, a list when it covers several toposheets/elements
+    return combine_responses([handler(df, toposheet_number, element) for handler, toposheet_number, element in plan_subquery(subquery)])
+
+PROCESSING_ERROR_MESSAGE = "There was problem processing your query, please try again and make sure the query is valid on Nagpur toposheet data. Thank you for your understanding and patience."
+UNANSWERED_MESSAGE = "Sorry, I am unable to respond to this query. I am currently equipped to provide information on Nagpur Geochemistry Toposheet data and can handle one query at a time. Thank you for your understanding."
+
+
+# Work items (subquery x toposheet x element) of one message run side by side on this pool
+SUBQUERY_WORKERS = int(os.getenv('SUBQUERY_WORKERS', '4'))
+subquery_pool = ThreadPoolExecutor(max_workers=SUBQUERY_WORKERS, thread_name_prefix='subquery')
+
+
+# Answers keyed by canonical intent (operation, toposheet, element, method parameters), so the
+# same question in any wording skips interpolation and payload encoding
+INTENT_CACHE_MB = float(os.getenv('INTENT_CACHE_MB', '64'))
+intent_cache = LRUCache(max_bytes=int(INTENT_CACHE_MB * 1024 * 1024))
+
+
+@functools.lru_cache(maxsize=None)
+def _handler_parameters(handler):
+    # keyword defaults of a handler (follows functools.wraps to the undecorated function)
+    return {name: parameter.default for name, parameter in inspect.signature(handler).parameters.items() if parameter.default is not inspect.Parameter.empty}
+
+
+def canonical_key(handler, toposheet_number, element, **parameters):
+    parameters = {**_handler_parameters(handler), **parameters}
+    return (handler.__name__, toposheet_number, element, tuple(sorted(parameters.items())))
+
+
+def intent_cache_stats():
+    return intent_cache.stats()
+
+
+def _run_work_item(handler, df, toposheet_number, element):
+    # only answers over the loaded dataset are cached
+    cacheable = is_loaded_dataset(df)
+    key = canonical_key(handler, toposheet_number, element)
+    if cacheable:
+        cached = intent_cache.get(key)
+        if cached is not None:
+            return cached
+    try:
+        response = handler(df, toposheet_number, element)
     except Exception as e:
-        print("Error:", e)
-        return "There was problem processing your query, please try again and make sure the query is valid on Nagpur toposheet data. Thank you for your understanding and patience."
+        metrics.errors_total.inc(where='work_item')
+        metrics.event('work_item_failed', level=logging.ERROR, handler=handler.__name__, toposheet=toposheet_number, element=element, error=repr(e))
+        return PROCESSING_ERROR_MESSAGE, "text"
+    result = (response, response_data_type(response))
+    # not when the dataset was reloaded while the answer was being computed
+    if cacheable and is_loaded_dataset(df):
+        intent_cache.put(key, result)
+    return result
+
+
+# work items that build a map, by handler name, and the map kind they produce
+MAP_KINDS = {'idw_map_for': 'idw_map', 'kriging_map_for': 'kriging_map'}
+
+
+def submit_subqueries(subqueries, df=None, submit_map=None):
+    """
+    Fan every work item of every subquery (text or QueryParse) out to subquery_pool.
+    Returns [(subquery, future)] in answer order. Fragments with nothing to answer ("Please",
+    "Can you tell me") are dropped; only when no subquery has anything to answer does the first
+    one get an already resolved future holding the unanswered message.
+    With submit_map(kind, subquery text, toposheet, element) map work items are handed to it
+    instead, and their future holds what it returns.
+    """
+    df = load_dataset()[0] if df is None else df
+    planned = []
+    for subquery in subqueries:
+        try:
+            work_items = plan_subquery(subquery)
+        except Exception as e:
+            metrics.errors_total.inc(where='plan_subquery')
+            metrics.event('plan_failed', level=logging.ERROR, subquery=getattr(subquery, 'text', subquery), error=repr(e))
+            work_items = None
+        planned.append((subquery, work_items))
+
+    submitted = []
+    for subquery, work_items in planned:
+        if work_items is None:
+            future = Future()
+            future.set_result((PROCESSING_ERROR_MESSAGE, "text"))
+            submitted.append((subquery, future))
+            continue
+        for handler, toposheet_number, element in work_items:
+            kind = MAP_KINDS.get(handler.__name__) if submit_map is not None else None
+            if kind is not None:
+                future = Future()
+                future.set_result(submit_map(kind, parse_query(subquery).text, toposheet_number, element))
+            else:
+                future = subquery_pool.submit(profiling.propagate(_run_work_item), handler, df, toposheet_number, element)
+            submitted.append((subquery, future))
+    if not submitted and planned:
+        future = Future()
+        future.set_result((UNANSWERED_MESSAGE, "text"))
+        submitted.append((planned[0][0], future))
+    return submitted
+
+
+def process_subqueries(subqueries):
+    # ordered list of (response, data_type), one per work item; latency is that of the slowest item
+    return [future.result() for _, future in submit_subqueries(subqueries)]
 # Example usage:
 # SubQueries = [
 #     'the maximum and minimum longitude and latitude values for 55K14 for gold',
@@ -522,18 +729,65 @@ def process_subqueries(subqueries):
 # In[200]:
 
 
-def generate_geochemistry_response(query):
-    corrected_sentence = correct_typos(query)
-    Subqueries = split_query_smartly(corrected_sentence)
-    response = process_subqueries(Subqueries)
-    if response == None:
-        response = "Sorry, I am unable to respond to this query. I am currently equipped to provide information on Nagpur Geochemistry Toposheet data and can handle one query at a time. Thank you for your understanding."
+def response_data_type(response):
     data_type = "text"
-    if type(response) == tuple and response[2]=='idw_map':
+    if type(response) == tuple and response[-1]=='idw_map':
         data_type = "idw_map"
-    elif type(response) == tuple and response[2]=='kriging_map':
+    elif type(response) == tuple and response[-1]=='kriging_map':
         data_type = "kriging_map"
-    return response, data_type
+    return data_type
+
+
+routing_total = metrics.registry.counter('ngdr_routing_total', "Queries answered from the lexer parse (fast) or split by spaCy (split).", ['path'])
+
+
+@metrics.timed_stage('route_query')
+def route_query(query):
+    """
+    Subqueries of a query. A single-intent query naming one toposheet or one element is answered
+    straight from its parse; only the others go through split_query_smartly.
+    """
+    corrected_sentence = correct_typos(query)
+    parse = parse_query(corrected_sentence)
+    # two intents can belong to two sentences ("max of gold ... Also the min of copper"), only the split can tell
+    if len(parse.intents) == 1 and router.exact_route(parse.intents) is not None and (len(parse.toposheets) == 1 or len(parse.elements) == 1):
+        router.fast_path += 1
+        routing_total.inc(path='fast')
+        return [parse]
+    router.split_path += 1
+    routing_total.inc(path='split')
+    return split_query_smartly(corrected_sentence)
+
+
+def generate_geochemistry_response(query):
+    Subqueries = route_query(query)
+    if not Subqueries:
+        return [(UNANSWERED_MESSAGE, "text")]
+    return process_subqueries(Subqueries)
+
+
+def iter_geochemistry_responses(query, submit_map=None):
+    """
+    Streaming variant of generate_geochemistry_response.
+    Yields (index, total, subquery, (response, data_type)) for each work item as soon as it is answered,
+    index being its position in the list generate_geochemistry_response returns.
+    submit_map is passed to submit_subqueries, to build the maps somewhere else.
+    """
+    subqueries = route_query(query)
+    if not subqueries:
+        yield 0, 1, query, (UNANSWERED_MESSAGE, "text")
+        return
+    submitted = submit_subqueries(subqueries, submit_map=submit_map)
+    futures = {future: index for index, (_, future) in enumerate(submitted)}
+    for future in as_completed(futures):
+        index = futures[future]
+        yield index, len(submitted), parse_query(submitted[index][0]).text, future.result()
+
+def warm_up(nlp=True):
+    # reads the dataset, and loads the spaCy tokenizer used by split_query_smartly
+    load_dataset()
+    if nlp:
+        nlp_engine.warm_up()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+# gunicorn settings, run from the my_env directory:
+#     gunicorn -c gunicorn.conf.py app:app
+import os
+import shutil
+import tempfile
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+
+# The master puts the dataset and its statistics index in one shared memory segment that every
+# worker maps read-only (shared_dataset.py), instead of each worker loading its own copy.
+# SHARED_DATASET=0 goes back to one copy per worker.
+SHARED_DATASET = os.getenv('SHARED_DATASET', '1') != '0'
+
+
+# Map jobs are queued in one directory for all workers and built by MAP_JOB_WORKERS runner
+# processes started here, so any worker can report a job and the map pool is bounded per server.
+map_job_runners = []
+
+
+def on_starting(server):
+    import map_jobs
+    import metrics
+    import shared_dataset
+    # every worker writes its metrics here, /metrics on any worker renders them all
+    os.environ[metrics.METRICS_DIR_ENV] = tempfile.mkdtemp(prefix='ngdr-metrics-')
+
+    os.environ[map_jobs.JOB_DIR_ENV] = map_jobs.create_job_dir()
+    map_job_runners.extend(map_jobs.start_runners(os.environ[map_jobs.JOB_DIR_ENV], map_jobs.MAP_JOB_WORKERS))
+    server.log.info("Map job queue %s with %d runners", os.environ[map_jobs.JOB_DIR_ENV], len(map_job_runners))
+
+    os.environ.pop(shared_dataset.SEGMENT_ENV, None)
+    if not SHARED_DATASET:
+        return
+    import geo_chem
+    path = geo_chem.create_shared_dataset()
+    # workers are forked after this hook and inherit the variable
+    os.environ[shared_dataset.SEGMENT_ENV] = path
+    server.log.info("Shared dataset segment %s (%d bytes)", path, os.path.getsize(path))
+
+
+def worker_exit(server, worker):
+    import metrics
+    metrics.registry.flush()
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    import map_jobs
+    import metrics
+    import shared_dataset
+    map_jobs.stop_runners(map_job_runners, os.environ.get(map_jobs.JOB_DIR_ENV))
+    shutil.rmtree(os.environ.get(metrics.METRICS_DIR_ENV, ''), ignore_errors=True)
+    path = os.environ.get(shared_dataset.SEGMENT_ENV)
+    if path:
+        shared_dataset.remove_segment(path)
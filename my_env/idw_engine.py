@@ -0,0 +1,63 @@
+"""
+Inverse distance weighted interpolation over a KD-tree.
+
+Each grid node takes the `n_neighbours` nearest samples (optionally limited to a search
+radius) and averages them with weights 1 / distance**power. Grid nodes are evaluated in
+chunks so memory stays bounded at chunk_size * n_neighbours whatever the grid size.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+class IDWInterpolator:
+    """
+    KD-tree over the samples of one element, reusable for any number of grids or points.
+    """
+
+    def __init__(self, x, y, values, power=2.0, n_neighbours=12, search_radius=None):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        values = np.asarray(values, dtype=float)
+        # samples without a measurement do not take part in the interpolation
+        valid = ~np.isnan(values)
+        self.values = values[valid]
+        self.tree = cKDTree(np.column_stack((x[valid], y[valid])))
+        self.power = power
+        self.n_neighbours = max(1, min(n_neighbours, len(self.values)))
+        self.search_radius = np.inf if search_radius is None else search_radius
+
+    def _interpolate_chunk(self, points):
+        distances, neighbours = self.tree.query(points, k=self.n_neighbours, distance_upper_bound=self.search_radius)
+        if self.n_neighbours == 1:
+            distances, neighbours = distances[:, None], neighbours[:, None]
+        found = np.isfinite(distances)
+        neighbours = np.where(found, neighbours, 0)
+
+        with np.errstate(divide='ignore'):
+            weights = np.where(found, 1.0 / distances ** self.power, 0.0)
+        # a node sitting exactly on a sample takes that sample's value
+        exact = found & (distances == 0.0)
+        on_sample = exact.any(axis=1)
+        weights[on_sample] = exact[on_sample].astype(float)
+
+        total = weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = np.sum(weights * self.values[neighbours], axis=1) / total
+        z[total == 0.0] = np.nan  # nothing within the search radius
+        return z
+
+    def interpolate(self, points, chunk_size=4096):
+        points = np.asarray(points, dtype=float)
+        if len(self.values) == 0:
+            return np.full(len(points), np.nan)
+        return np.concatenate([self._interpolate_chunk(points[start:start + chunk_size]) for start in range(0, len(points), chunk_size)])
+
+    def grid(self, gridx, gridy, chunk_size=4096):
+        # shaped (len(gridy), len(gridx)), the orientation plotly's Contour expects
+        grid_x, grid_y = np.meshgrid(gridx, gridy)
+        points = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+        return self.interpolate(points, chunk_size).reshape(grid_x.shape)
+
+
+def idw_grid(x, y, values, gridx, gridy, power=2.0, n_neighbours=12, search_radius=None, chunk_size=4096):
+    return IDWInterpolator(x, y, values, power, n_neighbours, search_radius).grid(gridx, gridy, chunk_size)
@@ -0,0 +1,100 @@
+"""
+Table driven routing of parsed geochemistry queries to their handlers.
+
+A route maps a set of intents (from query_lexer) to the per toposheet/element handlers that
+answer it. The most specific matching route wins (more intents first, then registration
+order), so "idw and kriging" reaches its combined route instead of stopping at "idw".
+Handlers are wrapped to record their latency per route, also as the
+ngdr_intent_duration_seconds histogram.
+"""
+import functools
+import threading
+import time
+from collections import deque, namedtuple
+
+import metrics
+
+
+Route = namedtuple('Route', ['name', 'intents', 'handlers'])
+
+intent_seconds = metrics.registry.histogram('ngdr_intent_duration_seconds', "Time to answer one toposheet/element item of a route.", ['intent'])
+
+
+class LatencyStats:
+    # count and total of every observation, percentiles over the most recent window
+
+    def __init__(self, window=1024):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.recent.append(seconds)
+
+    def summary(self):
+        with self._lock:
+            recent = sorted(self.recent)
+            count, total = self.count, self.total
+        if not recent:
+            return {"count": 0}
+
+        def percentile(q):
+            return recent[min(len(recent) - 1, int(q / 100 * len(recent)))] * 1000
+
+        return {"count": count, "mean_ms": total / count * 1000, "p50_ms": percentile(50), "p95_ms": percentile(95), "max_ms": recent[-1] * 1000}
+
+
+class IntentRouter:
+
+    def __init__(self):
+        self.routes = []
+        self.latency = {}
+        self.fast_path = 0
+        self.split_path = 0
+
+    def register(self, name, intents, *handlers):
+        latency = self.latency.setdefault(name, LatencyStats())
+        wrapped = tuple(self._timed(handler, name, latency) for handler in handlers)
+        self.routes.append(Route(name, frozenset(intents), wrapped))
+        # most specific first; sorted() is stable, so equally specific routes keep registration order
+        self.routes = sorted(self.routes, key=lambda route: -len(route.intents))
+
+    @staticmethod
+    def _timed(handler, name, latency):
+        @functools.wraps(handler)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                latency.observe(seconds)
+                intent_seconds.observe(seconds, intent=name)
+        return timed
+
+    def route(self, intents):
+        # the first route whose intents the query all has, or None
+        intents = set(intents)
+        for route in self.routes:
+            if route.intents <= intents:
+                return route
+        return None
+
+    def exact_route(self, intents):
+        # the route for exactly these intents, a query that needs it is single-intent
+        intents = frozenset(intents)
+        for route in self.routes:
+            if route.intents == intents:
+                return route
+        return None
+
+    def stats(self):
+        return {
+            "fast_path": self.fast_path,
+            "split_path": self.split_path,
+            "routes": {name: latency.summary() for name, latency in self.latency.items()},
+        }
@@ -0,0 +1,69 @@
+"""
+JSON encoding for responses that contain numpy data.
+
+When orjson is installed it serialises numpy arrays and scalars natively and writes NaN/inf
+as null, which takes float formatting (the real cost of a map response) out of Python.
+Without it, to_jsonable walks the response once: numpy arrays are converted with a single
+tolist() and only their non-finite entries are patched to None afterwards, numpy scalars
+become Python scalars, NaN/inf floats become null and tuples become lists. No object
+arrays are created. NumpyJSONProvider plugs either path into Flask's jsonify.
+"""
+import math
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # optional, the pure Python path below produces the same document
+    orjson = None
+
+
+def _array_to_list(array):
+    if array.ndim == 0:
+        return to_jsonable(array.item())
+    if array.dtype.kind == 'O':
+        return [to_jsonable(item) for item in array.tolist()]
+    values = array.tolist()
+    if array.dtype.kind in 'fc':
+        non_finite = ~np.isfinite(array)
+        if non_finite.any():
+            for index in zip(*np.nonzero(non_finite)):
+                target = values
+                for position in index[:-1]:
+                    target = target[position]
+                target[index[-1]] = None
+    return values
+
+
+def to_jsonable(obj):
+    if isinstance(obj, dict):
+        return {key: to_jsonable(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_jsonable(item) for item in obj]
+    if isinstance(obj, float):
+        # covers np.float64 too, which subclasses float
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, np.ndarray):
+        return _array_to_list(obj)
+    if isinstance(obj, np.generic):
+        return to_jsonable(obj.item())
+    return obj
+
+
+class NumpyJSONProvider(DefaultJSONProvider):
+    # key order is kept as built, sorting every payload dict is wasted work
+    sort_keys = False
+    use_orjson = orjson is not None
+
+    def _orjson_default(self, obj):
+        # orjson only takes C-contiguous arrays of native dtypes, everything else goes through to_jsonable
+        if isinstance(obj, (np.ndarray, np.generic)):
+            return to_jsonable(obj)
+        return self.default(obj)
+
+    def dumps(self, obj, **kwargs):
+        # pretty printing (debug mode) keeps the standard library encoder
+        if self.use_orjson and not kwargs.get('indent'):
+            return orjson.dumps(obj, default=self._orjson_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+        return super().dumps(to_jsonable(obj), **kwargs)
@@ -0,0 +1,266 @@
+"""
+Ordinary Kriging that shares the toposheet geometry between elements.
+
+The sample-to-sample and sample-to-grid distances only depend on the coordinates of a
+toposheet, so they are computed once and reused for every element kriged on that sheet.
+Each element still gets its own variogram fit, and elements whose kriging matrices are
+identical (same variogram parameters and same valid samples) share one factorisation
+and are solved together for every grid node. The maths follows pykrige's OrdinaryKriging
+with euclidean coordinates and no anisotropy, so results match OK.execute('grid', ...).
+
+For district or state sized extracts the global (n+1)x(n+1) system gets too expensive,
+krige_local solves a small system per grid node from its k nearest samples instead.
+"""
+import os
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import scipy.linalg
+from pykrige import core
+from pykrige.ok import OrdinaryKriging
+from scipy.spatial import cKDTree
+from scipy.spatial.distance import cdist, pdist
+
+from caches import LRUCache
+
+
+VARIOGRAM_FUNCTIONS = OrdinaryKriging.variogram_dict
+EPS = 1.0e-10  # same threshold pykrige uses to snap grid nodes onto samples
+
+KrigingResult = namedtuple('KrigingResult', ['z', 'variance', 'gridx', 'gridy', 'variogram_parameters'])
+
+
+class ToposheetGeometry:
+    """
+    Distances for one toposheet: samples to samples and samples to every node of the grid.
+    """
+
+    def __init__(self, x, y, grid_resolution=100, nlags=6):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        self.n = len(self.x)
+        self.nlags = nlags
+        self.gridx = np.linspace(self.x.min(), self.x.max(), grid_resolution)
+        self.gridy = np.linspace(self.y.min(), self.y.max(), grid_resolution)
+
+        samples = np.column_stack((self.x, self.y))
+        grid_x, grid_y = np.meshgrid(self.gridx, self.gridy)
+        nodes = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+        self.sample_distances = cdist(samples, samples, 'euclidean')
+        self.grid_distances = cdist(samples, nodes, 'euclidean')  # (n, ny * nx)
+        self.pair_rows, self.pair_cols = np.triu_indices(self.n, k=1)
+        self._all_bins = _lag_bins(self.sample_distances[self.pair_rows, self.pair_cols], nlags)
+
+    @property
+    def nbytes(self):
+        return self.sample_distances.nbytes + self.grid_distances.nbytes + self.pair_rows.nbytes + self.pair_cols.nbytes
+
+    def experimental_variogram(self, values, valid):
+        if valid.all():
+            d, bins = self._all_bins
+            g = 0.5 * (values[self.pair_rows] - values[self.pair_cols]) ** 2
+        else:
+            # samples with missing values are dropped, the distances are still reused
+            rows, cols = np.triu_indices(np.count_nonzero(valid), k=1)
+            positions = np.flatnonzero(valid)
+            d, bins = _lag_bins(self.sample_distances[positions[rows], positions[cols]], self.nlags)
+            subset = values[positions]
+            g = 0.5 * (subset[rows] - subset[cols]) ** 2
+        return _binned_semivariance(d, g, bins)
+
+
+def _lag_bins(d, nlags):
+    # equal width lag bins exactly as pykrige.core._initialize_variogram_model builds them
+    dmin, dmax = np.amin(d), np.amax(d)
+    dd = (dmax - dmin) / nlags
+    edges = [dmin + n * dd for n in range(nlags)] + [dmax + 0.001]
+    return d, [(d >= edges[n]) & (d < edges[n + 1]) for n in range(nlags)]
+
+
+def _binned_semivariance(d, g, bins):
+    lags = np.array([np.mean(d[in_bin]) if in_bin.any() else np.nan for in_bin in bins])
+    semivariance = np.array([np.mean(g[in_bin]) if in_bin.any() else np.nan for in_bin in bins])
+    keep = ~np.isnan(semivariance)
+    return lags[keep], semivariance[keep]
+
+
+def fit_variogram(geometry, values, valid, variogram_model, weight=False):
+    lags, semivariance = geometry.experimental_variogram(values, valid)
+    # least squares fit of pykrige, so automatic parameters are identical to OrdinaryKriging's
+    return core._calculate_variogram_model(lags, semivariance, variogram_model, VARIOGRAM_FUNCTIONS[variogram_model], weight)
+
+
+def _solve(geometry, valid, variogram_model, parameters, value_columns, return_variance=True):
+    variogram = VARIOGRAM_FUNCTIONS[variogram_model]
+    positions = np.flatnonzero(valid)
+    n = len(positions)
+
+    a = np.zeros((n + 1, n + 1))
+    a[:n, :n] = -variogram(parameters, geometry.sample_distances[np.ix_(positions, positions)])
+    np.fill_diagonal(a, 0.0)
+    a[n, :] = 1.0
+    a[:, n] = 1.0
+    a[n, n] = 0.0
+
+    bd = geometry.grid_distances[positions]
+    b = np.empty((n + 1, bd.shape[1]))
+    b[:n] = -variogram(parameters, bd)
+    b[:n][np.absolute(bd) <= EPS] = 0.0  # exact values at grid nodes that sit on a sample
+    b[n] = 1.0
+
+    # the inverse is the factorisation shared by every element of the group (pykrige inverts too)
+    a_inv = scipy.linalg.inv(a)
+    # dual form: fold the sample values into the weights first, so each element costs O(n * nodes)
+    z = (value_columns[positions].T @ a_inv[:n]) @ b  # (elements, nodes)
+    variance = None
+    if return_variance:
+        variance = np.einsum('ij,ij->j', a_inv @ b, -b)
+    return z, variance
+
+
+def krige_elements(x, y, values, variogram_model='spherical', variogram_parameters=None, grid_resolution=100, nlags=6, weight=False, geometry=None, return_variance=True):
+    """
+    Krige several elements sampled at the same locations.
+    `values` maps element -> array of sample values (NaN for missing samples).
+    Returns {element: KrigingResult} with grids shaped (len(gridy), len(gridx)) like OK.execute('grid').
+    The variance is the expensive part of the solve, skip it with return_variance=False when only z is shown.
+    """
+    if geometry is None:
+        geometry = ToposheetGeometry(x, y, grid_resolution, nlags)
+
+    # group elements whose kriging systems are identical so they share a factorisation
+    groups = {}
+    fitted = {}
+    for element, column in values.items():
+        column = np.asarray(column, dtype=float)
+        valid = ~np.isnan(column)
+        if variogram_parameters is not None:
+            parameters = list(variogram_parameters)
+        else:
+            parameters = list(fit_variogram(geometry, column, valid, variogram_model, weight))
+        fitted[element] = parameters
+        key = (valid.tobytes(), tuple(parameters))
+        groups.setdefault(key, []).append(element)
+
+    shape = (len(geometry.gridy), len(geometry.gridx))
+    results = {}
+    for (_, parameters), elements in groups.items():
+        valid = ~np.isnan(np.asarray(values[elements[0]], dtype=float))
+        value_columns = np.column_stack([np.asarray(values[element], dtype=float) for element in elements])
+        z, variance = _solve(geometry, valid, variogram_model, list(parameters), value_columns, return_variance)
+        if variance is not None:
+            variance = variance.reshape(shape)
+        for row, element in enumerate(elements):
+            results[element] = KrigingResult(z[row].reshape(shape), variance, geometry.gridx, geometry.gridy, fitted[element])
+    return results
+
+
+# Geometry of recently used toposheets, keyed by (toposheet, grid_resolution, nlags)
+geometry_cache = LRUCache(max_bytes=256 * 1024 * 1024, sizeof=lambda geometry: geometry.nbytes)
+
+
+def get_geometry(toposheet, x, y, grid_resolution=100, nlags=6):
+    key = (toposheet, grid_resolution, nlags)
+    geometry = geometry_cache.get(key)
+    if geometry is None:
+        geometry = ToposheetGeometry(x, y, grid_resolution, nlags)
+        geometry_cache.put(key, geometry)
+    return geometry
+
+
+def krige_toposheet(df, toposheet, elements, variogram_model='spherical', variogram_parameters=None, grid_resolution=100, nlags=6, weight=False, return_variance=True):
+    # batch entry point: one toposheet, many elements, geometry built once and cached
+    sheet = df[df['toposheet'] == toposheet]
+    geometry = get_geometry(toposheet, sheet['longitude'], sheet['latitude'], grid_resolution, nlags)
+    values = {element: sheet[element].to_numpy(dtype=float) for element in elements}
+    return krige_elements(None, None, values, variogram_model, variogram_parameters, grid_resolution, nlags, weight, geometry=geometry, return_variance=return_variance)
+
+
+def fit_variogram_sampled(x, y, values, variogram_model, nlags=6, weight=False, max_samples=1500, seed=0):
+    # the experimental variogram needs all sample pairs, so large sets are fitted on a random subset
+    if len(values) > max_samples:
+        keep = np.random.default_rng(seed).choice(len(values), max_samples, replace=False)
+        x, y, values = x[keep], y[keep], values[keep]
+    d, bins = _lag_bins(pdist(np.column_stack((x, y)), 'euclidean'), nlags)
+    g = 0.5 * pdist(values[:, None], 'sqeuclidean')
+    lags, semivariance = _binned_semivariance(d, g, bins)
+    return core._calculate_variogram_model(lags, semivariance, variogram_model, VARIOGRAM_FUNCTIONS[variogram_model], weight)
+
+
+def _solve_local_chunk(tree, sample_x, sample_y, sample_values, nodes, variogram, parameters, k, search_radius):
+    distances, neighbours = tree.query(nodes, k=k, distance_upper_bound=search_radius)
+    if k == 1:
+        distances, neighbours = distances[:, None], neighbours[:, None]
+    # neighbours outside the search radius come back with an infinite distance
+    missing = ~np.isfinite(distances)
+    empty = missing.all(axis=1)
+    neighbours = np.where(missing, 0, neighbours)
+    distances = np.where(missing, 0.0, distances)
+
+    nx, ny = sample_x[neighbours], sample_y[neighbours]
+    pair_distances = np.sqrt((nx[:, :, None] - nx[:, None, :]) ** 2 + (ny[:, :, None] - ny[:, None, :]) ** 2)
+
+    count = len(nodes)
+    a = np.empty((count, k + 1, k + 1))
+    a[:, :k, :k] = -variogram(parameters, pair_distances)
+    a[:, np.arange(k), np.arange(k)] = 0.0
+    a[:, k, :] = 1.0
+    a[:, :, k] = 1.0
+    a[:, k, k] = 0.0
+    b = np.empty((count, k + 1))
+    b[:, :k] = -variogram(parameters, distances)
+    b[:, :k][distances <= EPS] = 0.0  # exact values at grid nodes that sit on a sample
+    b[:, k] = 1.0
+
+    # missing neighbours get a zero weight: their row and column are replaced by the identity
+    node_index, slot = np.nonzero(missing)
+    a[node_index, slot, :] = 0.0
+    a[node_index, :, slot] = 0.0
+    a[node_index, slot, slot] = 1.0
+    b[node_index, slot] = 0.0
+    a[empty] = np.eye(k + 1)  # nothing within the radius, keeps the batch solvable
+
+    weights = np.linalg.solve(a, b[:, :, None])[:, :, 0]
+    z = np.sum(weights[:, :k] * sample_values[neighbours], axis=1)
+    variance = np.sum(weights * -b, axis=1)
+    z[empty] = np.nan
+    variance[empty] = np.nan
+    return z, variance
+
+
+def krige_local(x, y, values, variogram_model='spherical', variogram_parameters=None, n_neighbours=32, search_radius=None, grid_resolution=100, n_jobs=None, chunk_size=1024, nlags=6, weight=False):
+    """
+    Moving-window Ordinary Kriging: every grid node is kriged from its `n_neighbours` nearest
+    samples (optionally limited to `search_radius`), found with a KD-tree. Chunks of grid
+    nodes are solved in parallel on `n_jobs` threads (default: all cores).
+    Nodes without any sample inside the radius are NaN. Returns a KrigingResult.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    values = np.asarray(values, dtype=float)
+    gridx = np.linspace(x.min(), x.max(), grid_resolution)
+    gridy = np.linspace(y.min(), y.max(), grid_resolution)
+
+    valid = ~np.isnan(values)
+    x, y, values = x[valid], y[valid], values[valid]
+    if variogram_parameters is None:
+        variogram_parameters = fit_variogram_sampled(x, y, values, variogram_model, nlags, weight)
+    parameters = list(variogram_parameters)
+
+    tree = cKDTree(np.column_stack((x, y)))
+    k = min(n_neighbours, len(values))
+    radius = np.inf if search_radius is None else search_radius
+    grid_x, grid_y = np.meshgrid(gridx, gridy)
+    nodes = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+    variogram = VARIOGRAM_FUNCTIONS[variogram_model]
+
+    # the batched LAPACK solves release the GIL, so threads are enough to use every core
+    starts = range(0, len(nodes), chunk_size)
+    with ThreadPoolExecutor(max_workers=n_jobs or os.cpu_count()) as executor:
+        chunks = list(executor.map(lambda start: _solve_local_chunk(tree, x, y, values, nodes[start:start + chunk_size], variogram, parameters, k, radius), starts))
+
+    shape = (len(gridy), len(gridx))
+    z = np.concatenate([chunk[0] for chunk in chunks]).reshape(shape)
+    variance = np.concatenate([chunk[1] for chunk in chunks]).reshape(shape)
+    return KrigingResult(z, variance, gridx, gridy, parameters)
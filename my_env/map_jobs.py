@@ -0,0 +1,270 @@
+"""
+Background jobs for the interpolated maps.
+
+Kriging and IDW maps are queued and the request returns a job id straight away, so a burst of
+map requests no longer ties up the web workers that answer the cheap text queries. Finished
+jobs are kept for a TTL and then forgotten.
+
+The queue lives in a directory, so every web process sees the same jobs and any gunicorn worker
+can answer for a job another one accepted:
+
+    jobs/<id>.json      kind and query, written when the job is submitted
+    pending/<id>        queued; a runner claims it by renaming it into running/
+    running/<id>        being built
+    results/<id>.pkl    the result or the error, written last through os.replace
+
+MAP_JOB_WORKERS runner processes (python -m map_jobs) take the jobs in submission order. Under
+gunicorn the master creates the directory and starts the runners once for all workers
+(gunicorn.conf.py) and passes the directory in NGDR_MAP_JOB_DIR, so the pool is bounded for
+the whole server. A process started without it (python app.py, the benchmarks) gets a private
+directory and starts its own runners on the first submit.
+"""
+import atexit
+import json
+import os
+import pickle
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+
+MAP_JOB_WORKERS = int(os.getenv('MAP_JOB_WORKERS', '2'))
+MAP_JOB_MAX_PENDING = int(os.getenv('MAP_JOB_MAX_PENDING', '32'))
+MAP_JOB_TTL_SECONDS = float(os.getenv('MAP_JOB_TTL_SECONDS', '600'))
+
+JOB_DIR_ENV = 'NGDR_MAP_JOB_DIR'
+JOB_KINDS = ('kriging_map', 'idw_map')
+# how often runners look for new jobs and long polls for a result
+POLL_SECONDS = 0.05
+SUBDIRS = ('jobs', 'pending', 'running', 'results')
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def _warm_worker():
+    # load the dataset, statistics index and map engines once per runner process, not once per job
+    import geo_chem
+    import idw_engine  # noqa: F401
+    import kriging_engine  # noqa: F401
+    geo_chem.load_dataset()
+
+
+def run_map_job(kind, query, toposheet=None, element=None):
+    # executed in a runner process, builds on the same helpers as the synchronous endpoint
+    import geo_chem
+    if toposheet is not None and element is not None:
+        # one work item of a chat message, answered (and cached) like the in-request path does
+        handler = geo_chem.kriging_map_for if kind == 'kriging_map' else geo_chem.idw_map_for
+        return [geo_chem._run_work_item(handler, geo_chem.load_dataset()[0], toposheet, element)]
+    if kind == 'kriging_map':
+        response = geo_chem.create_kriging_map_from_query(query, geo_chem.Nagpur_gdf)
+    else:
+        response = geo_chem.create_idw_map_from_query(query, geo_chem.Nagpur_gdf)
+    if response is None:
+        response = geo_chem.UNANSWERED_MESSAGE
+    # one (response, data_type) per toposheet/element pair, like the NGDR endpoint
+    responses = response if isinstance(response, list) else [response]
+    return [(item, geo_chem.response_data_type(item)) for item in responses]
+
+
+def job_kind_for_query(query):
+    import geo_chem
+    intents = geo_chem.parse_query(query).intents
+    if 'kriging' in intents:
+        return 'kriging_map'
+    if 'idw' in intents:
+        return 'idw_map'
+    return None
+
+
+def create_job_dir():
+    path = tempfile.mkdtemp(prefix='ngdr-map-jobs-')
+    for name in SUBDIRS:
+        os.makedirs(os.path.join(path, name), exist_ok=True)
+    return path
+
+
+def start_runners(job_dir, count):
+    # runner processes that exit on their own once this process is gone
+    module_dir = os.path.dirname(os.path.abspath(__file__))
+    return [subprocess.Popen([sys.executable, '-m', 'map_jobs', job_dir, str(os.getpid())], cwd=module_dir) for _ in range(count)]
+
+
+def stop_runners(runners, job_dir=None):
+    for runner in runners:
+        runner.terminate()
+    for runner in runners:
+        try:
+            runner.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            runner.kill()
+    if job_dir:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def _claim(job_dir):
+    # the oldest pending job this runner managed to move into running/, or None
+    pending = os.path.join(job_dir, 'pending')
+    for job_id in sorted(os.listdir(pending)):
+        try:
+            os.rename(os.path.join(pending, job_id), os.path.join(job_dir, 'running', job_id))
+        except OSError:
+            # another runner took it first (or, on Windows, the submitter still has it open)
+            continue
+        return job_id
+    return None
+
+
+def _run_claimed(job_dir, job_id):
+    with open(os.path.join(job_dir, 'jobs', job_id + '.json')) as f:
+        job = json.load(f)
+    try:
+        outcome = {'status': 'done', 'result': run_map_job(job['kind'], job['query'], job.get('toposheet'), job.get('element'))}
+    except Exception as e:
+        outcome = {'status': 'failed', 'error': str(e)}
+    outcome['finished'] = time.time()
+    _write_atomic(os.path.join(job_dir, 'results', job_id + '.pkl'), pickle.dumps(outcome))
+    os.remove(os.path.join(job_dir, 'running', job_id))
+
+
+def run_jobs(job_dir, parent_pid):
+    # runner loop, until the process that started it exits or removes the directory
+    _warm_worker()
+    while os.getppid() == parent_pid and os.path.isdir(job_dir):
+        job_id = _claim(job_dir)
+        if job_id is None:
+            time.sleep(POLL_SECONDS)
+        else:
+            _run_claimed(job_dir, job_id)
+
+
+class MapJobQueue:
+
+    def __init__(self, max_workers=MAP_JOB_WORKERS, max_pending=MAP_JOB_MAX_PENDING, ttl_seconds=MAP_JOB_TTL_SECONDS, job_dir=None):
+        """
+        job_dir: the shared queue directory, NGDR_MAP_JOB_DIR by default. Without one the
+        queue makes a private directory and runs its own max_workers runners.
+        """
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self.job_dir = job_dir
+        self._runners = []  # started by this queue for its private directory
+
+    def _started(self):
+        return self.job_dir is not None or os.getenv(JOB_DIR_ENV) is not None
+
+    def _get_job_dir(self):
+        # NGDR_MAP_JOB_DIR is read on first use, the gunicorn master sets it after importing this module
+        if self.job_dir is None:
+            self.job_dir = os.getenv(JOB_DIR_ENV)
+        if self.job_dir is None:
+            self.job_dir = create_job_dir()
+            self._runners = start_runners(self.job_dir, self.max_workers)
+            atexit.register(self.shutdown)
+        return self.job_dir
+
+    def _path(self, *parts):
+        return os.path.join(self._get_job_dir(), *parts)
+
+    def _purge_expired(self):
+        now = time.time()
+        for name in os.listdir(self._path('results')):
+            job_id, extension = os.path.splitext(name)
+            if extension != '.pkl':
+                continue
+            try:
+                if now - os.path.getmtime(self._path('results', name)) > self.ttl_seconds:
+                    os.remove(self._path('results', name))
+                    os.remove(self._path('jobs', job_id + '.json'))
+            except OSError:
+                # purged by another process at the same time
+                pass
+
+    def _pending(self):
+        return len(os.listdir(self._path('pending'))) + len(os.listdir(self._path('running')))
+
+    def submit(self, kind, query, toposheet=None, element=None):
+        """
+        Queue a map and return its job id. With toposheet and element only that pair is built,
+        otherwise every pair the query mentions. Raises QueueFullError past max_pending.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown map job kind: {kind}")
+        self._purge_expired()
+        if self._pending() >= self.max_pending:
+            raise QueueFullError(f"{self.max_pending} map jobs are already queued")
+        # ids sort in submission order, the runners take the oldest first
+        job_id = f"{time.time_ns():016x}{uuid.uuid4().hex[:16]}"
+        job = {'kind': kind, 'query': query, 'toposheet': toposheet, 'element': element, 'submitted': time.time()}
+        _write_atomic(self._path('jobs', job_id + '.json'), json.dumps(job).encode())
+        open(self._path('pending', job_id), 'w').close()
+        return job_id
+
+    def status(self, job_id, wait=0.0):
+        """
+        Job state as a dict, or None for an unknown/expired id.
+        With wait > 0 the call blocks up to that many seconds for the job to finish (long polling).
+        """
+        if not self._started() or not JOB_ID_PATTERN.match(job_id):
+            return None
+        self._purge_expired()
+        try:
+            with open(self._path('jobs', job_id + '.json')) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            return None
+        result_path = self._path('results', job_id + '.pkl')
+        deadline = time.monotonic() + wait
+        while not os.path.exists(result_path) and time.monotonic() < deadline:
+            time.sleep(POLL_SECONDS)
+
+        state = {'job_id': job_id, 'kind': job['kind'], 'query': job['query'], 'submitted': job['submitted'], 'finished': None}
+        try:
+            with open(result_path, 'rb') as f:
+                outcome = pickle.load(f)
+        except FileNotFoundError:
+            state['status'] = 'running' if os.path.exists(self._path('running', job_id)) else 'pending'
+            return state
+        state['finished'] = outcome['finished']
+        state['status'] = outcome['status']
+        if outcome['status'] == 'done':
+            state['result'] = outcome['result']
+        else:
+            state['error'] = outcome['error']
+        return state
+
+    def stats(self):
+        if not self._started():
+            # a private queue starts its runners on the first submit, not when it is looked at
+            return {'jobs': 0, 'pending': 0, 'max_pending': self.max_pending, 'workers': self.max_workers}
+        self._purge_expired()
+        return {'jobs': len(os.listdir(self._path('jobs'))), 'pending': self._pending(), 'max_pending': self.max_pending, 'workers': self.max_workers}
+
+    def shutdown(self):
+        # stops the runners this queue started, a shared queue belongs to the gunicorn master
+        if self._runners:
+            stop_runners(self._runners, self.job_dir)
+            self._runners = []
+            self.job_dir = None
+
+
+map_jobs = MapJobQueue()
+
+
+if __name__ == "__main__":
+    run_jobs(sys.argv[1], int(sys.argv[2]))
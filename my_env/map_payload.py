@@ -0,0 +1,86 @@
+"""
+Compact wire format for the interpolated maps.
+
+Instead of a full Plotly figure (sent twice, with the grid as nested lists of floats) a map
+response carries the grid as a base64 float32 buffer with a bit-packed NaN mask, the axes as
+linspace descriptors, the sample points and a small layout descriptor. getMap in
+templates/index.html rebuilds the Plotly figure from it on the client.
+
+    {
+      "format": "compact-map/1",
+      "kind": "kriging_map" | "idw_map",
+      "grid": {"x": axis, "y": axis, "z": array},     # z shaped [len(y), len(x)]
+      "points": {"x": array, "y": array, "values": array | null, "name": str, "color": str | null, "size": int, "outline": bool},
+      "layout": {"title": str, "annotations": [{"text": str, "y": float}], "colorscale": str,
+                 "colorbar_title": str | null, "x_title": str | null, "y_title": str | null, "margin_top": int | null}
+    }
+    axis  = {"start": float, "stop": float, "count": int}
+    array = {"dtype": "float32" | "float64", "shape": [int, ...], "data": base64, "nan_mask": base64 | null}
+"""
+import base64
+
+import numpy as np
+
+
+FORMAT = 'compact-map/1'
+
+
+def encode_array(values, dtype='float32'):
+    values = np.ascontiguousarray(values, dtype=dtype)
+    nan = np.isnan(values)
+    nan_mask = None
+    if nan.any():
+        # NaNs go to the client as a bit mask (little bit order) and are sent as zeros
+        nan_mask = base64.b64encode(np.packbits(nan.ravel(), bitorder='little').tobytes()).decode('ascii')
+        values = np.where(nan, 0, values).astype(dtype)
+    return {
+        'dtype': values.dtype.name,
+        'shape': list(values.shape),
+        'data': base64.b64encode(values.astype(values.dtype.newbyteorder('<')).tobytes()).decode('ascii'),
+        'nan_mask': nan_mask,
+    }
+
+
+def decode_array(encoded):
+    # inverse of encode_array, used by tests/test_map_payload.py (the browser has its own decoder)
+    values = np.frombuffer(base64.b64decode(encoded['data']), dtype=np.dtype(encoded['dtype']).newbyteorder('<'))
+    values = values.astype(encoded['dtype']).reshape(encoded['shape'])
+    if encoded['nan_mask'] is not None:
+        bits = np.frombuffer(base64.b64decode(encoded['nan_mask']), dtype=np.uint8)
+        nan = np.unpackbits(bits, count=values.size, bitorder='little').astype(bool).reshape(values.shape)
+        values = np.where(nan, np.nan, values)
+    return values
+
+
+def encode_axis(axis):
+    # the map axes are always np.linspace grids, so three numbers describe them exactly
+    axis = np.asarray(axis, dtype=float)
+    return {'start': float(axis[0]), 'stop': float(axis[-1]), 'count': int(len(axis))}
+
+
+def build_map_payload(kind, gridx, gridy, z, points_x, points_y, point_values=None, point_name=None, point_color=None, point_size=6, point_outline=False,
+                      title='', annotations=(), colorscale='Viridis', colorbar_title=None, x_title=None, y_title=None, margin_top=None):
+    return {
+        'format': FORMAT,
+        'kind': kind,
+        'grid': {'x': encode_axis(gridx), 'y': encode_axis(gridy), 'z': encode_array(z)},
+        'points': {
+            # sample coordinates and values keep full precision, they are shown in hover text
+            'x': encode_array(points_x, 'float64'),
+            'y': encode_array(points_y, 'float64'),
+            'values': None if point_values is None else encode_array(point_values, 'float64'),
+            'name': point_name,
+            'color': point_color,
+            'size': point_size,
+            'outline': point_outline,
+        },
+        'layout': {
+            'title': title,
+            'annotations': [{'text': text, 'y': y} for text, y in annotations],
+            'colorscale': colorscale,
+            'colorbar_title': colorbar_title,
+            'x_title': x_title,
+            'y_title': y_title,
+            'margin_top': margin_top,
+        },
+    }
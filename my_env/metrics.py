@@ -0,0 +1,340 @@
+"""
+In-process metrics and structured events, exposed in the Prometheus text format by /metrics.
+
+Counters, gauges and histograms keep their values per label set in plain dicts behind a lock,
+so recording is a dict update. Callback metrics read values (cache statistics, queue sizes)
+only when /metrics is scraped.
+
+event() replaces the per-request prints: it counts the event and, when the 'ngdr.events'
+logger is enabled for its level (NGDR_EVENT_LOG_LEVEL, e.g. DEBUG), logs it as one JSON line.
+Disabled events cost a counter increment and a level check.
+
+Under gunicorn every worker has its own registry. The master sets NGDR_METRICS_DIR
+(gunicorn.conf.py) and every worker writes a snapshot of its registry there every
+NGDR_METRICS_FLUSH_SECONDS and when it exits. Whichever worker is scraped renders all the
+snapshots: counters and histograms are summed over the workers, those that exited included, so
+they never go back; gauges keep one series per live worker with a worker="<pid>" label. Shared
+callback metrics (the map job queue, the same for every worker) come from the scraped worker.
+"""
+import bisect
+import contextlib
+import functools
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+
+METRICS_DIR_ENV = 'NGDR_METRICS_DIR'
+FLUSH_SECONDS = float(os.getenv('NGDR_METRICS_FLUSH_SECONDS', '1'))
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + [f'{name}="{value}"' for name, value in extra]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = 'untyped'
+    shared = False  # the same value in every process, rendered from the scraped one only
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, '') for name in self.labelnames)
+
+    def samples(self):
+        # (suffix, label values, extra labels, value) for the exposition
+        with self._lock:
+            return [('', key, (), value) for key, value in self._values.items()]
+
+    def render(self):
+        return _render(self.name, self.help, self.type, self.labelnames, self.samples())
+
+
+def _render(name, help, type, labelnames, samples):
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+    for suffix, key, extra, value in samples:
+        lines.append(f"{name}{suffix}{_labels(labelnames, key, extra)} {_number(value)}")
+    return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            states = [(key, list(counts), total, count) for key, (counts, total, count) in self._values.items()]
+        samples = []
+        for key, counts, total, count in states:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', key, (('le', _number(bound)),), cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), count))
+        return samples
+
+
+class CallbackMetric(Metric):
+    # values come from function() at scrape time, as {label values tuple: value}
+
+    def __init__(self, name, help, labelnames, function, type='gauge', shared=False):
+        super().__init__(name, help, labelnames)
+        self.function = function
+        self.type = type
+        self.shared = shared
+
+    def samples(self):
+        return [('', key, (), value) for key, value in self.function().items()]
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # modules imported twice (benchmarks, reloads) get the existing metric back
+            return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=()):
+        return self.register(Gauge(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, labelnames, function, type='gauge', shared=False):
+        with self._lock:
+            # the latest callback wins, it reads the current objects
+            self.metrics[name] = CallbackMetric(name, help, labelnames, function, type, shared)
+            return self.metrics[name]
+
+    def _samples(self, metric):
+        try:
+            return metric.samples()
+        except Exception as e:  # one failing callback must not break the scrape
+            event('metrics_render_failed', level=logging.WARNING, metric=metric.name, error=repr(e))
+            return None
+
+    def render(self):
+        directory = os.getenv(METRICS_DIR_ENV)
+        if directory:
+            return self.render_workers(directory)
+        lines = []
+        for metric in list(self.metrics.values()):
+            samples = self._samples(metric)
+            if samples is not None:
+                lines.extend(_render(metric.name, metric.help, metric.type, metric.labelnames, samples))
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        # the per process metrics as JSON-able [name, help, type, labelnames, samples]
+        snapshot = []
+        for metric in list(self.metrics.values()):
+            samples = None if metric.shared else self._samples(metric)
+            if samples is not None:
+                snapshot.append([metric.name, metric.help, metric.type, metric.labelnames, samples])
+        return snapshot
+
+    def flush(self, directory=None):
+        # writes this process's snapshot to <directory>/<pid>.json
+        directory = directory or os.getenv(METRICS_DIR_ENV)
+        if not directory:
+            return
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        # per thread, the flushing thread and a scrape may write at the same time
+        tmp_path = f"{path}.tmp-{threading.get_ident()}"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def render_workers(self, directory):
+        self.flush(directory)
+        merged = {}  # name -> (help, type, labelnames, {(suffix, key, extra): value})
+        for name in sorted(os.listdir(directory)):
+            pid, extension = os.path.splitext(name)
+            if extension != '.json':
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for metric_name, help, type, labelnames, samples in snapshot:
+                values = merged.setdefault(metric_name, (help, type, tuple(labelnames), {}))[3]
+                for suffix, key, extra, value in samples:
+                    extra = tuple(tuple(pair) for pair in extra)
+                    if type not in ('counter', 'histogram'):
+                        extra += (('worker', pid),)
+                    sample = (suffix, tuple(key), extra)
+                    values[sample] = values.get(sample, 0) + value
+        lines = []
+        for metric_name, (help, type, labelnames, values) in merged.items():
+            lines.extend(_render(metric_name, help, type, labelnames, [(suffix, key, extra, value) for (suffix, key, extra), value in values.items()]))
+        for metric in list(self.metrics.values()):
+            samples = self._samples(metric) if metric.shared else None
+            if samples is not None:
+                lines.extend(_render(metric.name, metric.help, metric.type, metric.labelnames, samples))
+        return '\n'.join(lines) + '\n'
+
+    def start_flushing(self, interval=FLUSH_SECONDS):
+        # a daemon thread writing the snapshot, when NGDR_METRICS_DIR is set
+        if not os.getenv(METRICS_DIR_ENV):
+            return
+
+        def flush_forever():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.flush()
+                except OSError:
+                    pass
+
+        threading.Thread(target=flush_forever, name='metrics-flush', daemon=True).start()
+
+
+registry = Registry()
+
+
+def mark_process_dead(pid, directory=None):
+    # keeps the counters and histograms of an exited worker, its gauges no longer apply
+    directory = directory or os.getenv(METRICS_DIR_ENV)
+    if not directory:
+        return
+    path = os.path.join(directory, f"{pid}.json")
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump([metric for metric in snapshot if metric[2] in ('counter', 'histogram')], f)
+    os.replace(f"{path}.tmp", path)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+stage_seconds = registry.histogram('ngdr_stage_duration_seconds', "Time spent in a stage of the geochemistry pipeline.", ['stage'])
+events_total = registry.counter('ngdr_events_total', "Structured events emitted, by event name.", ['event'])
+errors_total = registry.counter('ngdr_errors_total', "Errors caught while answering, by where they happened.", ['where'])
+
+
+def timed_stage(stage):
+    # decorator recording every call of the function in ngdr_stage_duration_seconds{stage=...}
+    def decorator(function):
+        @functools.wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stage_seconds.observe(time.perf_counter() - start, stage=stage)
+        return timed
+    return decorator
+
+
+def cache_metrics(caches):
+    """
+    Registers hit/miss counters, hit ratio and size gauges for {name: callable returning a stats() dict}.
+    """
+    def values(field):
+        def read():
+            result = {}
+            for name, stats in caches.items():
+                value = stats().get(field)
+                if value is not None:
+                    result[(name,)] = value
+            return result
+        return read
+
+    registry.callback('ngdr_cache_hits_total', "Cache hits.", ['cache'], values('hits'), type='counter')
+    registry.callback('ngdr_cache_misses_total', "Cache misses.", ['cache'], values('misses'), type='counter')
+    registry.callback('ngdr_cache_hit_ratio', "Hits over lookups since start.", ['cache'], values('hit_ratio'))
+    registry.callback('ngdr_cache_entries', "Entries held.", ['cache'], values('entries'))
+    registry.callback('ngdr_cache_bytes', "Estimated bytes held.", ['cache'], values('current_bytes'))
+
+
+event_log = logging.getLogger('ngdr.events')
+if os.getenv('NGDR_EVENT_LOG_LEVEL'):
+    event_log.setLevel(os.getenv('NGDR_EVENT_LOG_LEVEL').upper())
+    event_log.addHandler(logging.StreamHandler())
+    event_log.propagate = False
+
+
+def event(name, level=logging.DEBUG, **fields):
+    events_total.inc(event=name)
+    if event_log.isEnabledFor(level):
+        event_log.log(level, json.dumps({'event': name, 'time': time.time(), **fields}, default=str))
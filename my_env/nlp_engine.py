@@ -0,0 +1,72 @@
+import logging
+import threading
+
+
+MODEL_NAME = "en_core_web_sm"
+
+# split_query_smartly only looks at token.text and token.text_with_ws, none of the
+# statistical components of en_core_web_sm are needed to split a query
+UNUSED_COMPONENTS = ["tok2vec", "tagger", "parser", "attribute_ruler", "lemmatizer", "ner", "senter"]
+
+log = logging.getLogger(__name__)
+# models already reported missing, the fallback is logged once per process
+_missing_models = set()
+
+
+class NLPEngine:
+    """
+    Process-wide spaCy pipeline that is loaded once and shared by every request.
+    mode="tokenizer" only runs the tokenizer, mode="pipeline" runs whatever components are left after `exclude`.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, mode="tokenizer", exclude=UNUSED_COMPONENTS):
+        if mode not in ("tokenizer", "pipeline"):
+            raise ValueError(f"Unknown NLP engine mode: {mode}")
+        self.model_name = model_name
+        self.mode = mode
+        self.exclude = list(exclude)
+        self._nlp = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        # double checked so that concurrent first requests only load the model once
+        if self._nlp is None:
+            with self._lock:
+                if self._nlp is None:
+                    self._nlp = self._load_pipeline()
+        return self._nlp
+
+    def _load_pipeline(self):
+        # spaCy is imported here, importing it costs close to a second and only split queries need it
+        import spacy
+        try:
+            return spacy.load(self.model_name, exclude=self.exclude)
+        except OSError:
+            # model package is not installed, the English tokenizer rules ship with spaCy itself
+            if self.model_name not in _missing_models:
+                _missing_models.add(self.model_name)
+                log.warning("spaCy model '%s' not found, falling back to the blank English tokenizer", self.model_name)
+            return spacy.blank("en")
+
+    @property
+    def is_loaded(self):
+        return self._nlp is not None
+
+    def __call__(self, text):
+        nlp = self.load()
+        if self.mode == "tokenizer":
+            return nlp.make_doc(text)
+        return nlp(text)
+
+
+default_engine = NLPEngine()
+
+
+def get_engine():
+    return default_engine
+
+
+def warm_up():
+    # called at worker startup so the first user request does not pay for the model load
+    default_engine.load()
+    return default_engine
@@ -0,0 +1,152 @@
+"""
+Opt-in cProfile profiling of single Flask requests.
+
+Nothing is profiled unless NGDR_PROFILE_DIR is set; without it profile_requests() returns the
+view unchanged and propagate() costs one context variable lookup. With it, a request is profiled when
+
+    - it sends the X-NGDR-Profile header or the ?profile= query parameter (equal to
+      NGDR_PROFILE_TOKEN when that is set), or
+    - it is drawn by NGDR_PROFILE_SAMPLE_RATE (0.0 to 1.0, default 0).
+
+cProfile only sees the thread it runs on, so work the handler hands to a thread pool is wrapped
+with propagate() at submit time: it runs under its own profiler, and its stats are merged into the
+request's profile. Each profile is written as <id>.prof (open it with pstats or snakeviz) next to
+<id>.json holding the route, query, parse, duration and the slowest functions. The id is returned
+in the X-NGDR-Profile-Id response header.
+"""
+import contextvars
+import cProfile
+import functools
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+
+from flask import make_response, request
+
+import metrics
+
+
+PROFILE_DIR = os.getenv('NGDR_PROFILE_DIR')
+PROFILE_SAMPLE_RATE = float(os.getenv('NGDR_PROFILE_SAMPLE_RATE', '0'))
+PROFILE_TOKEN = os.getenv('NGDR_PROFILE_TOKEN')
+PROFILE_HEADER = 'X-NGDR-Profile'
+TOP_FUNCTIONS = 25
+
+_session = contextvars.ContextVar('ngdr_profile_session', default=None)
+
+
+class ProfileSession:
+    # the profilers of one request: its own and those of the pool threads that worked for it
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.thread_profilers = []
+        self._lock = threading.Lock()
+
+    def add_thread_profiler(self, profiler):
+        with self._lock:
+            self.thread_profilers.append(profiler)
+
+    def stats(self):
+        stats = pstats.Stats(self.profiler)
+        with self._lock:
+            for profiler in self.thread_profilers:
+                stats.add(profiler)
+        return stats
+
+
+def propagate(function):
+    """
+    Wraps function, about to be submitted to a thread pool, so that it is profiled as part of the
+    current request. Returns function itself when no request is being profiled.
+    """
+    session = _session.get()
+    if session is None:
+        return function
+
+    @functools.wraps(function)
+    def profiled(*args, **kwargs):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profiler.disable()
+            session.add_thread_profiler(profiler)
+    return profiled
+
+
+def _trigger():
+    # why this request is profiled, or None
+    requested = request.headers.get(PROFILE_HEADER) or request.args.get('profile')
+    if requested and requested.lower() not in ('0', 'false', 'no') and (PROFILE_TOKEN is None or requested == PROFILE_TOKEN):
+        return 'request'
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return 'sample'
+    return None
+
+
+def _top_functions(stats):
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({'function': f"{os.path.basename(filename)}:{line}({name})", 'calls': calls, 'own_seconds': own, 'cumulative_seconds': cumulative})
+    rows.sort(key=lambda row: -row['cumulative_seconds'])
+    return rows[:TOP_FUNCTIONS]
+
+
+def _write(profile_id, session, metadata):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stats = session.stats()
+    stats.dump_stats(os.path.join(PROFILE_DIR, profile_id + '.prof'))
+    metadata['threads'] = 1 + len(session.thread_profilers)
+    metadata['top_functions'] = _top_functions(stats)
+    with open(os.path.join(PROFILE_DIR, profile_id + '.json'), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2, default=str)
+
+
+def profile_requests(name, describe=None):
+    """
+    Decorator for a Flask view. describe(request) returns extra metadata for the profile
+    (the query, its parse); it runs after the profiler has stopped.
+    """
+    def decorator(view):
+        if not PROFILE_DIR:
+            return view
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            trigger = _trigger()
+            if trigger is None:
+                return view(*args, **kwargs)
+
+            profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}"
+            session = ProfileSession()
+            token = _session.set(session)
+            started = time.time()
+            start = time.perf_counter()
+            session.profiler.enable()
+            try:
+                response = make_response(view(*args, **kwargs))
+            finally:
+                session.profiler.disable()
+                seconds = time.perf_counter() - start
+                _session.reset(token)
+
+            metadata = {'id': profile_id, 'route': request.path, 'trigger': trigger, 'started': started, 'duration_seconds': seconds,
+                        'status': response.status_code}
+            try:
+                if describe is not None:
+                    metadata.update(describe(request))
+                _write(profile_id, session, metadata)
+                metrics.event('request_profiled', id=profile_id, route=request.path, trigger=trigger, seconds=seconds)
+                response.headers['X-NGDR-Profile-Id'] = profile_id
+            except Exception as e:  # a failed write must not fail the request it profiled
+                metrics.event('profile_write_failed', level=logging.WARNING, id=profile_id, error=repr(e))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,96 @@
+"""
+Single pass lexer for geochemistry queries.
+
+One compiled regex (an alternation of named groups, longest alternatives first) scans the query
+once and yields the toposheet numbers, elements, intents and numeric constraints it mentions.
+Every alternative is delimited on both sides, so 'min' no longer matches "mining" and 'tin'
+no longer matches "plotting".
+"""
+import functools
+import re
+from collections import namedtuple
+
+
+QueryParse = namedtuple('QueryParse', ['text', 'intents', 'elements', 'toposheets', 'constraints'])
+# op is '>', '>=', '<', '<=' or 'between' (value is then the lower and upper the upper bound)
+NumericConstraint = namedtuple('NumericConstraint', ['op', 'value', 'upper'])
+
+# spelling -> intent
+INTENT_WORDS = {
+    'maximum': 'max', 'maxima': 'max', 'max': 'max',
+    'minimum': 'min', 'minima': 'min', 'min': 'min',
+    'kriging': 'kriging', 'kriged': 'kriging',
+    'inverse distance weighted': 'idw', 'idw': 'idw',
+}
+
+# comparison words -> operator
+COMPARISON_WORDS = {
+    'greater than or equal to': '>=', 'at least': '>=', '>=': '>=',
+    'less than or equal to': '<=', 'at most': '<=', '<=': '<=',
+    'greater than': '>', 'more than': '>', 'higher than': '>', 'above': '>', 'over': '>', 'exceeding': '>', '>': '>',
+    'less than': '<', 'lower than': '<', 'below': '<', 'under': '<', '<': '<',
+}
+
+NUMBER = r'\d+(?:\.\d+)?'
+
+
+def _alternation(words):
+    """
+    Regex matching any of words, factored as a prefix trie ("ma(?:x(?:im(?:um|a))?|...)") so the
+    engine follows one branch per character instead of trying every word. Longer words are tried
+    before their prefixes, so "maximum" wins over "max".
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word.lower():
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        pattern = branches[0] if len(branches) == 1 and '' not in node else '(?:' + '|'.join(branches) + ')'
+        return pattern + '?' if '' in node else pattern
+
+    return build(trie)
+
+
+class QueryLexer:
+
+    def __init__(self, chemicals):
+        """
+        chemicals: {name: formula}; both the names and the formulas are recognised and reported as the formula.
+        """
+        self.elements = {}
+        for name, formula in chemicals.items():
+            self.elements[name.lower()] = formula
+            self.elements[formula.lower()] = formula
+        self.pattern = re.compile(
+            r'(?<![\w(])(?:'
+            r'(?P<toposheet>\d+[a-z]+\d+)'
+            rf'|between\s+(?P<low>{NUMBER})\s+and\s+(?P<high>{NUMBER})'
+            rf'|(?P<comparison>{_alternation(COMPARISON_WORDS)})\s*(?P<value>{NUMBER})'
+            rf'|(?P<intent>{_alternation(INTENT_WORDS)})'
+            rf'|(?P<element>{_alternation(self.elements)})'
+            r')(?![\w)])',
+            re.IGNORECASE,
+        )
+        self.lex = functools.lru_cache(maxsize=4096)(self._lex)
+
+    def _lex(self, text):
+        intents, elements, toposheets, constraints = {}, {}, {}, []
+        for match in self.pattern.finditer(text):
+            if match.group('toposheet'):
+                toposheets[match.group('toposheet').upper()] = None
+            elif match.group('low'):
+                constraints.append(NumericConstraint('between', float(match.group('low')), float(match.group('high'))))
+            elif match.group('comparison'):
+                constraints.append(NumericConstraint(COMPARISON_WORDS[match.group('comparison').lower()], float(match.group('value')), None))
+            elif match.group('intent'):
+                intents[INTENT_WORDS[match.group('intent').lower()]] = None
+            elif match.group('element'):
+                elements[self.elements[match.group('element').lower()]] = None
+        # dicts keep the first mention of everything, in order
+        return QueryParse(text, tuple(intents), tuple(elements), tuple(toposheets), tuple(constraints))
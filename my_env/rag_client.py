@@ -0,0 +1,199 @@
+"""
+Long-lived HTTP client for the RAG server.
+
+One requests.Session per process keeps connections to SERVER_URL alive between chat
+messages, so a question no longer pays a TCP/TLS handshake. Every call has connect/read
+timeouts, and connection errors and 502/503/504 answers are retried a bounded number of
+times with exponential backoff. POST is retried as well because /chatbot only reads.
+The configuration comes from the environment (and .env) once, at import.
+
+The chat answers are post-processed here as well: format_answer for a whole answer and
+StreamingAnswerFormatter for an answer that arrives in chunks.
+"""
+import os
+import re
+import time
+
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics
+
+
+load_dotenv()
+
+RAG_SERVER_URL = os.getenv('SERVER_URL')
+# connections kept per host, set it to the number of request threads of a web worker
+RAG_POOL_SIZE = int(os.getenv('RAG_POOL_SIZE', '10'))
+RAG_CONNECT_TIMEOUT = float(os.getenv('RAG_CONNECT_TIMEOUT', '3.05'))
+RAG_READ_TIMEOUT = float(os.getenv('RAG_READ_TIMEOUT', '60'))
+RAG_RETRIES = int(os.getenv('RAG_RETRIES', '2'))
+RAG_BACKOFF = float(os.getenv('RAG_BACKOFF', '0.3'))
+
+RETRY_STATUSES = (502, 503, 504)
+
+upstream_seconds = metrics.registry.histogram('ngdr_rag_upstream_duration_seconds', "RAG server round trip, the whole answer for streams.", ['mode'])
+upstream_first_chunk_seconds = metrics.registry.histogram('ngdr_rag_upstream_first_chunk_seconds', "Time to the first streamed chunk of a RAG answer.")
+upstream_errors_total = metrics.registry.counter('ngdr_rag_upstream_errors_total', "Failed RAG server calls, by kind (timeout, connection, http_<status>, other).", ['kind'])
+
+
+def _default_to_utf8(response):
+    # requests reads text/* without a charset as ISO-8859-1, the RAG server sends UTF-8
+    if 'charset=' not in response.headers.get('Content-Type', '').lower():
+        response.encoding = 'utf-8'
+
+
+def _error_kind(error):
+    if isinstance(error, requests.Timeout):
+        return 'timeout'
+    if isinstance(error, requests.ConnectionError):
+        return 'connection'
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f'http_{error.response.status_code}'
+    return 'other'
+
+
+class RAGClient:
+
+    def __init__(self, server_url=RAG_SERVER_URL, pool_size=RAG_POOL_SIZE, connect_timeout=RAG_CONNECT_TIMEOUT, read_timeout=RAG_READ_TIMEOUT,
+                 retries=RAG_RETRIES, backoff=RAG_BACKOFF):
+        self.server_url = (server_url or '').rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,  # a read timeout already waited read_timeout, retrying it would multiply the wait
+            status=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({'POST'}),
+            raise_on_status=False,  # the last 5xx response is returned to the caller as is
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @property
+    def configured(self):
+        return bool(self.server_url)
+
+    def ask(self, query, topic, **kwargs):
+        """
+        POST the question to /chatbot and return the requests.Response.
+        Raises requests.RequestException when the server cannot be reached in time.
+        """
+        start = time.perf_counter()
+        try:
+            response = self.session.post(self.server_url + '/chatbot', json={"query": query, "topic": topic}, timeout=self.timeout, **kwargs)
+        except requests.RequestException as e:
+            upstream_errors_total.inc(kind=_error_kind(e))
+            raise
+        finally:
+            upstream_seconds.observe(time.perf_counter() - start, mode='ask')
+        if not response.ok:
+            upstream_errors_total.inc(kind=f'http_{response.status_code}')
+        _default_to_utf8(response)
+        return response
+
+    def stream(self, query, topic):
+        """
+        Yield the answer text as the server sends it. A streaming server replies with chunked
+        text; one that does not replies with the usual JSON, whose answer is yielded as one
+        chunk (nothing is yielded when it has no answer).
+        Raises requests.RequestException on connection errors and HTTP error statuses.
+        """
+        start = time.perf_counter()
+        first_chunk = True
+        try:
+            response = self.session.post(self.server_url + '/chatbot', json={"query": query, "topic": topic, "stream": True}, timeout=self.timeout, stream=True)
+            with response:
+                response.raise_for_status()
+                _default_to_utf8(response)
+                if response.headers.get('Content-Type', '').startswith('application/json'):
+                    answer = response.json().get('answer')
+                    if answer:
+                        upstream_first_chunk_seconds.observe(time.perf_counter() - start)
+                        yield answer
+                    return
+                for chunk in response.iter_content(chunk_size=None, decode_unicode=True):
+                    if chunk:
+                        if first_chunk:
+                            upstream_first_chunk_seconds.observe(time.perf_counter() - start)
+                            first_chunk = False
+                        yield chunk
+        except requests.RequestException as e:
+            upstream_errors_total.inc(kind=_error_kind(e))
+            raise
+        finally:
+            upstream_seconds.observe(time.perf_counter() - start, mode='stream')
+
+    def close(self):
+        self.session.close()
+
+
+def normalise_query(query):
+    # case, surrounding/repeated whitespace and trailing punctuation do not change the question
+    return re.sub(r'\s+', ' ', query).strip().rstrip('?.! ').lower()
+
+
+UNANSWERED_MARKERS = ('so I cannot answer this question from the provided context.', 'The context does not mention any information', 'The context does not')
+NOTE_SUFFIX = '\n\n 📔 Note: Sometimes I am unable to answer the question as I am still learning and improving. Please provide more context or rephrase the question.'
+
+
+def format_answer(answer):
+    # markdown bold is dropped, "*" and "- " bullets become 🔸
+    answer = re.sub(r'\*\*+', "", answer)
+    answer = re.sub(r'\*', "🔸", answer)
+    answer = re.sub(r'-(?=\s)', "🔸", answer)
+    if any(marker in answer for marker in UNANSWERED_MARKERS):
+        answer += NOTE_SUFFIX
+    return answer
+
+
+class StreamingAnswerFormatter:
+    """
+    format_answer applied chunk by chunk, with the same result as on the joined answer.
+    A trailing run of '*' or a trailing '-' is held back until the next chunk shows what follows
+    it; finish() flushes it and adds the Note suffix.
+    """
+
+    def __init__(self):
+        self._stars = ''  # run of '*' at the end of the last chunk
+        self._hyphen = ''  # '-' whose next character is not known yet
+        self.text = ''  # formatted text returned so far
+
+    def _format(self, text, final):
+        # stars first, like format_answer, then bullets on what is left
+        text = self._stars + text
+        self._stars = ''
+        if not final:
+            run = re.search(r'\*+\Z', text)
+            if run:
+                self._stars = run.group()
+                text = text[:run.start()]
+        text = re.sub(r'\*', "🔸", re.sub(r'\*\*+', "", text))
+
+        text = self._hyphen + text
+        self._hyphen = ''
+        if not final and text.endswith('-'):
+            self._hyphen = '-'
+            text = text[:-1]
+        text = re.sub(r'-(?=\s)', "🔸", text)
+        self.text += text
+        return text
+
+    def feed(self, chunk):
+        return self._format(chunk, final=False)
+
+    def finish(self):
+        text = self._format('', final=True)
+        if any(marker in self.text for marker in UNANSWERED_MARKERS):
+            text += NOTE_SUFFIX
+            self.text += NOTE_SUFFIX
+        return text
+
+
+default_client = RAGClient()
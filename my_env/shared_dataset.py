@@ -0,0 +1,112 @@
+"""
+The geochemistry dataset in one memory-mapped segment shared by every gunicorn worker.
+
+The gunicorn master creates the segment once (gunicorn.conf.py, on_starting). The numeric
+columns, the toposheet column as category codes and the arrays of the StatsIndex are written back
+to back into one file under /dev/shm, which is a tmpfs, so the file lives in shared memory. A
+JSON manifest next to it records the offset, dtype and shape of every array. The path reaches the
+workers through NGDR_SHARED_DATASET. A worker maps the file read-only, and its DataFrame columns and
+statistics index are numpy views of the mapping, so all workers read the same physical pages.
+"""
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from stats_index import StatsIndex
+
+
+SEGMENT_ENV = 'NGDR_SHARED_DATASET'
+SEGMENT_DIR = os.getenv('NGDR_SHARED_DATASET_DIR') or ('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir())
+SEGMENT_VERSION = 1
+# every array starts on a cache line
+ALIGNMENT = 64
+
+
+def manifest_path(path):
+    return path + '.json'
+
+
+def _segment_arrays(df, stats):
+    # {name: array} to write, and the frame's columns as (column, kind) in their order
+    arrays = {}
+    columns = []
+    for column in df.columns:
+        values = df[column].to_numpy()
+        if values.dtype.kind in 'biuf':
+            arrays[f'column:{column}'] = np.ascontiguousarray(values)
+            columns.append((column, 'numeric'))
+        else:
+            # text columns (the toposheet) are stored as category codes
+            categories, codes = np.unique(values.astype(str), return_inverse=True)
+            # the narrowest code type, the one pandas uses, so from_codes keeps the shared codes
+            arrays[f'codes:{column}'] = codes.astype(np.min_scalar_type(-len(categories)))
+            arrays[f'categories:{column}'] = categories
+            columns.append((column, 'category'))
+    arrays['stats:toposheets'] = np.array(stats.toposheets, dtype=str)
+    for name, array in stats.arrays().items():
+        arrays[f'stats:{name}'] = np.ascontiguousarray(array)
+    return arrays, columns
+
+
+def create_segment(df, stats, path=None):
+    """
+    Writes df and its StatsIndex to a new segment file and returns its path.
+    """
+    path = path or os.path.join(SEGMENT_DIR, f"ngdr-dataset-{os.getpid()}.bin")
+    arrays, columns = _segment_arrays(df, stats)
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = -(-offset // ALIGNMENT) * ALIGNMENT
+        layout[name] = {'offset': offset, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+        offset += array.nbytes
+
+    # written under a temporary name and renamed, a worker never maps a half written segment
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    segment = np.memmap(tmp_path, dtype=np.uint8, mode='w+', shape=(max(offset, 1),))
+    for name, array in arrays.items():
+        start = layout[name]['offset']
+        segment[start:start + array.nbytes] = np.frombuffer(array.tobytes(), dtype=np.uint8)
+    segment.flush()
+    del segment
+    manifest = {'version': SEGMENT_VERSION, 'rows': len(df), 'bytes': offset, 'columns': columns, 'elements': stats.elements, 'arrays': layout}
+    with open(manifest_path(tmp_path), 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path(tmp_path), manifest_path(path))
+    os.replace(tmp_path, path)
+    return path
+
+
+def attach(path):
+    """
+    (DataFrame, StatsIndex) over read-only views of the segment at path.
+    """
+    import pandas as pd
+    with open(manifest_path(path)) as f:
+        manifest = json.load(f)
+    if manifest.get('version') != SEGMENT_VERSION:
+        raise ValueError(f"Unsupported shared dataset segment version in {path}: {manifest.get('version')}")
+    segment = np.memmap(path, dtype=np.uint8, mode='r')
+    arrays = {name: np.ndarray(tuple(spec['shape']), dtype=np.dtype(spec['dtype']), buffer=segment, offset=spec['offset'])
+              for name, spec in manifest['arrays'].items()}
+
+    frame = {}
+    for column, kind in manifest['columns']:
+        if kind == 'numeric':
+            frame[column] = arrays[f'column:{column}']
+        else:
+            frame[column] = pd.Categorical.from_codes(arrays[f'codes:{column}'], categories=arrays[f'categories:{column}'])
+    df = pd.DataFrame(frame, copy=False)
+    stats = StatsIndex.from_arrays(arrays['stats:toposheets'], manifest['elements'],
+                                   {name[len('stats:'):]: array for name, array in arrays.items() if name.startswith('stats:') and name != 'stats:toposheets'})
+    return df, stats
+
+
+def remove_segment(path):
+    for file_path in (path, manifest_path(path)):
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
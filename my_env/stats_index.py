@@ -0,0 +1,123 @@
+import warnings
+from collections import namedtuple
+
+import numpy as np
+
+
+# argmin/argmax are row positions in the indexed DataFrame (usable with df.iloc)
+ElementStats = namedtuple('ElementStats', ['min', 'max', 'argmin', 'argmax', 'min_lat', 'min_lon', 'max_lat', 'max_lon', 'count', 'mean', 'median'])
+
+# dtype of the [toposheet x element] array kept for every ElementStats field
+FIELD_DTYPES = {
+    'min': np.float64, 'max': np.float64, 'argmin': np.int64, 'argmax': np.int64,
+    'min_lat': np.float64, 'min_lon': np.float64, 'max_lat': np.float64, 'max_lon': np.float64,
+    'count': np.int64, 'mean': np.float64, 'median': np.float64,
+}
+
+
+class StatsIndex:
+    """
+    Per (toposheet, element) summary statistics computed once when the dataset is loaded,
+    so min/max questions are answered with a dictionary lookup instead of scanning the frame.
+
+    Every statistic is held in one [toposheet x element] numpy array, next to the rows of each
+    toposheet (row_order, cut by row_offsets). arrays() exports them and from_arrays() rebuilds
+    the index over existing arrays without copying, e.g. views of the shared dataset segment.
+    """
+
+    def __init__(self, df, elements, toposheet_column='toposheet'):
+        elements = [element for element in elements if element in df.columns]
+        toposheets = df[toposheet_column].to_numpy().astype(str)
+        latitudes = df['latitude'].to_numpy()
+        longitudes = df['longitude'].to_numpy()
+        values = df[elements].to_numpy(dtype=float)
+
+        names = np.unique(toposheets)
+        arrays = {field: np.zeros((len(names), len(elements)), dtype=dtype) for field, dtype in FIELD_DTYPES.items()}
+        row_order = []
+        row_offsets = [0]
+        for position, toposheet in enumerate(names):
+            rows = np.flatnonzero(toposheets == toposheet)
+            row_order.append(rows)
+            row_offsets.append(row_offsets[-1] + len(rows))
+            self._index_toposheet(arrays, position, rows, values[rows], latitudes, longitudes)
+        arrays['row_order'] = np.concatenate(row_order) if row_order else np.empty(0, dtype=np.int64)
+        arrays['row_offsets'] = np.array(row_offsets, dtype=np.int64)
+        self._attach(names, elements, arrays)
+
+    @staticmethod
+    def _index_toposheet(arrays, position, rows, block, latitudes, longitudes):
+        counts = np.count_nonzero(~np.isnan(block), axis=0)
+        # all-NaN columns would warn and make nanargmax raise, their count stays 0 and lookup skips them
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            means = np.nanmean(block, axis=0)
+            medians = np.nanmedian(block, axis=0)
+        argmins = np.argmin(np.where(np.isnan(block), np.inf, block), axis=0)
+        argmaxs = np.argmax(np.where(np.isnan(block), -np.inf, block), axis=0)
+
+        columns = np.arange(block.shape[1])
+        min_rows = rows[argmins]
+        max_rows = rows[argmaxs]
+        arrays['min'][position] = block[argmins, columns]
+        arrays['max'][position] = block[argmaxs, columns]
+        arrays['argmin'][position] = min_rows
+        arrays['argmax'][position] = max_rows
+        arrays['min_lat'][position] = latitudes[min_rows]
+        arrays['min_lon'][position] = longitudes[min_rows]
+        arrays['max_lat'][position] = latitudes[max_rows]
+        arrays['max_lon'][position] = longitudes[max_rows]
+        arrays['count'][position] = counts
+        arrays['mean'][position] = means
+        arrays['median'][position] = medians
+
+    @classmethod
+    def from_arrays(cls, toposheets, elements, arrays):
+        index = cls.__new__(cls)
+        index._attach(np.asarray(toposheets).astype(str), list(elements), arrays)
+        return index
+
+    def _attach(self, toposheets, elements, arrays):
+        self.elements = list(elements)
+        self._toposheet_positions = {str(toposheet): position for position, toposheet in enumerate(toposheets)}
+        self._element_positions = {element: position for position, element in enumerate(self.elements)}
+        self._arrays = arrays
+        self._fields = [arrays[field] for field in ElementStats._fields]
+        self._counts = arrays['count']
+        # ElementStats already asked for, per process; the arrays stay the only full copy
+        self._lookups = {}
+
+    def arrays(self):
+        # {name: array} of the statistics and the toposheet rows, for from_arrays
+        return dict(self._arrays)
+
+    def lookup(self, toposheet, element):
+        # None when the toposheet is unknown or has no measurement for the element
+        key = (toposheet, element)
+        stats = self._lookups.get(key)
+        if stats is None and key not in self._lookups:
+            stats = self._lookups[key] = self._read(toposheet, element)
+        return stats
+
+    def _read(self, toposheet, element):
+        position = self._toposheet_positions.get(toposheet)
+        column = self._element_positions.get(element)
+        if position is None or column is None or self._counts[position, column] == 0:
+            return None
+        values = [array[position, column] for array in self._fields]
+        values[ElementStats._fields.index('count')] = int(values[ElementStats._fields.index('count')])
+        return ElementStats(*values)
+
+    def rows(self, toposheet):
+        position = self._toposheet_positions.get(toposheet)
+        if position is None:
+            return np.empty(0, dtype=np.intp)
+        offsets = self._arrays['row_offsets']
+        return self._arrays['row_order'][offsets[position]:offsets[position + 1]]
+
+    @property
+    def toposheets(self):
+        return list(self._toposheet_positions)
+
+    def __len__(self):
+        return int(np.count_nonzero(self._counts))
@@ -0,0 +1,5 @@
+# the app's modules are imported from the my_env directory, as the benchmarks do
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
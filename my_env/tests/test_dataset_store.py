@@ -0,0 +1,87 @@
+import importlib
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dataset_store
+
+MY_ENV = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOADER = """
+import sys
+sys.path.insert(0, {my_env!r})
+import dataset_store
+df = dataset_store.load_frame({csv!r})
+print(df.shape)
+"""
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'samples.csv'
+    pd.DataFrame({
+        'toposheet': ['55K14', '55K14', '55K15'],
+        'latitude': [21.5, 21.6, 21.7],
+        'longitude': [78.7, 78.8, 78.9],
+        'cu': [38.0, np.nan, 182.0],
+        'geometry': ['POINT (78.7 21.5)', 'POINT (78.8 21.6)', 'POINT (78.9 21.7)'],
+    }).to_csv(path, index=False)
+    return str(path)
+
+
+def test_load_frame_converts_once_and_drops_geometry(csv_path):
+    df = dataset_store.load_frame(csv_path)
+    assert list(df.columns) == ['toposheet', 'latitude', 'longitude', 'cu']
+    assert np.isnan(df['cu'][1])
+    store_dir = dataset_store.default_store_dir(csv_path)
+    version = dataset_store.current_version(store_dir)
+    dataset_store.load_frame(csv_path, columns=['cu', 'missing'])
+    assert dataset_store.current_version(store_dir) == version
+
+
+def test_changed_csv_publishes_a_new_version_and_keeps_the_previous(csv_path):
+    store_dir = dataset_store.ensure_store(csv_path)
+    first = dataset_store.current_version(store_dir)
+    for rows in (4, 5):
+        pd.DataFrame({'toposheet': ['55K14'] * rows, 'cu': range(rows)}).to_csv(csv_path, index=False)
+        assert len(dataset_store.load_frame(csv_path)) == rows
+    versions = dataset_store._versions(store_dir, complete=False)
+    assert len(versions) == 2 and first not in versions
+
+
+def test_store_from_before_versions_is_rebuilt(csv_path):
+    store_dir = dataset_store.default_store_dir(csv_path)
+    os.makedirs(store_dir)
+    with open(os.path.join(store_dir, dataset_store.MANIFEST), 'w') as f:
+        json.dump({'version': dataset_store.STORE_VERSION}, f)
+    assert dataset_store.load_frame(csv_path).shape == (3, 4)
+    assert not os.path.exists(os.path.join(store_dir, dataset_store.MANIFEST))
+
+
+def test_concurrent_loaders_of_a_stale_store(csv_path):
+    # every round the CSV looks changed, and four processes convert and read the store at once
+    loader = LOADER.format(my_env=MY_ENV, csv=csv_path)
+    for _ in range(5):
+        os.utime(csv_path, ns=(os.stat(csv_path).st_atime_ns, os.stat(csv_path).st_mtime_ns + 10 ** 9))
+        processes = [subprocess.Popen([sys.executable, '-c', loader], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True) for _ in range(4)]
+        for process in processes:
+            out, err = process.communicate(timeout=120)
+            assert process.returncode == 0, err
+            assert out.strip() == '(3, 4)'
+    store_dir = dataset_store.default_store_dir(csv_path)
+    assert len(dataset_store._versions(store_dir, complete=False)) <= 2
+
+
+def test_imports_without_fcntl(monkeypatch):
+    # the dev machines run Windows, where fcntl does not exist
+    monkeypatch.setitem(sys.modules, 'fcntl', None)
+    try:
+        assert importlib.reload(dataset_store).conversion_lock
+    finally:
+        monkeypatch.undo()
+        importlib.reload(dataset_store)
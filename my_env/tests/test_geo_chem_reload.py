@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import geo_chem
+import triangulation_cache
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    # a small toposheet with every chemical the statistics index expects
+    rng = np.random.default_rng(0)
+    size = 60
+    frame = pd.DataFrame({
+        'toposheet': ['55K14'] * size,
+        'latitude': 21.5 + rng.random(size) * 0.25,
+        'longitude': 78.5 + rng.random(size) * 0.25,
+    })
+    for column in geo_chem.chemicals.values():
+        frame[column] = rng.random(size) * 100
+    path = tmp_path / 'samples.csv'
+    frame.to_csv(path, index=False)
+
+    monkeypatch.delenv(geo_chem.shared_dataset.SEGMENT_ENV, raising=False)
+    monkeypatch.setattr(geo_chem, 'csv_file_path', str(path))
+    monkeypatch.setattr(geo_chem, '_dataset', None)
+    monkeypatch.setattr(geo_chem, '_dataset_source', None)
+    monkeypatch.setattr(geo_chem, '_next_reload_check', 0.0)
+    monkeypatch.setattr(geo_chem, 'DATASET_RELOAD_CHECK_SECONDS', 0.001)
+    geo_chem.intent_cache.clear()
+    triangulation_cache.clear()
+    yield path
+    triangulation_cache.clear()
+    geo_chem.intent_cache.clear()
+
+
+@pytest.mark.parametrize('method', ['linear', 'cubic'])
+def test_griddata_methods_reuse_the_toposheet_triangulation(dataset, method):
+    df = geo_chem.load_dataset()[0]
+    first = geo_chem.idw_map_for(df, '55K14', 'au', method=method)
+    hits = triangulation_cache.triangulation_cache.stats()['hits']
+    second = geo_chem.idw_map_for(df, '55K14', 'cu', method=method)
+    assert first[1] == second[1] == 'idw_map'
+    assert triangulation_cache.triangulation_cache.stats()['hits'] == hits + 1
+
+
+def test_changed_csv_reloads_the_dataset_and_clears_the_caches(dataset):
+    df = geo_chem.load_dataset()[0]
+    geo_chem._run_work_item(geo_chem.idw_map_for, df, '55K14', 'au')
+    geo_chem.idw_map_for(df, '55K14', 'au', method='linear')
+    assert geo_chem.load_dataset()[0] is df
+
+    frame = pd.read_csv(dataset)
+    frame.to_csv(dataset, index=False, float_format='%.6f')
+    stat = os.stat(dataset)
+    os.utime(dataset, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    reloaded = geo_chem.load_dataset()[0]
+    assert reloaded is not df
+    assert len(reloaded) == len(df)
+    assert geo_chem.intent_cache.stats()['entries'] == 0
+    assert triangulation_cache.triangulation_cache.stats()['entries'] == 0
@@ -0,0 +1,44 @@
+import json
+
+import numpy as np
+import pytest
+
+import map_payload
+
+
+def round_trip(values, dtype):
+    # through JSON, as the payload travels
+    return map_payload.decode_array(json.loads(json.dumps(map_payload.encode_array(values, dtype))))
+
+
+@pytest.mark.parametrize('dtype', ['float32', 'float64'])
+@pytest.mark.parametrize('shape', [(0,), (1,), (7,), (9,), (3, 5), (100, 100), (13, 1)])
+def test_round_trip_keeps_values_nans_and_shape(dtype, shape):
+    rng = np.random.default_rng(sum(shape))
+    values = rng.normal(scale=1e3, size=shape)
+    # NaNs anywhere, including across byte boundaries of the packed mask
+    values[rng.random(shape) < 0.3] = np.nan
+    decoded = round_trip(values, dtype)
+    assert decoded.dtype == np.dtype(dtype)
+    assert decoded.shape == shape
+    np.testing.assert_array_equal(np.isnan(decoded), np.isnan(values))
+    np.testing.assert_array_equal(decoded, values.astype(dtype))
+
+
+def test_all_nan_and_no_nan_arrays():
+    all_nan = round_trip(np.full((3, 3), np.nan), 'float32')
+    assert np.isnan(all_nan).all()
+
+    encoded = map_payload.encode_array(np.arange(6.0).reshape(2, 3))
+    assert encoded['nan_mask'] is None
+    np.testing.assert_array_equal(map_payload.decode_array(encoded), np.arange(6.0).reshape(2, 3))
+
+
+def test_payload_grid_decodes_to_the_interpolated_grid():
+    gridx, gridy = np.linspace(78.5, 78.75, 5), np.linspace(21.5, 21.75, 4)
+    z = np.outer(gridy, gridx)
+    z[0, 0] = np.nan
+    payload = map_payload.build_map_payload('idw_map', gridx, gridy, z, [78.6], [21.6])
+    decoded = map_payload.decode_array(payload['grid']['z'])
+    np.testing.assert_array_equal(decoded, z.astype('float32'))
+    assert payload['grid']['x'] == {'start': 78.5, 'stop': 78.75, 'count': 5}
@@ -0,0 +1,46 @@
+import json
+import os
+
+import metrics
+
+
+def registry_with(requests, in_flight):
+    registry = metrics.Registry()
+    registry.counter('requests_total', "Requests.", ['route']).inc(requests, route='/a')
+    registry.gauge('in_flight', "In flight.").set(in_flight)
+    registry.histogram('latency_seconds', "Latency.", buckets=(0.1, 1.0)).observe(0.5)
+    registry.callback('queue_jobs', "Jobs.", [], lambda: {(): 7}, shared=True)
+    return registry
+
+
+def test_worker_snapshots_are_merged(tmp_path, monkeypatch):
+    monkeypatch.setenv(metrics.METRICS_DIR_ENV, str(tmp_path))
+    with open(tmp_path / '99999.json', 'w') as f:
+        json.dump(registry_with(3, 2).snapshot(), f)
+    text = registry_with(4, 1).render()
+    lines = text.splitlines()
+    assert 'requests_total{route="/a"} 7' in lines
+    assert 'latency_seconds_count 2' in lines
+    assert 'latency_seconds_bucket{le="1.0"} 2' in lines
+    assert 'in_flight{worker="99999"} 2' in lines
+    assert f'in_flight{{worker="{os.getpid()}"}} 1' in lines
+    # shared metrics are rendered once, from the scraped process
+    assert lines.count('queue_jobs 7') == 1
+
+
+def test_exited_worker_keeps_its_counters_only(tmp_path, monkeypatch):
+    monkeypatch.setenv(metrics.METRICS_DIR_ENV, str(tmp_path))
+    with open(tmp_path / '99999.json', 'w') as f:
+        json.dump(registry_with(3, 2).snapshot(), f)
+    metrics.mark_process_dead(99999)
+    lines = registry_with(4, 1).render().splitlines()
+    assert 'requests_total{route="/a"} 7' in lines
+    assert not any('worker="99999"' in line for line in lines)
+
+
+def test_single_process_exposition_is_unchanged(monkeypatch):
+    monkeypatch.delenv(metrics.METRICS_DIR_ENV, raising=False)
+    lines = registry_with(4, 1).render().splitlines()
+    assert 'requests_total{route="/a"} 4' in lines
+    assert 'in_flight 1' in lines
+    assert 'queue_jobs 7' in lines
@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+import rag_client
+
+# the pieces format_answer rewrites, mixed with plain text and an unanswered marker
+PIECES = ['*', '**', '***', '-', '- ', ' -', ' ', '\n', 'a', 'gold', 'x-y', '🔸', rag_client.UNANSWERED_MARKERS[0], 'The context does not']
+
+
+def stream(text, cuts):
+    formatter = rag_client.StreamingAnswerFormatter()
+    bounds = [0] + cuts + [len(text)]
+    streamed = ''.join(formatter.feed(text[start:stop]) for start, stop in zip(bounds, bounds[1:]))
+    streamed += formatter.finish()
+    assert formatter.text == streamed
+    return streamed
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_any_chunk_split_formats_like_the_joined_answer(seed):
+    rng = random.Random(seed)
+    for _ in range(5000):
+        text = ''.join(rng.choice(PIECES) for _ in range(rng.randint(0, 12)))
+        cuts = sorted(rng.sample(range(len(text) + 1), rng.randint(0, min(len(text) + 1, 6))))
+        assert stream(text, cuts) == rag_client.format_answer(text), (text, cuts)
+
+
+def test_one_character_chunks():
+    text = "**Gold** occurs:\n* near Nagpur\n- in 55K14 -rich zones\n***"
+    assert stream(text, list(range(1, len(text)))) == rag_client.format_answer(text)
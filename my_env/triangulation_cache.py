@@ -0,0 +1,79 @@
+"""
+Per-toposheet Delaunay triangulations for the griddata style (linear / cubic) maps.
+
+The triangulation, the simplex of every grid node, its barycentric weights and the mask of
+nodes outside the convex hull only depend on the sample coordinates, so they are computed
+once per toposheet and grid. Interpolating another element on the same sheet is then a
+gather and a weighted sum for 'linear', and skips the triangulation for 'cubic'.
+"""
+import numpy as np
+from scipy.interpolate import CloughTocher2DInterpolator
+from scipy.spatial import Delaunay
+
+from caches import LRUCache
+
+
+class ToposheetTriangulation:
+
+    def __init__(self, x, y, gridx, gridy):
+        self.gridx = np.asarray(gridx, dtype=float)
+        self.gridy = np.asarray(gridy, dtype=float)
+        self.triangulation = Delaunay(np.column_stack((np.asarray(x, dtype=float), np.asarray(y, dtype=float))))
+
+        grid_x, grid_y = np.meshgrid(self.gridx, self.gridy)
+        self.shape = grid_x.shape
+        self.nodes = np.column_stack((grid_x.ravel(), grid_y.ravel()))
+        simplex = self.triangulation.find_simplex(self.nodes)
+        self.outside = simplex < 0
+
+        # barycentric coordinates of every node inside the hull, as in scipy's LinearNDInterpolator
+        transform = self.triangulation.transform[simplex]
+        partial = np.einsum('ijk,ik->ij', transform[:, :2], self.nodes - transform[:, 2])
+        self.weights = np.column_stack((partial, 1.0 - partial.sum(axis=1)))
+        self.vertices = self.triangulation.simplices[simplex]
+        self.weights[self.outside] = 0.0
+        self.vertices[self.outside] = 0
+
+    @property
+    def nbytes(self):
+        return self.nodes.nbytes + self.weights.nbytes + self.vertices.nbytes + self.outside.nbytes + self.triangulation.simplices.nbytes * 4
+
+    def linear(self, values):
+        # same result as griddata(..., method='linear') for these samples and grid
+        values = np.asarray(values, dtype=float)
+        z = np.sum(values[self.vertices] * self.weights, axis=1)
+        z[self.outside] = np.nan
+        return z.reshape(self.shape)
+
+    def cubic(self, values):
+        # same result as griddata(..., method='cubic'), reusing the cached triangulation
+        interpolator = CloughTocher2DInterpolator(self.triangulation, np.asarray(values, dtype=float))
+        return interpolator(self.nodes).reshape(self.shape)
+
+    def interpolate(self, values, method='linear'):
+        if method == 'linear':
+            return self.linear(values)
+        if method == 'cubic':
+            return self.cubic(values)
+        raise ValueError(f"Unknown griddata method: {method}")
+
+
+# keyed by (toposheet, grid_resolution), cleared by geo_chem.reload_dataset
+triangulation_cache = LRUCache(max_bytes=64 * 1024 * 1024, sizeof=lambda triangulation: triangulation.nbytes)
+
+
+def get_triangulation(toposheet, x, y, grid_resolution=100):
+    key = (toposheet, grid_resolution)
+    triangulation = triangulation_cache.get(key)
+    if triangulation is None:
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        gridx = np.linspace(x.min(), x.max(), grid_resolution)
+        gridy = np.linspace(y.min(), y.max(), grid_resolution)
+        triangulation = ToposheetTriangulation(x, y, gridx, gridy)
+        triangulation_cache.put(key, triangulation)
+    return triangulation
+
+
+def clear():
+    triangulation_cache.clear()
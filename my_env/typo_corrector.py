@@ -0,0 +1,141 @@
+"""
+Typo correction for geochemistry queries over the domain vocabulary.
+
+A SymSpell style index: every vocabulary term is stored under all strings obtained by deleting
+up to max_edit_distance characters from it. A query word looks up its own deletes, and the few
+terms that share one are checked with an optimal string alignment (Damerau-Levenshtein)
+distance. Lookup cost depends on the length of the word, not on the size of the vocabulary.
+
+Words shorter than min_length and words with digits (formulas like al2o3, toposheet numbers)
+are never corrected; toposheet numbers are upper-cased to the form used in the data. Short
+English words sit one edit away from element names (read/head/load -> lead, sold/fold -> gold),
+so four letter words are left alone and words under eight letters get a single edit.
+"""
+import functools
+import re
+
+
+def osa_distance(a, b, max_distance):
+    # optimal string alignment distance, or max_distance + 1 once it is known to be larger
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > max_distance:
+            return max_distance + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _deletes(word, max_distance):
+    # every string obtained by deleting up to max_distance characters, the word included
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier for i in range(len(candidate))} - found
+        found |= frontier
+    return found
+
+
+class SymSpellIndex:
+
+    def __init__(self, max_edit_distance=2):
+        self.max_edit_distance = max_edit_distance
+        self._terms = {}  # term -> rank, lower ranks win ties
+        self._deletes = {}  # delete -> terms
+
+    def add(self, term):
+        if term in self._terms:
+            return
+        self._terms[term] = len(self._terms)
+        for delete in _deletes(term, self.max_edit_distance):
+            self._deletes.setdefault(delete, []).append(term)
+
+    def __contains__(self, term):
+        return term in self._terms
+
+    def __len__(self):
+        return len(self._terms)
+
+    def lookup(self, word, max_distance=None):
+        """
+        Closest term within max_distance as (term, distance), or None.
+        Ties go to the term added first.
+        """
+        max_distance = self.max_edit_distance if max_distance is None else min(max_distance, self.max_edit_distance)
+        if word in self._terms:
+            return word, 0
+        best = None
+        checked = set()
+        for delete in _deletes(word, max_distance):
+            for term in self._deletes.get(delete, ()):
+                if term in checked:
+                    continue
+                checked.add(term)
+                distance = osa_distance(word, term, max_distance)
+                if distance > max_distance:
+                    continue
+                if best is None or (distance, self._terms[term]) < (best[1], self._terms[best[0]]):
+                    best = (term, distance)
+        return best
+
+
+# everyday words of the queries that sit one edit away from a vocabulary term ("there" -> where)
+COMMON_WORDS = ["what", "which", "where", "show", "tell", "give", "find", "with", "from", "that", "this", "have", "value", "values", "number",
+                "create", "display", "produce", "describe", "also", "about", "cold", "hold", "bold", "told", "mining", "mines", "mine",
+                "mineral", "minerals", "area", "areas", "sheet", "sheets", "point", "points", "location", "map", "maps", "plot", "highest",
+                "lowest", "average", "mean", "median", "above", "below", "between", "than", "greater", "less", "please", "ions", "there", "these",
+                "those", "three", "fluorite", "trioxide"]
+
+TOPOSHEET_PATTERN = re.compile(r'^\d+[a-zA-Z]+\d+$')
+WORD_PATTERN = re.compile(r'^(\W*)(.*?)(\W*)$')
+
+
+class TypoCorrector:
+
+    def __init__(self, vocabulary, protected_words=COMMON_WORDS, min_length=5, max_edit_distance=2):
+        """
+        vocabulary: terms words are corrected to, multi-word entries are split into words.
+        protected_words: everyday query words that are kept as they are.
+        """
+        self.min_length = min_length
+        self.index = SymSpellIndex(max_edit_distance)
+        for entry in vocabulary:
+            for word in re.findall(r'[a-z]+', entry.lower()):
+                if len(word) >= min_length:
+                    self.index.add(word)
+        # protected words are kept as they are and are correction targets too ("vale" -> value)
+        self.protected = {word.lower() for word in protected_words}
+        for word in protected_words:
+            if len(word) >= min_length:
+                self.index.add(word.lower())
+        self.correct_word = functools.lru_cache(maxsize=4096)(self._correct_word)
+
+    def max_distance(self, word):
+        # one edit below eight letters (two turn medium into sodium), two for longer words
+        return 1 if len(word) < 8 else 2
+
+    def _correct_word(self, token):
+        prefix, word, suffix = WORD_PATTERN.match(token).groups()
+        if TOPOSHEET_PATTERN.match(word):
+            return prefix + word.upper() + suffix
+        lower = word.lower()
+        if len(lower) < self.min_length or not lower.isalpha() or lower in self.protected or lower in self.index:
+            return token
+        match = self.index.lookup(lower, self.max_distance(lower))
+        if match is None:
+            return token
+        return prefix + match[0] + suffix
+
+    def correct(self, text):
+        return ' '.join(self.correct_word(token) for token in text.split())